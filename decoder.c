@@ -22,6 +22,7 @@
 #include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
 #include <glib.h>
+#include <glib/gstdio.h>
 
 /**
  * @file
@@ -42,6 +43,17 @@
 /* The list of loaded protocol decoders. */
 static GSList *pd_list = NULL;
 
+/*
+ * Cached metadata of the protocol decoders, such that they need not be
+ * imported just to list them. There is one group per module, plus one
+ * group which holds the version of the file format.
+ */
+static GKeyFile *pd_cache = NULL;
+static gboolean pd_cache_dirty = FALSE;
+
+#define CACHE_GROUP	"libsigrokdecode"
+#define CACHE_FORMAT	1
+
 /* srd.c */
 extern SRD_PRIV GSList *searchpaths;
 
@@ -176,6 +188,7 @@ static void decoder_free(struct srd_decoder *dec)
 	g_free(dec->longname);
 	g_free(dec->name);
 	g_free(dec->id);
+	g_free(dec->module_name);
 
 	g_free(dec);
 }
@@ -664,41 +677,586 @@ SRD_PRIV long srd_decoder_apiver(const struct srd_decoder *d)
 	return apiver;
 }
 
-/**
- * Load a protocol decoder module into the embedded Python interpreter.
- *
- * @param module_name The module name to be loaded.
- *
- * @return SRD_OK upon success, a (negative) error code otherwise.
- *
- * @since 0.1.0
+/* Path of the metadata cache file, or NULL if caching is disabled. */
+static char *cache_filename(void)
+{
+	const char *dir;
+
+	/* An empty SIGROKDECODE_CACHE_DIR disables the cache. */
+	if ((dir = g_getenv("SIGROKDECODE_CACHE_DIR"))) {
+		if (!*dir)
+			return NULL;
+		return g_build_filename(dir, "decoders.cache", NULL);
+	}
+
+	return g_build_filename(g_get_user_cache_dir(), "libsigrokdecode",
+			"decoders.cache", NULL);
+}
+
+static GKeyFile *cache_get(void)
+{
+	char *filename;
+
+	if (pd_cache)
+		return pd_cache;
+
+	if (!(filename = cache_filename()))
+		return NULL;
+
+	pd_cache = g_key_file_new();
+	if (g_key_file_load_from_file(pd_cache, filename,
+			G_KEY_FILE_NONE, NULL)) {
+		srd_dbg("Using decoder metadata cache %s.", filename);
+		if (g_key_file_get_integer(pd_cache, CACHE_GROUP,
+				"format", NULL) != CACHE_FORMAT) {
+			/* Written by another version, start afresh. */
+			g_key_file_free(pd_cache);
+			pd_cache = g_key_file_new();
+		}
+	}
+	g_free(filename);
+
+	return pd_cache;
+}
+
+static void cache_save(void)
+{
+	char *filename, *dirname, *data;
+	gsize len;
+	GError *error;
+
+	if (!pd_cache || !pd_cache_dirty)
+		return;
+
+	if (!(filename = cache_filename()))
+		return;
+
+	g_key_file_set_integer(pd_cache, CACHE_GROUP, "format", CACHE_FORMAT);
+	data = g_key_file_to_data(pd_cache, &len, NULL);
+	dirname = g_path_get_dirname(filename);
+
+	/* The file is replaced atomically, so readers never see half of it. */
+	error = NULL;
+	if (g_mkdir_with_parents(dirname, 0755) < 0) {
+		srd_dbg("Failed to create cache directory %s.", dirname);
+	} else if (!g_file_set_contents(filename, data, len, &error)) {
+		srd_dbg("Failed to write decoder metadata cache: %s.",
+			error->message);
+		g_error_free(error);
+	}
+	pd_cache_dirty = FALSE;
+
+	g_free(dirname);
+	g_free(data);
+	g_free(filename);
+}
+
+/*
+ * Find the directory of a decoder module, in the same order in which
+ * Python searches sys.path for it.
  */
-SRD_API int srd_decoder_load(const char *module_name)
+static char *module_dir(const char *module_name)
 {
-	PyObject *py_basedec;
-	struct srd_decoder *d;
-	long apiver;
-	int is_subclass;
-	const char *fail_txt;
-	PyGILState_STATE gstate;
+	GSList *l;
+	char *dir;
 
-	if (!srd_check_init())
+	if (!*module_name || strchr(module_name, G_DIR_SEPARATOR))
+		return NULL;
+
+	for (l = searchpaths; l; l = l->next) {
+		dir = g_build_filename(l->data, module_name, NULL);
+		if (g_file_test(dir, G_FILE_TEST_IS_DIR))
+			return dir;
+		g_free(dir);
+	}
+
+	return NULL;
+}
+
+/*
+ * Summarize the files of a decoder module (their number, total size and
+ * latest modification time), such that cache entries can be validated.
+ */
+static char *module_stamp(const char *dir)
+{
+	GDir *gdir;
+	GStatBuf st;
+	const char *name;
+	char *path;
+	gint64 mtime, size;
+	unsigned int count;
+
+	if (!(gdir = g_dir_open(dir, 0, NULL)))
+		return NULL;
+
+	count = 0;
+	mtime = size = 0;
+	while ((name = g_dir_read_name(gdir))) {
+		/* Skips subdirectories such as __pycache__. */
+		path = g_build_filename(dir, name, NULL);
+		if (g_stat(path, &st) == 0 && S_ISREG(st.st_mode)) {
+			count++;
+			size += st.st_size;
+			mtime = MAX(mtime, (gint64)st.st_mtime);
+		}
+		g_free(path);
+	}
+	g_dir_close(gdir);
+
+	return g_strdup_printf("%u:%" G_GINT64_FORMAT ":%" G_GINT64_FORMAT,
+			count, size, mtime);
+}
+
+static void cache_set_strv(GKeyFile *kf, const char *group, const char *key,
+		char **strv)
+{
+	g_key_file_set_string_list(kf, group, key,
+			(const gchar * const *)strv, g_strv_length(strv));
+}
+
+static void cache_set_strlist(GKeyFile *kf, const char *group,
+		const char *key, const GSList *list)
+{
+	const char **strv;
+	unsigned int i;
+
+	strv = g_malloc(sizeof(char *) * (g_slist_length((GSList *)list) + 1));
+	for (i = 0; list; list = list->next)
+		strv[i++] = list->data;
+	strv[i] = NULL;
+	cache_set_strv(kf, group, key, (char **)strv);
+	g_free(strv);
+}
+
+static void cache_set_channels(GKeyFile *kf, const char *group,
+		const char *prefix, const GSList *channels)
+{
+	const struct srd_channel *pdch;
+	char *key, *strv[4];
+	int i;
+
+	for (i = 0; channels; channels = channels->next, i++) {
+		pdch = channels->data;
+		strv[0] = pdch->id;
+		strv[1] = pdch->name;
+		strv[2] = pdch->desc;
+		strv[3] = NULL;
+		key = g_strdup_printf("%s.%d", prefix, i);
+		cache_set_strv(kf, group, key, strv);
+		g_free(key);
+	}
+}
+
+static void cache_set_options(GKeyFile *kf, const char *group,
+		const GSList *options)
+{
+	const struct srd_decoder_option *o;
+	const GSList *l;
+	char *key, *text, **strv;
+	int i, j;
+
+	for (i = 0; options; options = options->next, i++) {
+		o = options->data;
+		key = g_strdup_printf("option.%d.id", i);
+		g_key_file_set_string(kf, group, key, o->id);
+		g_free(key);
+		if (o->desc) {
+			key = g_strdup_printf("option.%d.desc", i);
+			g_key_file_set_string(kf, group, key, o->desc);
+			g_free(key);
+		}
+		if (o->def) {
+			key = g_strdup_printf("option.%d.default", i);
+			text = g_variant_print(o->def, TRUE);
+			g_key_file_set_string(kf, group, key, text);
+			g_free(text);
+			g_free(key);
+		}
+		if (o->values) {
+			key = g_strdup_printf("option.%d.values", i);
+			strv = g_malloc0(sizeof(char *) *
+					(g_slist_length(o->values) + 1));
+			for (j = 0, l = o->values; l; l = l->next)
+				strv[j++] = g_variant_print(l->data, TRUE);
+			cache_set_strv(kf, group, key, strv);
+			g_strfreev(strv);
+			g_free(key);
+		}
+	}
+}
+
+static void cache_set_strv_list(GKeyFile *kf, const char *group,
+		const char *prefix, const GSList *list)
+{
+	char *key;
+	int i;
+
+	for (i = 0; list; list = list->next, i++) {
+		key = g_strdup_printf("%s.%d", prefix, i);
+		cache_set_strv(kf, group, key, list->data);
+		g_free(key);
+	}
+}
+
+static void cache_set_annotation_rows(GKeyFile *kf, const char *group,
+		const GSList *rows)
+{
+	const struct srd_decoder_annotation_row *row;
+	const GSList *l;
+	char *key, *strv[3];
+	gint *classes;
+	gsize num_classes;
+	int i;
+
+	for (i = 0; rows; rows = rows->next, i++) {
+		row = rows->data;
+		strv[0] = row->id;
+		strv[1] = row->desc;
+		strv[2] = NULL;
+		key = g_strdup_printf("row.%d", i);
+		cache_set_strv(kf, group, key, strv);
+		g_free(key);
+
+		num_classes = g_slist_length(row->ann_classes);
+		if (!num_classes)
+			continue;
+		classes = g_malloc(sizeof(gint) * num_classes);
+		num_classes = 0;
+		for (l = row->ann_classes; l; l = l->next)
+			classes[num_classes++] = GPOINTER_TO_INT(l->data);
+		key = g_strdup_printf("row.%d.classes", i);
+		g_key_file_set_integer_list(kf, group, key, classes,
+				num_classes);
+		g_free(key);
+		g_free(classes);
+	}
+}
+
+/*
+ * Record the metadata of a decoder module in the cache. A NULL decoder
+ * records that the module is not a protocol decoder (e.g. "common").
+ */
+static void cache_store(const char *module_name, const struct srd_decoder *d,
+		const char *dir, const char *stamp)
+{
+	GKeyFile *kf;
+
+	if (!(kf = cache_get()))
+		return;
+
+	g_key_file_remove_group(kf, module_name, NULL);
+	g_key_file_set_string(kf, module_name, "path", dir);
+	g_key_file_set_string(kf, module_name, "stamp", stamp);
+	pd_cache_dirty = TRUE;
+
+	if (!d) {
+		g_key_file_set_boolean(kf, module_name, "decoder", FALSE);
+		return;
+	}
+
+	g_key_file_set_string(kf, module_name, "id", d->id);
+	g_key_file_set_string(kf, module_name, "name", d->name);
+	g_key_file_set_string(kf, module_name, "longname", d->longname);
+	g_key_file_set_string(kf, module_name, "desc", d->desc);
+	g_key_file_set_string(kf, module_name, "license", d->license);
+	cache_set_strlist(kf, module_name, "inputs", d->inputs);
+	cache_set_strlist(kf, module_name, "outputs", d->outputs);
+	cache_set_channels(kf, module_name, "channel", d->channels);
+	cache_set_channels(kf, module_name, "optional_channel",
+			d->opt_channels);
+	cache_set_options(kf, module_name, d->options);
+	cache_set_strv_list(kf, module_name, "annotation", d->annotations);
+	cache_set_annotation_rows(kf, module_name, d->annotation_rows);
+	cache_set_strv_list(kf, module_name, "binary", d->binary);
+}
+
+static int cache_get_str(GKeyFile *kf, const char *group, const char *key,
+		char **out)
+{
+	return (*out = g_key_file_get_string(kf, group, key, NULL))
+			? SRD_OK : SRD_ERR;
+}
+
+static int cache_get_strlist(GKeyFile *kf, const char *group,
+		const char *key, GSList **out)
+{
+	char **strv;
+	gsize i, len;
+
+	if (!(strv = g_key_file_get_string_list(kf, group, key, &len, NULL)))
 		return SRD_ERR;
 
-	if (!module_name)
-		return SRD_ERR_ARG;
+	*out = NULL;
+	for (i = len; i > 0; i--)
+		*out = g_slist_prepend(*out, strv[i - 1]);
+	/* The list took over the strings. */
+	g_free(strv);
 
-	gstate = PyGILState_Ensure();
+	return SRD_OK;
+}
 
-	if (PyDict_GetItemString(PyImport_GetModuleDict(), module_name)) {
-		/* Module was already imported. */
-		PyGILState_Release(gstate);
-		return SRD_OK;
+static GVariant *cache_get_variant(const char *text)
+{
+	GVariant *gvar;
+
+	if (!(gvar = g_variant_parse(NULL, text, NULL, NULL, NULL)))
+		return NULL;
+
+	return g_variant_ref_sink(gvar);
+}
+
+static int cache_get_channels(GKeyFile *kf, const char *group,
+		const char *prefix, GSList **out, int offset)
+{
+	struct srd_channel *pdch;
+	GSList *pdchl;
+	char *key, **strv;
+	gsize len;
+	int i;
+
+	pdchl = NULL;
+	for (i = 0; ; i++) {
+		key = g_strdup_printf("%s.%d", prefix, i);
+		strv = g_key_file_get_string_list(kf, group, key, &len, NULL);
+		g_free(key);
+		if (!strv)
+			break;
+		if (len != 3) {
+			g_strfreev(strv);
+			g_slist_free_full(pdchl, &channel_free);
+			return SRD_ERR;
+		}
+		pdch = g_malloc0(sizeof(struct srd_channel));
+		pdch->id = strv[0];
+		pdch->name = strv[1];
+		pdch->desc = strv[2];
+		pdch->order = offset + i;
+		g_free(strv);
+		pdchl = g_slist_append(pdchl, pdch);
 	}
+	*out = pdchl;
 
-	srd_dbg("Loading protocol decoder '%s'.", module_name);
+	return SRD_OK;
+}
+
+static int cache_get_options(GKeyFile *kf, const char *group, GSList **out)
+{
+	struct srd_decoder_option *o;
+	GSList *options;
+	GVariant *gvar;
+	char *key, *text, **strv;
+	gsize i, len;
+	int opt;
+
+	options = NULL;
+	for (opt = 0; ; opt++) {
+		key = g_strdup_printf("option.%d.id", opt);
+		text = g_key_file_get_string(kf, group, key, NULL);
+		g_free(key);
+		if (!text)
+			break;
+		o = g_malloc0(sizeof(struct srd_decoder_option));
+		o->id = text;
+		options = g_slist_append(options, o);
+
+		key = g_strdup_printf("option.%d.desc", opt);
+		o->desc = g_key_file_get_string(kf, group, key, NULL);
+		g_free(key);
+
+		key = g_strdup_printf("option.%d.default", opt);
+		text = g_key_file_get_string(kf, group, key, NULL);
+		g_free(key);
+		if (text) {
+			o->def = cache_get_variant(text);
+			g_free(text);
+			if (!o->def)
+				goto err_out;
+		}
+
+		key = g_strdup_printf("option.%d.values", opt);
+		strv = g_key_file_get_string_list(kf, group, key, &len, NULL);
+		g_free(key);
+		if (!strv)
+			continue;
+		for (i = 0; i < len; i++) {
+			if (!(gvar = cache_get_variant(strv[i]))) {
+				g_strfreev(strv);
+				goto err_out;
+			}
+			o->values = g_slist_append(o->values, gvar);
+		}
+		g_strfreev(strv);
+	}
+	*out = options;
+
+	return SRD_OK;
+
+err_out:
+	g_slist_free_full(options, &decoder_option_free);
+
+	return SRD_ERR;
+}
+
+static int cache_get_strv_list(GKeyFile *kf, const char *group,
+		const char *prefix, gsize strv_len, GSList **out)
+{
+	GSList *list;
+	char *key, **strv;
+	gsize len;
+	int i;
+
+	list = NULL;
+	for (i = 0; ; i++) {
+		key = g_strdup_printf("%s.%d", prefix, i);
+		strv = g_key_file_get_string_list(kf, group, key, &len, NULL);
+		g_free(key);
+		if (!strv)
+			break;
+		if (len != strv_len) {
+			g_strfreev(strv);
+			g_slist_free_full(list, (GDestroyNotify)&g_strfreev);
+			return SRD_ERR;
+		}
+		list = g_slist_append(list, strv);
+	}
+	*out = list;
+
+	return SRD_OK;
+}
+
+static int cache_get_annotation_rows(GKeyFile *kf, const char *group,
+		GSList **out)
+{
+	struct srd_decoder_annotation_row *row;
+	GSList *rows;
+	char *key, **strv;
+	gint *classes;
+	gsize k, len;
+	int i;
+
+	rows = NULL;
+	for (i = 0; ; i++) {
+		key = g_strdup_printf("row.%d", i);
+		strv = g_key_file_get_string_list(kf, group, key, &len, NULL);
+		g_free(key);
+		if (!strv)
+			break;
+		if (len != 2) {
+			g_strfreev(strv);
+			g_slist_free_full(rows, &annotation_row_free);
+			return SRD_ERR;
+		}
+		row = g_malloc0(sizeof(struct srd_decoder_annotation_row));
+		row->id = strv[0];
+		row->desc = strv[1];
+		g_free(strv);
+		rows = g_slist_append(rows, row);
+
+		key = g_strdup_printf("row.%d.classes", i);
+		classes = g_key_file_get_integer_list(kf, group, key, &len,
+				NULL);
+		g_free(key);
+		for (k = 0; classes && k < len; k++)
+			row->ann_classes = g_slist_append(row->ann_classes,
+					GINT_TO_POINTER(classes[k]));
+		g_free(classes);
+	}
+	*out = rows;
+
+	return SRD_OK;
+}
+
+/*
+ * Create a decoder from the cached metadata, if the cache entry for the
+ * module is still valid. If the module is known not to be a decoder,
+ * 'not_pd' is set.
+ */
+static struct srd_decoder *cache_lookup(const char *module_name,
+		const char *dir, const char *stamp, gboolean *not_pd)
+{
+	GKeyFile *kf;
+	struct srd_decoder *d;
+	char *text;
+	gboolean valid;
+
+	*not_pd = FALSE;
+
+	if (!(kf = cache_get()) || !g_key_file_has_group(kf, module_name))
+		return NULL;
+
+	text = g_key_file_get_string(kf, module_name, "path", NULL);
+	valid = text && !strcmp(text, dir);
+	g_free(text);
+	text = g_key_file_get_string(kf, module_name, "stamp", NULL);
+	valid = valid && text && !strcmp(text, stamp);
+	g_free(text);
+	if (!valid)
+		return NULL;
+
+	if (g_key_file_has_key(kf, module_name, "decoder", NULL) &&
+	    !g_key_file_get_boolean(kf, module_name, "decoder", NULL)) {
+		*not_pd = TRUE;
+		return NULL;
+	}
 
 	d = g_malloc0(sizeof(struct srd_decoder));
+	d->module_name = g_strdup(module_name);
+
+	if (cache_get_str(kf, module_name, "id", &d->id) != SRD_OK ||
+	    cache_get_str(kf, module_name, "name", &d->name) != SRD_OK ||
+	    cache_get_str(kf, module_name, "longname", &d->longname) != SRD_OK ||
+	    cache_get_str(kf, module_name, "desc", &d->desc) != SRD_OK ||
+	    cache_get_str(kf, module_name, "license", &d->license) != SRD_OK ||
+	    cache_get_strlist(kf, module_name, "inputs", &d->inputs) != SRD_OK ||
+	    cache_get_strlist(kf, module_name, "outputs", &d->outputs) != SRD_OK)
+		goto err_out;
+
+	if (cache_get_options(kf, module_name, &d->options) != SRD_OK)
+		goto err_out;
+	if (cache_get_channels(kf, module_name, "channel",
+			&d->channels, 0) != SRD_OK)
+		goto err_out;
+	if (cache_get_channels(kf, module_name, "optional_channel",
+			&d->opt_channels, g_slist_length(d->channels)) != SRD_OK)
+		goto err_out;
+	if (cache_get_strv_list(kf, module_name, "annotation", 2,
+			&d->annotations) != SRD_OK)
+		goto err_out;
+	if (cache_get_annotation_rows(kf, module_name,
+			&d->annotation_rows) != SRD_OK)
+		goto err_out;
+	if (cache_get_strv_list(kf, module_name, "binary", 2,
+			&d->binary) != SRD_OK)
+		goto err_out;
+
+	return d;
+
+err_out:
+	srd_dbg("Invalid cache entry for decoder %s.", module_name);
+	decoder_free(d);
+
+	return NULL;
+}
+
+/*
+ * Import the decoder's Python module and check its Decoder class. If
+ * 'not_pd' is not NULL, it is set when the module has no Decoder class.
+ */
+static int decoder_import(struct srd_decoder *d, gboolean *not_pd)
+{
+	PyObject *py_basedec;
+	const char *module_name;
+	long apiver;
+	int is_subclass;
+	const char *fail_txt;
+	PyGILState_STATE gstate;
+
+	module_name = d->module_name;
+	if (not_pd)
+		*not_pd = FALSE;
+
+	gstate = PyGILState_Ensure();
+
 	fail_txt = NULL;
 
 	d->py_mod = py_import_by_name(module_name);
@@ -716,6 +1274,8 @@ SRD_API int srd_decoder_load(const char *module_name)
 	/* Get the 'Decoder' class as Python object. */
 	d->py_dec = PyObject_GetAttrString(d->py_mod, "Decoder");
 	if (!d->py_dec) {
+		if (not_pd)
+			*not_pd = TRUE;
 		fail_txt = "no 'Decoder' attribute in imported module";
 		goto except_out;
 	}
@@ -760,6 +1320,37 @@ SRD_API int srd_decoder_load(const char *module_name)
 		goto err_out;
 	}
 
+	PyGILState_Release(gstate);
+
+	return SRD_OK;
+
+except_out:
+	/* Don't show a message for the "common" directory, it's not a PD. */
+	if (strcmp(module_name, "common")) {
+		srd_exception_catch("Failed to load decoder %s: %s",
+				    module_name, fail_txt);
+	}
+	fail_txt = NULL;
+err_out:
+	if (fail_txt)
+		srd_err("Failed to load decoder %s: %s", module_name, fail_txt);
+	Py_XDECREF(d->py_dec);
+	Py_XDECREF(d->py_mod);
+	d->py_dec = d->py_mod = NULL;
+	PyErr_Clear();
+	PyGILState_Release(gstate);
+
+	return SRD_ERR_PYTHON;
+}
+
+/* Get the metadata of an imported decoder from its Decoder class. */
+static int decoder_get_metadata(struct srd_decoder *d)
+{
+	const char *fail_txt;
+	PyGILState_STATE gstate;
+
+	gstate = PyGILState_Ensure();
+
 	/* Store required fields in newly allocated strings. */
 	if (py_attr_as_str(d->py_dec, "id", &(d->id)) != SRD_OK) {
 		fail_txt = "no 'id' attribute";
@@ -832,27 +1423,134 @@ SRD_API int srd_decoder_load(const char *module_name)
 
 	PyGILState_Release(gstate);
 
-	/* Append it to the list of loaded decoders. */
-	pd_list = g_slist_append(pd_list, d);
-
 	return SRD_OK;
 
-except_out:
-	/* Don't show a message for the "common" directory, it's not a PD. */
-	if (strcmp(module_name, "common")) {
-		srd_exception_catch("Failed to load decoder %s: %s",
-				    module_name, fail_txt);
-	}
-	fail_txt = NULL;
 err_out:
-	if (fail_txt)
-		srd_err("Failed to load decoder %s: %s", module_name, fail_txt);
-	decoder_free(d);
+	srd_err("Failed to load decoder %s: %s", d->module_name, fail_txt);
 	PyGILState_Release(gstate);
 
 	return SRD_ERR_PYTHON;
 }
 
+static int decoder_load(const char *module_name)
+{
+	struct srd_decoder *d;
+	GSList *l;
+	char *dir, *stamp;
+	gboolean not_pd, imported;
+	int ret;
+	PyGILState_STATE gstate;
+
+	for (l = pd_list; l; l = l->next) {
+		d = l->data;
+		if (!strcmp(d->module_name, module_name))
+			return SRD_OK;
+	}
+
+	gstate = PyGILState_Ensure();
+	imported = PyDict_GetItemString(PyImport_GetModuleDict(),
+			module_name) != NULL;
+	PyGILState_Release(gstate);
+	if (imported) {
+		/* Module was already imported. */
+		return SRD_OK;
+	}
+
+	/* Modules in zip files can't be validated, they aren't cached. */
+	dir = module_dir(module_name);
+	stamp = dir ? module_stamp(dir) : NULL;
+
+	if (stamp && (d = cache_lookup(module_name, dir, stamp, &not_pd))) {
+		srd_dbg("Loading protocol decoder '%s' from cache.",
+			module_name);
+		pd_list = g_slist_append(pd_list, d);
+		ret = SRD_OK;
+		goto out;
+	}
+	if (stamp && not_pd) {
+		if (strcmp(module_name, "common"))
+			srd_err("Failed to load decoder %s: no 'Decoder' "
+				"attribute in imported module", module_name);
+		ret = SRD_ERR_PYTHON;
+		goto out;
+	}
+
+	srd_dbg("Loading protocol decoder '%s'.", module_name);
+
+	d = g_malloc0(sizeof(struct srd_decoder));
+	d->module_name = g_strdup(module_name);
+
+	if ((ret = decoder_import(d, &not_pd)) != SRD_OK ||
+	    (ret = decoder_get_metadata(d)) != SRD_OK) {
+		if (stamp && not_pd)
+			cache_store(module_name, NULL, dir, stamp);
+		decoder_free(d);
+		goto out;
+	}
+
+	if (stamp)
+		cache_store(module_name, d, dir, stamp);
+
+	/* Append it to the list of loaded decoders. */
+	pd_list = g_slist_append(pd_list, d);
+
+out:
+	g_free(stamp);
+	g_free(dir);
+
+	return ret;
+}
+
+/**
+ * Import the Python module of a decoder which was loaded from the
+ * metadata cache. Does nothing if the module was imported already.
+ *
+ * @param d The decoder to use. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_decoder_import(struct srd_decoder *d)
+{
+	if (d->py_dec)
+		return SRD_OK;
+
+	srd_dbg("Importing protocol decoder '%s'.", d->module_name);
+
+	return decoder_import(d, NULL);
+}
+
+/**
+ * Load a protocol decoder module into the embedded Python interpreter.
+ *
+ * The metadata of the decoder is kept in a cache (in the user's cache
+ * directory, or in $SIGROKDECODE_CACHE_DIR if set, an empty value disables
+ * the cache). As long as the decoder's files remain unchanged, the module
+ * is not imported until the first instance of the decoder gets created.
+ *
+ * @param module_name The module name to be loaded.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.1.0
+ */
+SRD_API int srd_decoder_load(const char *module_name)
+{
+	int ret;
+
+	if (!srd_check_init())
+		return SRD_ERR;
+
+	if (!module_name)
+		return SRD_ERR_ARG;
+
+	ret = decoder_load(module_name);
+	cache_save();
+
+	return ret;
+}
+
 /**
  * Return a protocol decoder's docstring.
  *
@@ -875,6 +1573,10 @@ SRD_API char *srd_decoder_doc_get(const struct srd_decoder *dec)
 	if (!dec)
 		return NULL;
 
+	/* The docstring isn't cached, it needs the module. */
+	if (srd_decoder_import((struct srd_decoder *)dec) != SRD_OK)
+		return NULL;
+
 	gstate = PyGILState_Ensure();
 
 	if (!PyObject_HasAttrString(dec->py_mod, "__doc__"))
@@ -1008,7 +1710,7 @@ static void srd_decoder_load_all_zip_path(char *path)
 		char *modname_str;
 		if (py_str_as_str(modname, &modname_str) == SRD_OK) {
 			/* The directory name is the module name (e.g. "i2c"). */
-			srd_decoder_load(modname_str);
+			decoder_load(modname_str);
 			g_free(modname_str);
 		}
 		Py_DECREF(modname);
@@ -1037,12 +1739,12 @@ static void srd_decoder_load_all_path(char *path)
 		return;
 	}
 
-	/* This ignores errors returned by srd_decoder_load(). That
+	/* This ignores errors returned by decoder_load(). That
 	 * function will have logged the cause, but in any case we
 	 * want to continue anyway. */
 	while ((direntry = g_dir_read_name(dir)) != NULL) {
 		/* The directory name is the module name (e.g. "i2c"). */
-		srd_decoder_load(direntry);
+		decoder_load(direntry);
 	}
 	g_dir_close(dir);
 
@@ -1064,6 +1766,7 @@ SRD_API int srd_decoder_load_all(void)
 
 	for (l = searchpaths; l; l = l->next)
 		srd_decoder_load_all_path(l->data);
+	cache_save();
 
 	return SRD_OK;
 }
@@ -1081,6 +1784,11 @@ SRD_API int srd_decoder_unload_all(void)
 	g_slist_free(pd_list);
 	pd_list = NULL;
 
+	cache_save();
+	if (pd_cache)
+		g_key_file_free(pd_cache);
+	pd_cache = NULL;
+
 	return SRD_OK;
 }
 
@@ -19,8 +19,7 @@
 
 import sigrokdecode as srd
 import string
-import subprocess
-import re
+from common.objdump import load_disassembly
 
 ARM_EXCEPTIONS = {
     0: 'Thread',
@@ -86,50 +85,19 @@ def __init__(self):
         self.prevsample = 0
         self.dwt_timestamp = 0
         self.current_mode = None
-        self.file_lookup = {}
-        self.func_lookup = {}
+        self.disassembly = None
 
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
         self.load_objdump()
 
     def load_objdump(self):
-        '''Parse disassembly obtained from objdump into a lookup tables'''
+        '''Load the disassembly obtained from objdump as a lookup table'''
         if not (self.options['objdump'] and self.options['elffile']):
             return
 
-        opts = [self.options['objdump']]
-        opts += self.options['objdump_opts'].split()
-        opts += [self.options['elffile']]
-
-        try:
-            disasm = subprocess.check_output(opts)
-        except subprocess.CalledProcessError:
-            return
-
-        disasm = disasm.decode('utf-8', 'replace')
-
-        instpat = re.compile('\s*([0-9a-fA-F]+):\t+([0-9a-fA-F ]+)\t+([a-zA-Z][^;]+)\s*;?.*')
-        filepat = re.compile('[^\s]+[/\\\\]([a-zA-Z0-9._-]+:[0-9]+)(?:\s.*)?')
-        funcpat = re.compile('[0-9a-fA-F]+\s*<([^>]+)>:.*')
-
-        prev_file = ''
-        prev_func = ''
-
-        for line in disasm.split('\n'):
-            m = instpat.match(line)
-            if m:
-                addr = int(m.group(1), 16)
-                self.file_lookup[addr] = prev_file
-                self.func_lookup[addr] = prev_func
-            else:
-                m = funcpat.match(line)
-                if m:
-                    prev_func = m.group(1)
-                else:
-                    m = filepat.match(line)
-                    if m:
-                        prev_file = m.group(1)
+        self.disassembly = load_disassembly(self.options['objdump'],
+            self.options['objdump_opts'], self.options['elffile'])
 
     def get_packet_type(self, byte):
         '''Identify packet type based on its first byte.
@@ -169,8 +137,11 @@ def mode_change(self, new_mode):
             self.current_mode = (self.startsample, new_mode)
 
     def location_change(self, pc):
-        new_loc = self.file_lookup.get(pc)
-        new_func = self.func_lookup.get(pc)
+        new_loc = new_func = None
+        if self.disassembly:
+            instr = self.disassembly.lookup(pc)
+            if instr:
+                new_loc, new_func = instr.file, instr.func
         ss = self.startsample
         es = self.prevsample
 
@@ -72,6 +72,7 @@
 
 import sigrokdecode as srd
 from collections import namedtuple
+from common.crc import parity
 
 class Ann:
     '''Annotation and binary output classes.'''
@@ -521,7 +522,7 @@ def put_uart_field(bitpos, annclass):
 
         # Check for frame errors. START _must_ have been low
         # according to the above accumulation logic.
-        parity_ok = (bin(data_val).count('1') + parity_bit) % 2 == 0
+        parity_ok = parity(data_val) == parity_bit
         stop_ok = stop_bit == 1
         valid_frame = parity_ok and stop_ok
 
@@ -21,6 +21,9 @@
 CAN (Controller Area Network) is a field bus protocol for distributed
 real-time control.
 
+Classic CAN as well as (ISO) CAN FD frames are decoded. CAN FD data phases
+with bit rate switching use the 'fast_bitrate' option.
+
 This decoder assumes that a single CAN_RX line is sampled (e.g. on
 the digital output side of a CAN transceiver IC such as the Microchip
 MCP-2515DM-BM).
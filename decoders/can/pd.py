@@ -18,10 +18,14 @@
 ##
 
 import sigrokdecode as srd
+from common.crc import crc15_can, crc17_can_fd, crc21_can_fd, parity
 
 class SamplerateError(Exception):
     pass
 
+# Number of data bytes for the CAN FD data length codes.
+fd_dlc_len = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)
+
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'can'
@@ -36,6 +40,8 @@ class Decoder(srd.Decoder):
     )
     options = (
         {'id': 'bitrate', 'desc': 'Bitrate (bits/s)', 'default': 1000000},
+        {'id': 'fast_bitrate', 'desc': 'CAN FD data bitrate (bits/s)',
+            'default': 2000000},
         {'id': 'sample_point', 'desc': 'Sample point (%)', 'default': 70.0},
     )
     annotations = (
@@ -57,10 +63,14 @@ class Decoder(srd.Decoder):
         ('stuff-bit', 'Stuff bit'),
         ('warnings', 'Human-readable warnings'),
         ('bit', 'Bit'),
+        ('fdf', 'FD format indicator'),
+        ('brs', 'Bit rate switch'),
+        ('esi', 'Error state indicator'),
+        ('stuff-count', 'Stuff count'),
     )
     annotation_rows = (
         ('bits', 'Bits', (15, 17)),
-        ('fields', 'Fields', tuple(range(15))),
+        ('fields', 'Fields', tuple(range(15)) + (18, 19, 20, 21)),
         ('warnings', 'Warnings', (16,)),
     )
 
@@ -71,11 +81,21 @@ def __init__(self):
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
 
+    def set_bit_rate(self, bitrate):
+        self.bit_width = float(self.samplerate) / float(bitrate)
+        self.sample_point = (self.bit_width / 100.0) * self.options['sample_point']
+
     def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
             self.samplerate = value
-            self.bit_width = float(self.samplerate) / float(self.options['bitrate'])
-            self.sample_point = (self.bit_width / 100.0) * self.options['sample_point']
+            self.set_bit_rate(self.options['bitrate'])
+
+    # Switch to another bit rate at the sample point of the current bit.
+    # The rest of the current bit already uses the new bit rate.
+    def switch_bit_rate(self, bitrate):
+        self.set_bit_rate(bitrate)
+        self.dom_edge_snum = self.samplenum + int(self.bit_width - self.sample_point)
+        self.dom_edge_bcount = self.curbit + 1
 
     # Generic helper for CAN bit annotations.
     def putg(self, ss, es, data):
@@ -90,20 +110,36 @@ def putx(self, data):
     def put12(self, data):
         self.putg(self.ss_bit12, self.ss_bit12, data)
 
+    # Single-CAN-bit annotation using the samplenum of the RTR bit.
+    def putrtr(self, data):
+        self.putg(self.ss_rtr, self.ss_rtr, data)
+
     # Multi-CAN-bit annotation from self.ss_block to current samplenum.
     def putb(self, data):
         self.putg(self.ss_block, self.samplenum, data)
 
     def reset_variables(self):
         self.state = 'IDLE'
-        self.sof = self.frame_type = self.dlc = None
-        self.rawbits = [] # All bits, including stuff bits
-        self.bits = [] # Only actual CAN frame bits (no stuff bits)
+        self.sof = self.frame_type = self.dlc = self.fd = None
+        self.bits = 0 # Actual CAN frame bits (no stuff bits), last bit in LSB
+        self.num_bits = 0 # Number of bits in self.bits
+        self.last_rawbit = None # Last bit, including stuff bits
+        self.same_rawbits = 0 # Number of identical bits up to last_rawbit
+        self.stuff_count = 0 # Number of dynamic stuff bits
+        self.fixed_stuff_bit = False # Next bit is a fixed stuff bit (CAN FD)
         self.curbit = 0 # Current bit of CAN frame (bit 0 == SOF)
         self.last_databit = 999 # Positive value that bitnum+x will never match
+        self.crc_end = 999 # Last bit of the CRC sequence
+        self.stuff_end = 999 # Last bit which may follow a dynamic stuff bit
+        self.rtr_bit = self.fdf_bit = self.dlc_start = None
+        self.brs = False
+        self.crc15 = crc15_can.init
+        self.crc17 = crc17_can_fd.init
+        self.crc21 = crc21_can_fd.init
         self.ss_block = None
         self.ss_bit12 = None
-        self.ss_databytebits = []
+        self.ss_rtr = None
+        self.ss_databyte = None
 
     # Poor man's clock synchronization. Use signal edges which change to
     # dominant state in rather simple ways. This naive approach is neither
@@ -125,22 +161,18 @@ def get_sample_point(self, bitnum):
         samplenum += int(self.sample_point)
         return samplenum
 
-    def is_stuff_bit(self):
+    def is_stuff_bit(self, can_rx):
         # CAN uses NRZ encoding and bit stuffing.
         # After 5 identical bits, a stuff bit of opposite value is added.
-        # But not in the CRC delimiter, ACK, and end of frame fields.
-        if len(self.bits) > self.last_databit + 16:
+        # But not in the CRC delimiter, ACK, and end of frame fields. CAN FD
+        # frames use fixed stuff bits in the CRC field instead (see below).
+        if can_rx == self.last_rawbit:
+            self.same_rawbits += 1
             return False
-        last_6_bits = self.rawbits[-6:]
-        if last_6_bits not in ([0, 0, 0, 0, 0, 1], [1, 1, 1, 1, 1, 0]):
-            return False
-
-        # Stuff bit. Keep it in self.rawbits, but drop it from self.bits.
-        self.bits.pop() # Drop last bit.
-        return True
-
-    def is_valid_crc(self, crc_bits):
-        return True # TODO
+        stuff_bit = self.same_rawbits >= 5 and self.num_bits <= self.stuff_end
+        self.last_rawbit = can_rx
+        self.same_rawbits = 1
+        return stuff_bit
 
     def decode_error_frame(self, bits):
         pass # TODO
@@ -148,111 +180,106 @@ def decode_error_frame(self, bits):
     def decode_overload_frame(self, bits):
         pass # TODO
 
+    # Data length in bytes, and the positions of the data and CRC fields,
+    # once the DLC has been received in bit 'bitnum'.
+    def set_data_length(self, bitnum):
+        if self.fd:
+            num_bytes = fd_dlc_len[self.dlc]
+        elif (self.bits >> (bitnum - self.rtr_bit)) & 1:
+            # Remote frames do not contain a data field.
+            num_bytes = 0
+        else:
+            num_bytes = min(self.dlc, 8)
+        self.last_databit = bitnum + (num_bytes * 8)
+        if self.fd:
+            self.crc_width = 17 if num_bytes <= 16 else 21
+            self.crc_end = self.last_databit + 4 + self.crc_width
+            self.stuff_end = self.last_databit
+        else:
+            self.crc_width = 15
+            self.crc_end = self.last_databit + 15
+            # A stuff bit may follow the last bit of the CRC sequence.
+            self.stuff_end = self.crc_end + 1
+
     # Both standard and extended frames end with CRC, CRC delimiter, ACK,
     # ACK delimiter, and EOF fields. Handle them in a common function.
+    # CAN FD frames have a stuff count in front of the CRC.
     # Returns True if the frame ended (EOF), False otherwise.
     def decode_frame_end(self, can_rx, bitnum):
 
-        # Remember start of CRC sequence (see below).
+        # Remember start of stuff count (CAN FD) or CRC sequence (see below).
         if bitnum == (self.last_databit + 1):
             self.ss_block = self.samplenum
 
-        # CRC sequence (15 bits)
-        elif bitnum == (self.last_databit + 15):
-            x = self.last_databit + 1
-            crc_bits = self.bits[x:x + 15 + 1]
-            self.crc = int(''.join(str(d) for d in crc_bits), 2)
-            self.putb([11, ['CRC sequence: 0x%04x' % self.crc,
-                            'CRC: 0x%04x' % self.crc, 'CRC']])
-            if not self.is_valid_crc(crc_bits):
+        # CAN FD stuff count (4 bits): Number of dynamic stuff bits modulo 8
+        # as Gray code, followed by an (even) parity bit.
+        elif self.fd and bitnum == (self.last_databit + 4):
+            gray = self.stuff_count % 8
+            gray ^= gray >> 1
+            received = self.bits & 0xf
+            count = received >> 1
+            count ^= count >> 1
+            count ^= count >> 2
+            self.putb([21, ['Stuff count: %d' % count, 'SC: %d' % count, 'SC']])
+            if received != (gray << 1 | parity(gray)):
+                self.putb([16, ['Stuff count is invalid']])
+
+        # Remember start of CAN FD CRC sequence (see below).
+        elif self.fd and bitnum == (self.last_databit + 5):
+            self.ss_block = self.samplenum
+
+        # CRC sequence (15 bits, 17 or 21 bits for CAN FD)
+        elif bitnum == self.crc_end:
+            self.crc = self.bits & ((1 << self.crc_width) - 1)
+            if self.crc_width == 15:
+                crc = crc15_can.finish(self.crc15)
+            elif self.crc_width == 17:
+                crc = crc17_can_fd.finish(self.crc17)
+            else:
+                crc = crc21_can_fd.finish(self.crc21)
+            digits = (self.crc_width + 3) // 4
+            self.putb([11, ['CRC sequence: 0x%0*x' % (digits, self.crc),
+                            'CRC: 0x%0*x' % (digits, self.crc), 'CRC']])
+            if self.crc != crc:
                 self.putb([16, ['CRC is invalid']])
 
         # CRC delimiter bit (recessive)
-        elif bitnum == (self.last_databit + 16):
+        elif bitnum == (self.crc_end + 1):
             self.putx([12, ['CRC delimiter: %d' % can_rx,
                             'CRC d: %d' % can_rx, 'CRC d']])
             if can_rx != 1:
                 self.putx([16, ['CRC delimiter must be a recessive bit']])
+            if self.brs:
+                self.switch_bit_rate(self.options['bitrate'])
 
         # ACK slot bit (dominant: ACK, recessive: NACK)
-        elif bitnum == (self.last_databit + 17):
+        elif bitnum == (self.crc_end + 2):
             ack = 'ACK' if can_rx == 0 else 'NACK'
             self.putx([13, ['ACK slot: %s' % ack, 'ACK s: %s' % ack, 'ACK s']])
 
         # ACK delimiter bit (recessive)
-        elif bitnum == (self.last_databit + 18):
+        elif bitnum == (self.crc_end + 3):
             self.putx([14, ['ACK delimiter: %d' % can_rx,
                             'ACK d: %d' % can_rx, 'ACK d']])
             if can_rx != 1:
                 self.putx([16, ['ACK delimiter must be a recessive bit']])
 
         # Remember start of EOF (see below).
-        elif bitnum == (self.last_databit + 19):
+        elif bitnum == (self.crc_end + 4):
             self.ss_block = self.samplenum
 
         # End of frame (EOF), 7 recessive bits
-        elif bitnum == (self.last_databit + 25):
+        elif bitnum == (self.crc_end + 10):
             self.putb([2, ['End of frame', 'EOF', 'E']])
-            if self.rawbits[-7:] != [1, 1, 1, 1, 1, 1, 1]:
+            if can_rx != 1 or self.same_rawbits < 7:
                 self.putb([16, ['End of frame (EOF) must be 7 recessive bits']])
             self.reset_variables()
             return True
 
         return False
 
-    # Returns True if the frame ended (EOF), False otherwise.
-    def decode_standard_frame(self, can_rx, bitnum):
-
-        # Bit 14: RB0 (reserved bit)
-        # Has to be sent dominant, but receivers should accept recessive too.
-        if bitnum == 14:
-            self.putx([7, ['Reserved bit 0: %d' % can_rx,
-                           'RB0: %d' % can_rx, 'RB0']])
-
-            # Bit 12: Remote transmission request (RTR) bit
-            # Data frame: dominant, remote frame: recessive
-            # Remote frames do not contain a data field.
-            rtr = 'remote' if self.bits[12] == 1 else 'data'
-            self.put12([8, ['Remote transmission request: %s frame' % rtr,
-                            'RTR: %s frame' % rtr, 'RTR']])
-
-        # Remember start of DLC (see below).
-        elif bitnum == 15:
-            self.ss_block = self.samplenum
-
-        # Bits 15-18: Data length code (DLC), in number of bytes (0-8).
-        elif bitnum == 18:
-            self.dlc = int(''.join(str(d) for d in self.bits[15:18 + 1]), 2)
-            self.putb([10, ['Data length code: %d' % self.dlc,
-                            'DLC: %d' % self.dlc, 'DLC']])
-            self.last_databit = 18 + (self.dlc * 8)
-            if self.dlc > 8:
-                self.putb([16, ['Data length code (DLC) > 8 is not allowed']])
-
-        # Remember all databyte bits, except the very last one.
-        elif bitnum in range(19, self.last_databit):
-            self.ss_databytebits.append(self.samplenum)
-
-        # Bits 19-X: Data field (0-8 bytes, depending on DLC)
-        # The bits within a data byte are transferred MSB-first.
-        elif bitnum == self.last_databit:
-            self.ss_databytebits.append(self.samplenum) # Last databyte bit.
-            for i in range(self.dlc):
-                x = 18 + (8 * i) + 1
-                b = int(''.join(str(d) for d in self.bits[x:x + 8]), 2)
-                ss = self.ss_databytebits[i * 8]
-                es = self.ss_databytebits[((i + 1) * 8) - 1]
-                self.putg(ss, es, [0, ['Data byte %d: 0x%02x' % (i, b),
-                                       'DB %d: 0x%02x' % (i, b), 'DB']])
-            self.ss_databytebits = []
-
-        elif bitnum > self.last_databit:
-            return self.decode_frame_end(can_rx, bitnum)
-
-        return False
-
-    # Returns True if the frame ended (EOF), False otherwise.
-    def decode_extended_frame(self, can_rx, bitnum):
+    # Bits 14-31 of extended frames.
+    def decode_extended_id(self, can_rx, bitnum):
 
         # Remember start of EID (see below).
         if bitnum == 14:
@@ -260,7 +287,7 @@ def decode_extended_frame(self, can_rx, bitnum):
 
         # Bits 14-31: Extended identifier (EID[17..0])
         elif bitnum == 31:
-            self.eid = int(''.join(str(d) for d in self.bits[14:]), 2)
+            self.eid = self.bits & 0x3ffff
             s = '%d (0x%x)' % (self.eid, self.eid)
             self.putb([4, ['Extended Identifier: %s' % s,
                            'Extended ID: %s' % s, 'Extended ID', 'EID']])
@@ -271,75 +298,139 @@ def decode_extended_frame(self, can_rx, bitnum):
                            'Full ID', 'FID']])
 
             # Bit 12: Substitute remote request (SRR) bit
-            self.put12([9, ['Substitute remote request: %d' % self.bits[12],
-                            'SRR: %d' % self.bits[12], 'SRR']])
-
-        # Bit 32: Remote transmission request (RTR) bit
-        # Data frame: dominant, remote frame: recessive
-        # Remote frames do not contain a data field.
-        if bitnum == 32:
-            rtr = 'remote' if can_rx == 1 else 'data'
-            self.putx([8, ['Remote transmission request: %s frame' % rtr,
-                           'RTR: %s frame' % rtr, 'RTR']])
-
-        # Bit 33: RB1 (reserved bit)
-        elif bitnum == 33:
-            self.putx([7, ['Reserved bit 1: %d' % can_rx,
-                           'RB1: %d' % can_rx, 'RB1']])
-
-        # Bit 34: RB0 (reserved bit)
-        elif bitnum == 34:
-            self.putx([7, ['Reserved bit 0: %d' % can_rx,
-                           'RB0: %d' % can_rx, 'RB0']])
+            srr = (self.bits >> 19) & 1
+            self.put12([9, ['Substitute remote request: %d' % srr,
+                            'SRR: %d' % srr, 'SRR']])
+
+        # Bit 32: Remote transmission request (RTR) bit, or remote request
+        # substitution (RRS) bit in CAN FD frames (gets handled later).
+        elif bitnum == 32:
+            self.ss_rtr = self.samplenum
+
+    # Control and data fields, starting at the FDF bit. This is reserved
+    # bit 0 (standard frames) or 1 (extended frames) in classic CAN frames.
+    def decode_control_data(self, can_rx, bitnum):
+
+        # Bits X-Y: Data field (0-8 bytes, or 0-64 bytes for CAN FD,
+        # depending on DLC). The bits within a data byte are transferred
+        # MSB-first.
+        if self.dlc is not None:
+            i = bitnum - self.dlc_start - 4
+            if i % 8 == 0:
+                self.ss_databyte = self.samplenum
+            if i % 8 == 7:
+                b, i = self.bits & 0xff, i // 8
+                self.putg(self.ss_databyte, self.samplenum,
+                          [0, ['Data byte %d: 0x%02x' % (i, b),
+                               'DB %d: 0x%02x' % (i, b), 'DB']])
+
+        # FDF bit: Classic CAN frame (dominant) or CAN FD frame (recessive)
+        # Classic frames have the RTR bit before, CAN FD frames the RRS bit.
+        elif bitnum == self.fdf_bit:
+            self.fd = can_rx == 1
+            if self.fd:
+                self.putx([18, ['FD format indicator: FD frame',
+                                'FDF: FD frame', 'FDF']])
+                rrs = (self.bits >> (bitnum - self.rtr_bit)) & 1
+                self.putrtr([7, ['Remote request substitution: %d' % rrs,
+                                 'RRS: %d' % rrs, 'RRS']])
+                self.dlc_start = bitnum + 4
+                return
+
+            # Has to be sent dominant, but receivers should accept recessive too.
+            if self.frame_type == 'standard':
+                self.putx([7, ['Reserved bit 0: %d' % can_rx,
+                               'RB0: %d' % can_rx, 'RB0']])
+                self.dlc_start = bitnum + 1
+            else:
+                self.putx([7, ['Reserved bit 1: %d' % can_rx,
+                               'RB1: %d' % can_rx, 'RB1']])
+                self.dlc_start = bitnum + 2
+
+            # Data frame: dominant, remote frame: recessive
+            # Remote frames do not contain a data field.
+            rtr = (self.bits >> (bitnum - self.rtr_bit)) & 1
+            rtr = 'remote' if rtr == 1 else 'data'
+            self.putrtr([8, ['Remote transmission request: %s frame' % rtr,
+                             'RTR: %s frame' % rtr, 'RTR']])
 
         # Remember start of DLC (see below).
-        elif bitnum == 35:
+        elif bitnum == self.dlc_start:
             self.ss_block = self.samplenum
 
-        # Bits 35-38: Data length code (DLC), in number of bytes (0-8).
-        elif bitnum == 38:
-            self.dlc = int(''.join(str(d) for d in self.bits[35:38 + 1]), 2)
+        # Data length code (DLC), in number of bytes (0-8), or an index into
+        # the CAN FD data lengths.
+        elif bitnum == self.dlc_start + 3:
+            self.dlc = self.bits & 0xf
             self.putb([10, ['Data length code: %d' % self.dlc,
                             'DLC: %d' % self.dlc, 'DLC']])
-            self.last_databit = 38 + (self.dlc * 8)
-
-        # Remember all databyte bits, except the very last one.
-        elif bitnum in range(39, self.last_databit):
-            self.ss_databytebits.append(self.samplenum)
-
-        # Bits 39-X: Data field (0-8 bytes, depending on DLC)
-        # The bits within a data byte are transferred MSB-first.
-        elif bitnum == self.last_databit:
-            self.ss_databytebits.append(self.samplenum) # Last databyte bit.
-            for i in range(self.dlc):
-                x = 38 + (8 * i) + 1
-                b = int(''.join(str(d) for d in self.bits[x:x + 8]), 2)
-                ss = self.ss_databytebits[i * 8]
-                es = self.ss_databytebits[((i + 1) * 8) - 1]
-                self.putg(ss, es, [0, ['Data byte %d: 0x%02x' % (i, b),
-                                       'DB %d: 0x%02x' % (i, b), 'DB']])
-            self.ss_databytebits = []
-
-        elif bitnum > self.last_databit:
-            return self.decode_frame_end(can_rx, bitnum)
+            if self.dlc > 8 and not self.fd:
+                self.putb([16, ['Data length code (DLC) > 8 is not allowed']])
+            self.set_data_length(bitnum)
 
-        return False
+        # Classic extended frames: RB0 (reserved bit)
+        elif not self.fd and bitnum == self.fdf_bit + 1:
+            self.putx([7, ['Reserved bit 0: %d' % can_rx,
+                           'RB0: %d' % can_rx, 'RB0']])
+
+        # CAN FD: Reserved bit
+        elif self.fd and bitnum == self.fdf_bit + 1:
+            self.putx([7, ['Reserved bit: %d' % can_rx, 'RES: %d' % can_rx,
+                           'RES']])
+
+        # CAN FD: Bit rate switch (BRS) bit, the data phase uses the fast
+        # bit rate when recessive.
+        elif self.fd and bitnum == self.fdf_bit + 2:
+            self.brs = can_rx == 1
+            self.putx([19, ['Bit rate switch: %d' % can_rx,
+                            'BRS: %d' % can_rx, 'BRS']])
+            if self.brs:
+                self.switch_bit_rate(self.options['fast_bitrate'])
+
+        # CAN FD: Error state indicator (ESI) bit
+        # Error active: dominant, error passive: recessive
+        elif self.fd and bitnum == self.fdf_bit + 3:
+            esi = 'passive' if can_rx == 1 else 'active'
+            self.putx([20, ['Error state indicator: error %s' % esi,
+                            'ESI: %s' % esi, 'ESI']])
 
     def handle_bit(self, can_rx):
-        self.rawbits.append(can_rx)
-        self.bits.append(can_rx)
+        # CAN FD frames have fixed stuff bits in the CRC field, in front of
+        # the stuff count and after every 4 bits.
+        if self.fixed_stuff_bit:
+            self.fixed_stuff_bit = False
+            self.putx([15, [str(can_rx)]])
+            if can_rx == self.last_rawbit:
+                self.putx([16, ['Fixed stuff bit must be the inverse of the previous bit']])
+            self.last_rawbit = can_rx
+            self.same_rawbits = 1
+            self.curbit += 1
+            return
 
         # Get the index of the current CAN frame bit (without stuff bits).
-        bitnum = len(self.bits) - 1
-
-        # If this is a stuff bit, remove it from self.bits and ignore it.
-        if self.is_stuff_bit():
+        bitnum = self.num_bits
+        stuff_bit = self.is_stuff_bit(can_rx)
+
+        # The CAN FD CRCs also cover the dynamic stuff bits and the stuff
+        # count. They are calculated until the frame format is known.
+        if self.fd is not False and bitnum <= self.last_databit + 4:
+            self.crc17 = crc17_can_fd.update_bit(self.crc17, can_rx)
+            self.crc21 = crc21_can_fd.update_bit(self.crc21, can_rx)
+
+        # If this is a stuff bit, ignore it.
+        if stuff_bit:
+            self.stuff_count += 1
             self.putx([15, [str(can_rx)]])
             self.curbit += 1 # Increase self.curbit (bitnum is not affected).
             return
         else:
             self.putx([17, [str(can_rx)]])
 
+        if not self.fd and bitnum <= self.last_databit:
+            self.crc15 = crc15_can.update_bit(self.crc15, can_rx)
+        self.bits = (self.bits << 1) | can_rx
+        self.num_bits += 1
+
         # Bit 0: Start of frame (SOF) bit
         if bitnum == 0:
             self.putx([1, ['Start of frame', 'SOF', 'S']])
@@ -353,8 +444,8 @@ def handle_bit(self, can_rx):
         # Bits 1-11: Identifier (ID[10..0])
         # The bits ID[10..4] must NOT be all recessive.
         elif bitnum == 11:
-            self.id = int(''.join(str(d) for d in self.bits[1:]), 2)
-            s = '%d (0x%x)' % (self.id, self.id),
+            self.id = self.bits & 0x7ff
+            s = '%d (0x%x)' % (self.id, self.id)
             self.putb([3, ['Identifier: %s' % s, 'ID: %s' % s, 'ID']])
             if (self.id & 0x7f0) == 0x7f0:
                 self.putb([16, ['Identifier bits 10..4 must not be all recessive']])
@@ -362,7 +453,7 @@ def handle_bit(self, can_rx):
         # RTR or SRR bit, depending on frame type (gets handled later).
         elif bitnum == 12:
             # self.putx([0, ['RTR/SRR: %d' % can_rx]]) # Debug only.
-            self.ss_bit12 = self.samplenum
+            self.ss_bit12 = self.ss_rtr = self.samplenum
 
         # Bit 13: Identifier extension (IDE) bit
         # Standard frame: dominant, extended frame: recessive
@@ -370,18 +461,22 @@ def handle_bit(self, can_rx):
             ide = self.frame_type = 'standard' if can_rx == 0 else 'extended'
             self.putx([6, ['Identifier extension bit: %s frame' % ide,
                            'IDE: %s frame' % ide, 'IDE']])
+            self.rtr_bit = 12 if can_rx == 0 else 32
+            self.fdf_bit = 14 if can_rx == 0 else 33
 
         # Bits 14-X: Frame-type dependent, passed to the resp. handlers.
         elif bitnum >= 14:
-            if self.frame_type == 'standard':
-                done = self.decode_standard_frame(can_rx, bitnum)
-            else:
-                done = self.decode_extended_frame(can_rx, bitnum)
-
-            # The handlers return True if a frame ended (EOF).
-            if done:
+            if bitnum < self.fdf_bit:
+                self.decode_extended_id(can_rx, bitnum)
+            elif bitnum <= self.last_databit:
+                self.decode_control_data(can_rx, bitnum)
+            elif self.decode_frame_end(can_rx, bitnum):
+                # The frame ended (EOF).
                 return
 
+        if self.fd and self.last_databit <= bitnum < self.crc_end:
+            self.fixed_stuff_bit = (bitnum - self.last_databit) % 4 == 0
+
         # After a frame there are 3 intermission bits (recessive).
         # After these bits, the bus is considered free.
 
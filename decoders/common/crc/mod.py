@@ -0,0 +1,149 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+import zlib
+
+def reverse_bits(value, width):
+    '''Return the lowest 'width' bits of 'value' in reversed order.'''
+    result = 0
+    for i in range(width):
+        result = (result << 1) | ((value >> i) & 1)
+    return result
+
+class Crc:
+    '''Table driven CRC computation.
+
+    The parameters follow the usual CRC catalogue notation: 'poly' is
+    given without the implicit top bit, 'refin' and 'refout' tell whether
+    input bytes and the result are bit reversed (LSB first transmission).
+
+    Computations can be incremental: start with the 'init' attribute,
+    feed the data with update(), update_bits() or update_bit(), and get
+    the CRC value with finish(). Calling the object does all of this for
+    a complete bytes-like object (or iterable of byte values).
+    '''
+
+    def __init__(self, width, poly, init=0, refin=False, refout=False,
+                 xorout=0):
+        self.width = width
+        self.mask = (1 << width) - 1
+        self.poly = poly
+        self.init = init
+        self.refin = refin
+        self.refout = refout
+        self.xorout = xorout
+        if refin:
+            # Reflected register, the poly gets reflected as well.
+            self.rpoly = reverse_bits(poly, width)
+            self.table = [self._reflected_entry(b) for b in range(256)]
+        else:
+            # Keep the register in the top bits of at least 8 bits.
+            self.shift = max(width, 8) - width
+            self.table = [self._normal_entry(b) for b in range(256)]
+
+    def _reflected_entry(self, b):
+        crc = b
+        for i in range(8):
+            crc = (crc >> 1) ^ self.rpoly if crc & 1 else crc >> 1
+        return crc
+
+    def _normal_entry(self, b):
+        bits = self.width + self.shift
+        top = 1 << (bits - 1)
+        mask = (1 << bits) - 1
+        poly = self.poly << self.shift
+        crc = b << (bits - 8)
+        for i in range(8):
+            crc = ((crc << 1) ^ poly if crc & top else crc << 1) & mask
+        return crc
+
+    def update(self, crc, data):
+        '''Feed the bytes of 'data' into the CRC register 'crc'.'''
+        table = self.table
+        if self.refin:
+            for b in data:
+                crc = (crc >> 8) ^ table[(crc ^ b) & 0xff]
+            return crc
+        shift = self.shift
+        bits = self.width + shift
+        mask = (1 << bits) - 1
+        crc <<= shift
+        for b in data:
+            crc = ((crc << 8) & mask) ^ table[((crc >> (bits - 8)) ^ b) & 0xff]
+        return crc >> shift
+
+    def update_bit(self, crc, bit):
+        '''Feed a single bit into the CRC register 'crc'.'''
+        if self.refin:
+            if (crc ^ bit) & 1:
+                return (crc >> 1) ^ self.rpoly
+            return crc >> 1
+        if ((crc >> (self.width - 1)) ^ bit) & 1:
+            return ((crc << 1) ^ self.poly) & self.mask
+        return (crc << 1) & self.mask
+
+    def update_bits(self, crc, value, count):
+        '''Feed the lowest 'count' bits of 'value' into the CRC register.
+
+        Bits are fed in transmission order, i.e. LSB first for reflected
+        CRCs, MSB first otherwise.
+        '''
+        if self.refin:
+            for i in range(count):
+                crc = self.update_bit(crc, (value >> i) & 1)
+        else:
+            for i in range(count - 1, -1, -1):
+                crc = self.update_bit(crc, (value >> i) & 1)
+        return crc
+
+    def finish(self, crc):
+        '''Return the CRC value for the CRC register 'crc'.'''
+        if self.refin != self.refout:
+            crc = reverse_bits(crc, self.width)
+        return crc ^ self.xorout
+
+    def __call__(self, data):
+        return self.finish(self.update(self.init, data))
+
+crc5_usb = Crc(5, 0x05, init=0x1f, refin=True, refout=True, xorout=0x1f)
+crc8 = Crc(8, 0x07)
+crc15_can = Crc(15, 0x4599)
+crc17_can_fd = Crc(17, 0x1685b, init=1 << 16)
+crc21_can_fd = Crc(21, 0x102899, init=1 << 20)
+crc16_usb = Crc(16, 0x8005, init=0xffff, refin=True, refout=True,
+                xorout=0xffff)
+crc16_modbus = Crc(16, 0x8005, init=0xffff, refin=True, refout=True)
+
+def crc32(data, crc=0):
+    '''Return the CRC-32 (as used by Ethernet, zlib, USB PD) of 'data'.
+
+    Pass the previous result as 'crc' to continue a computation.
+    '''
+    return zlib.crc32(data, crc) & 0xffffffff
+
+if hasattr(int, 'bit_count'):
+    def popcount(value):
+        '''Return the number of set bits in a non-negative integer.'''
+        return value.bit_count()
+else:
+    def popcount(value):
+        '''Return the number of set bits in a non-negative integer.'''
+        return bin(value).count('1')
+
+def parity(value):
+    '''Return 1 if 'value' has an odd number of set bits, 0 otherwise.'''
+    return popcount(value) & 1
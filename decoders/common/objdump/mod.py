@@ -0,0 +1,223 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Instruction table obtained from an objdump disassembly of an ELF file.
+
+Running objdump and parsing its output takes a long time for large
+firmware images, so the table is kept in a cache file (one per ELF file,
+size, modification time and objdump command line) and memory mapped.
+Instances which use the same ELF file share one table.
+
+Cache file layout (all values 32 bit little endian):
+ - magic, number of instructions N, number of strings S
+ - N sorted instruction addresses
+ - N records: file, function, source, disassembly (string indices,
+   NO_STRING for None), next address, next address if branch taken
+ - S + 1 offsets into the string data, followed by the UTF-8 string data
+'''
+
+import hashlib
+import mmap
+import os
+import re
+import struct
+import subprocess
+import tempfile
+from collections import namedtuple
+
+Instruction = namedtuple('Instruction',
+    'file func source disasm next_n next_e')
+
+MAGIC = 0x314a4453 # 'SDJ1'
+NO_STRING = 0xffffffff
+
+header = struct.Struct('<III')
+word = struct.Struct('<I')
+record = struct.Struct('<IIIIII')
+
+instpat = re.compile(r'\s*([0-9a-fA-F]+):\t+([0-9a-fA-F ]+)\t+([a-zA-Z][^;]+)\s*;?.*')
+branchpat = re.compile(r'(b|bl|b..|bl..|cbnz|cbz)(?:\.[wn])?\s+(?:r[0-9]+,\s*)?([0-9a-fA-F]+)')
+filepat = re.compile(r'[^\s]+[/\\]([a-zA-Z0-9._-]+:[0-9]+)(?:\s.*)?')
+funcpat = re.compile(r'[0-9a-fA-F]+\s*<([^>]+)>:.*')
+
+class Disassembly:
+    '''Look up instructions by address in a table (see above), which may
+    be a bytes object or a memory mapped cache file.'''
+
+    def __init__(self, data):
+        self.data = data
+        magic, self.num_instr, self.num_strings = header.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError('Invalid disassembly table')
+        self.addr_offset = header.size
+        self.record_offset = self.addr_offset + self.num_instr * word.size
+        self.string_offset = self.record_offset + self.num_instr * record.size
+        self.blob_offset = self.string_offset + (self.num_strings + 1) * word.size
+        end = word.unpack_from(data, self.blob_offset - word.size)[0]
+        if self.blob_offset + end != len(data):
+            raise ValueError('Invalid disassembly table')
+        self.strings = {NO_STRING: None}
+
+    def string(self, index):
+        s = self.strings.get(index, NO_STRING)
+        if s is NO_STRING:
+            start, end = struct.unpack_from('<II', self.data,
+                self.string_offset + index * word.size)
+            s = self.data[self.blob_offset + start:self.blob_offset + end]
+            s = self.strings[index] = s.decode('utf-8')
+        return s
+
+    def lookup(self, addr):
+        '''Return the Instruction at addr, or None.'''
+        data, lo, hi = self.data, 0, self.num_instr
+        while lo < hi:
+            mid = (lo + hi) // 2
+            a = word.unpack_from(data, self.addr_offset + mid * word.size)[0]
+            if a < addr:
+                lo = mid + 1
+            elif a > addr:
+                hi = mid
+            else:
+                f, fn, src, dis, next_n, next_e = record.unpack_from(data,
+                    self.record_offset + mid * record.size)
+                return Instruction(self.string(f), self.string(fn),
+                    self.string(src), self.string(dis), next_n, next_e)
+        return None
+
+def parse_disassembly(disasm):
+    '''Parse objdump output into a table for Disassembly.'''
+    instructions = {}
+    strings = {None: NO_STRING}
+
+    def intern(s):
+        index = strings.get(s)
+        if index is None:
+            index = strings[s] = len(strings) - 1
+        return index
+
+    prev_src = ''
+    prev_file = ''
+    prev_func = ''
+
+    for line in disasm.split('\n'):
+        m = instpat.match(line)
+        if m:
+            addr = int(m.group(1), 16)
+            raw = m.group(2)
+            disas = m.group(3).strip().replace('\t', ' ')
+
+            # Next address in direct sequence.
+            ilen = len(raw.replace(' ', '')) // 2
+            next_n = addr + ilen
+
+            # Next address if branch is taken.
+            bm = branchpat.match(disas)
+            if bm:
+                next_e = int(bm.group(2), 16)
+            else:
+                next_e = next_n
+
+            instructions[addr] = (intern(prev_file), intern(prev_func),
+                intern(prev_src), intern(disas), next_n, next_e)
+        else:
+            m = funcpat.match(line)
+            if m:
+                prev_func = m.group(1)
+                prev_src = None
+            else:
+                m = filepat.match(line)
+                if m:
+                    prev_file = m.group(1)
+                    prev_src = None
+                else:
+                    prev_src = line.strip()
+
+    addrs = sorted(instructions)
+    del strings[None]
+    blobs = [s.encode('utf-8') for s in sorted(strings, key=strings.get)]
+    offsets = [0]
+    for b in blobs:
+        offsets.append(offsets[-1] + len(b))
+
+    parts = [header.pack(MAGIC, len(addrs), len(blobs))]
+    parts += [word.pack(a) for a in addrs]
+    parts += [record.pack(*instructions[a]) for a in addrs]
+    parts += [word.pack(o) for o in offsets]
+    parts += blobs
+    return b''.join(parts)
+
+def cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'libsigrokdecode', 'objdump')
+
+def map_file(filename):
+    with open(filename, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def write_cache(filename, table):
+    dirname = os.path.dirname(filename)
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmpname = tempfile.mkstemp(dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(table)
+        os.rename(tmpname, filename)
+    except OSError:
+        os.remove(tmpname)
+        raise
+
+# Tables in use, by cache key.
+disassemblies = {}
+
+def load_disassembly(objdump, objdump_opts, elffile):
+    '''Return the Disassembly of elffile, or None if objdump fails.'''
+    opts = [objdump] + objdump_opts.split() + [elffile]
+    try:
+        st = os.stat(elffile)
+    except OSError:
+        st = None
+    if st is not None:
+        key = repr((opts, os.path.abspath(elffile), st.st_size, st.st_mtime))
+        key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        if key in disassemblies:
+            return disassemblies[key]
+        filename = os.path.join(cache_dir(), key)
+        try:
+            d = disassemblies[key] = Disassembly(map_file(filename))
+            return d
+        except (OSError, ValueError, struct.error):
+            pass
+
+    try:
+        disasm = subprocess.check_output(opts)
+    except subprocess.CalledProcessError:
+        return None
+    table = parse_disassembly(disasm.decode('utf-8', 'replace'))
+
+    if st is None:
+        return Disassembly(table)
+    try:
+        write_cache(filename, table)
+        d = Disassembly(map_file(filename))
+    except (OSError, ValueError, struct.error):
+        # No (usable) cache, keep the table in memory.
+        d = Disassembly(table)
+    disassemblies[key] = d
+    return d
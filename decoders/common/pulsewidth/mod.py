@@ -0,0 +1,142 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+class PulseWidths:
+    '''Classify pulse widths into clusters, and track the clusters.
+
+    Line codes like biphase mark code have pulses of a few distinct
+    widths, e.g. one and two half bit cells. This finds the typical
+    width (the center) of each of 'count' kinds of pulses, and tells
+    which kind a pulse is: add() returns the index of the cluster,
+    0 being the shortest pulses.
+
+    The centers are either given, or get learned from a histogram of
+    the first 'learn' pulse widths; add() returns None until then. Every
+    pulse moves the center of its cluster towards its width, by the
+    fraction 'weight' of the difference, such that the centers follow
+    a drifting clock. Pulses which are far from all centers (more than
+    half the distance to the neighbouring center off the outermost
+    ones) don't move the centers.
+    '''
+
+    def __init__(self, count, centers=None, learn=64, weight=1/32,
+                 min_ratio=1.25):
+        if count < 2:
+            raise ValueError('Need at least two kinds of pulses.')
+        self.count = count
+        self.learn = learn
+        self.weight = weight
+        self.min_ratio = min_ratio
+        self.reset(centers)
+
+    def reset(self, centers=None):
+        '''Start over, with the given centers or with learning them.'''
+        self.hist = {}
+        self.num_learned = 0
+        self.learn_at = self.learn
+        self.centers = None
+        if centers is not None:
+            if len(centers) != self.count:
+                raise ValueError('Need %d centers.' % self.count)
+            self.set_centers(centers)
+
+    def set_centers(self, centers):
+        self.centers = [float(c) for c in sorted(centers)]
+        self.update_limits()
+
+    def update_limits(self):
+        # Pulses get classified by the midpoints between the centers.
+        c = self.centers
+        self.thresholds = [(c[i] + c[i + 1]) / 2 for i in range(len(c) - 1)]
+        self.lo = 2 * c[0] - self.thresholds[0]
+        self.hi = 2 * c[-1] - self.thresholds[-1]
+
+    def classify(self, width):
+        '''Return the cluster index of a width, without tracking it.'''
+        for i, t in enumerate(self.thresholds):
+            if width < t:
+                return i
+        return len(self.thresholds)
+
+    def add(self, width):
+        '''Classify a pulse width and track it. None while learning.'''
+        if self.centers is None:
+            self.hist[width] = self.hist.get(width, 0) + 1
+            self.num_learned += 1
+            if self.num_learned >= self.learn_at:
+                self.learn_centers()
+            return None
+
+        i = self.classify(width)
+        if self.lo <= width <= self.hi:
+            c = self.centers
+            c[i] += (width - c[i]) * self.weight
+            # Only the thresholds next to the cluster change, but these may
+            # be the outermost ones, which the limits depend on.
+            if i > 0:
+                self.thresholds[i - 1] = (c[i - 1] + c[i]) / 2
+            if i < self.count - 1:
+                self.thresholds[i] = (c[i] + c[i + 1]) / 2
+            self.lo = 2 * c[0] - self.thresholds[0]
+            self.hi = 2 * c[-1] - self.thresholds[-1]
+        return i
+
+    def percentile(self, widths, p):
+        n = self.num_learned * p
+        for w in widths:
+            n -= self.hist[w]
+            if n < 0:
+                return w
+        return widths[-1]
+
+    def learn_centers(self):
+        '''Find the clusters in the histogram (one-dimensional k-means).'''
+        widths = sorted(self.hist)
+        # Start with evenly spaced centers, ignoring rare outliers.
+        lo = self.percentile(widths, 0.01)
+        hi = self.percentile(widths, 0.99)
+        k = self.count
+        self.centers = [lo + (hi - lo) * i / (k - 1) for i in range(k)]
+        self.update_limits()
+        for iteration in range(16):
+            sums, nums = [0] * k, [0] * k
+            for w, n in self.hist.items():
+                i = self.classify(w)
+                sums[i] += w * n
+                nums[i] += n
+            if 0 in nums:
+                break
+            centers = [sums[i] / nums[i] for i in range(k)]
+            if centers == self.centers:
+                break
+            self.set_centers(centers)
+
+        c = self.centers
+        if 0 not in nums and \
+                all(c[i + 1] >= c[i] * self.min_ratio for i in range(k - 1)):
+            self.hist = {}
+            return
+
+        # Not enough distinct pulses yet, keep learning. Start over once
+        # the histogram got large, in case it holds junk from the start.
+        self.centers = None
+        if self.num_learned >= 8 * self.learn:
+            self.hist = {}
+            self.num_learned = 0
+            self.learn_at = self.learn
+        else:
+            self.learn_at = self.num_learned + max(self.learn // 4, 1)
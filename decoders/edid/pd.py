@@ -39,6 +39,23 @@
 OFF_NUM_EXT = 126
 OFF_CHECKSUM = 127
 
+# PNP ID to vendor name, loaded from pnpids.txt on first use.
+pnpids = None
+
+def lookup_pnpid(pnpid):
+    global pnpids
+    if pnpids is None:
+        pnpids = {}
+        pnpid_file = os.path.join(os.path.dirname(__file__), 'pnpids.txt')
+        if os.path.exists(pnpid_file):
+            with open(pnpid_file, encoding='utf-8') as f:
+                for line in f:
+                    key, sep, vendor = line.partition(';')
+                    if sep:
+                        # The first entry wins for duplicate IDs.
+                        pnpids.setdefault(key, vendor.strip())
+    return pnpids.get(pnpid, '')
+
 # Pre-EDID established timing modes
 est_modes = [
     '720x400@70Hz',
@@ -183,20 +200,12 @@ def ann_field(self, start, end, annotation):
         self.put(self.sn[start][0], self.sn[end][1],
                  self.out_ann, [ANN_FIELDS, [annotation]])
 
-    def lookup_pnpid(self, pnpid):
-        pnpid_file = os.path.join(os.path.dirname(__file__), 'pnpids.txt')
-        if os.path.exists(pnpid_file):
-            for line in open(pnpid_file).readlines():
-                if line.find(pnpid + ';') == 0:
-                    return line[4:].strip()
-        return ''
-
     def decode_vid(self, offset):
         pnpid = chr(64 + ((self.cache[offset] & 0x7c) >> 2))
         pnpid += chr(64 + (((self.cache[offset] & 0x03) << 3)
                            | ((self.cache[offset+1] & 0xe0) >> 5)))
         pnpid += chr(64 + (self.cache[offset+1] & 0x1f))
-        vendor = self.lookup_pnpid(pnpid)
+        vendor = lookup_pnpid(pnpid)
         if vendor:
             pnpid += ' (%s)' % vendor
         self.ann_field(offset, offset+1, pnpid)
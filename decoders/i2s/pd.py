@@ -18,6 +18,7 @@
 ##
 
 import sigrokdecode as srd
+import struct
 
 '''
 OUTPUT_PYTHON format:
@@ -30,8 +31,28 @@
 
 <channel>: 'L' or 'R'
 <value>: integer
+
+Binary output:
+
+The 'wav' output is a WAV stream with the received frames. The sample
+width is the received word length (or an option), the frame rate gets
+measured. The frames are submitted at the end of each chunk of input
+samples, or once 64 KiB of them were received. The header in front of the
+first ones has the frame rate measured until then, and size fields of
+0xffffffff, since the size of the data is unknown while it gets streamed.
+If the frontend signals the end of the input, the 'wav-header' output
+holds the final header (with the sizes, and the frame rate measured over
+all of the input), which can replace the first 44 bytes of the stream to
+make it a complete file.
 '''
 
+# Maximum number of bytes of frames which get submitted in one binary chunk.
+WAV_CHUNK_SIZE = 64 * 1024
+
+# Measured frame rates within 0.5% of these get rounded to them.
+WAV_RATES = (8000, 11025, 16000, 22050, 32000, 44100, 48000, 64000,
+             88200, 96000, 176400, 192000)
+
 class SamplerateError(Exception):
     pass
 
@@ -54,8 +75,13 @@ class Decoder(srd.Decoder):
         ('right', 'Right channel'),
         ('warnings', 'Warnings'),
     )
+    options = (
+        {'id': 'wav_sample_bits', 'desc': 'WAV sample width (bits)',
+            'default': 'auto', 'values': ('auto', '16', '24', '32')},
+    )
     binary = (
         ('wav', 'WAV file'),
+        ('wav-header', 'WAV header with final sizes'),
     )
 
     def __init__(self):
@@ -67,7 +93,13 @@ def __init__(self):
         self.first_sample = None
         self.ss_block = None
         self.wordlength = -1
-        self.wrote_wav_header = False
+        self.wav_bits = None
+        self.wav_rate = None
+        self.wav_buf = bytearray()
+        self.wav_ss = None
+        self.wav_left = None
+        self.ss_left = None
+        self.wav_size = 0
 
     def start(self):
         self.out_python = self.register(srd.OUTPUT_PYTHON)
@@ -81,9 +113,6 @@ def metadata(self, key, value):
     def putpb(self, data):
         self.put(self.ss_block, self.samplenum, self.out_python, data)
 
-    def putbin(self, data):
-        self.put(self.ss_block, self.samplenum, self.out_binary, data)
-
     def putb(self, data):
         self.put(self.ss_block, self.samplenum, self.out_ann, data)
 
@@ -101,39 +130,98 @@ def report(self):
         return 'I²S: %d %d-bit samples received at %sHz' % \
             (self.samplesreceived, self.wordlength, samplerate)
 
-    def wav_header(self):
-        # Chunk descriptor
-        h  = b'RIFF'
-        h += b'\x24\x80\x00\x00' # Chunk size (2084)
-        h += b'WAVE'
-        # Fmt subchunk
-        h += b'fmt '
-        h += b'\x10\x00\x00\x00' # Subchunk size (16 bytes)
-        h += b'\x01\x00'         # Audio format (0x0001 == PCM)
-        h += b'\x02\x00'         # Number of channels (2)
-        h += b'\x80\x3e\x00\x00' # Samplerate (16000)
-        h += b'\x00\x7d\x00\x00' # Byterate (32000)
-        h += b'\x04\x00'         # Blockalign (4)
-        h += b'\x10\x00'         # Bits per sample (16)
-        # Data subchunk
-        h += b'data'
-        h += b'\xff\xff\x00\x00' # Subchunk size (65535 bytes) TODO
-        return h
-
-    def wav_sample(self, sample):
-        # TODO: This currently assumes U32 samples, and converts to S16.
-        s = sample >> 16
-        if s >= 0x8000:
-            s -= 0x10000
-        lo, hi = s & 0xff, (s >> 8) & 0xff
-        return bytes([lo, hi])
+    def frame_rate(self, es):
+        '''Measure the frame rate (two samples per frame) up to sample es.'''
+        if self.first_sample is None or es <= self.first_sample:
+            return 0
+        rate = self.samplesreceived * self.samplerate / \
+            (2 * (es - self.first_sample))
+        for r in WAV_RATES:
+            if abs(rate - r) <= r * 0.005:
+                return r
+        return int(round(rate))
+
+    def wav_header(self, size=None):
+        '''Return the WAV header, for the given size of the data.'''
+        channels = 2
+        blockalign = channels * self.wav_bits // 8
+        if size is None:
+            riff_size = data_size = 0xffffffff # Streaming, unknown size
+        else:
+            data_size = min(size, 0xffffffff - 36)
+            riff_size = 36 + data_size
+        # Chunk descriptor, fmt subchunk (PCM), data subchunk header.
+        return b'RIFF' + struct.pack('<I', riff_size) + b'WAVE' + \
+            b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels,
+                self.wav_rate, self.wav_rate * blockalign, blockalign,
+                self.wav_bits) + \
+            b'data' + struct.pack('<I', data_size)
+
+    def wav_sample(self, sample, left):
+        '''Buffer a sample for the WAV output, left and right form a frame.'''
+        # Choose the sample width from the first sample's word length.
+        if self.wav_bits is None:
+            bits = self.options['wav_sample_bits']
+            if bits == 'auto':
+                bits = min(32, max(16, (self.bitcount + 7) // 8 * 8))
+            self.wav_bits = int(bits)
+
+        # Sign extend the word, align its MSB with the sample's.
+        if sample >> (self.bitcount - 1):
+            sample -= 1 << self.bitcount
+        shift = self.wav_bits - self.bitcount
+        sample = sample << shift if shift >= 0 else sample >> -shift
+        sample = sample.to_bytes(self.wav_bits // 8, 'little', signed=True)
+
+        # Only complete frames get written, starting with a left sample.
+        if left:
+            self.wav_left = sample
+            self.ss_left = self.ss_block
+            return
+        if self.wav_left is None:
+            return
+        if not self.wav_buf:
+            self.wav_ss = self.ss_left
+        self.wav_buf += self.wav_left
+        self.wav_buf += sample
+        self.wav_left = None
+        if len(self.wav_buf) >= WAV_CHUNK_SIZE:
+            self.wav_flush(self.samplenum)
+
+    def wav_flush(self, es):
+        '''Submit the buffered frames, preceded by the header at first.'''
+        if not self.wav_buf:
+            return
+        if self.wav_rate is None:
+            self.wav_rate = self.frame_rate(es)
+            self.put(0, 0, self.out_binary, [0, self.wav_header()])
+        self.put(self.wav_ss, es, self.out_binary, [0, bytes(self.wav_buf)])
+        self.wav_size += len(self.wav_buf)
+        self.wav_buf = bytearray()
+
+    def wav_finish(self):
+        '''Submit the remaining frames and the header with final sizes.'''
+        if not self.wav_buf and self.wav_rate is None:
+            return
+        # The last complete word ended where the current one started.
+        self.wav_flush(self.ss_block)
+        self.wav_rate = self.frame_rate(self.ss_block) or self.wav_rate
+        self.put(0, 0, self.out_binary, [1, self.wav_header(self.wav_size)])
+
+    def flush(self):
+        # Submit the frames of each chunk of input, more may never follow.
+        self.wav_flush(self.ss_block)
 
     def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
         while True:
             # Wait for a rising edge on the SCK pin.
-            sck, ws, sd = self.wait({0: 'r'})
+            try:
+                sck, ws, sd = self.wait({0: 'r'})
+            except EOFError:
+                self.wav_finish()
+                return
 
             self.data = (self.data << 1) | sd
             self.bitcount += 1
@@ -145,10 +233,6 @@ def decode(self):
             # Only submit the sample, if we received the beginning of it.
             if self.ss_block is not None:
 
-                if not self.wrote_wav_header:
-                    self.put(0, 0, self.out_binary, [0, self.wav_header()])
-                    self.wrote_wav_header = True
-
                 self.samplesreceived += 1
 
                 idx = 0 if self.oldws else 1
@@ -159,7 +243,7 @@ def decode(self):
                 self.putpb(['DATA', [c3, self.data]])
                 self.putb([idx, ['%s: %s' % (c1, v), '%s: %s' % (c2, v),
                                  '%s: %s' % (c3, v), c3]])
-                self.putbin([0, self.wav_sample(self.data)])
+                self.wav_sample(self.data, self.oldws)
 
                 # Check that the data word was the correct length.
                 if self.wordlength != -1 and self.wordlength != self.bitcount:
@@ -53,6 +53,35 @@
         'SHIFT-IR', 'EXIT1-IR', 'EXIT2-IR',
 ]
 
+# TAP state transitions upon rising TCK edges: (next if TMS=0, next if TMS=1).
+jtag_transitions = {
+        # Intro "tree"
+        'TEST-LOGIC-RESET': ('RUN-TEST/IDLE', 'TEST-LOGIC-RESET'),
+        'RUN-TEST/IDLE': ('RUN-TEST/IDLE', 'SELECT-DR-SCAN'),
+        # DR "tree"
+        'SELECT-DR-SCAN': ('CAPTURE-DR', 'SELECT-IR-SCAN'),
+        'CAPTURE-DR': ('SHIFT-DR', 'EXIT1-DR'),
+        'SHIFT-DR': ('SHIFT-DR', 'EXIT1-DR'),
+        'EXIT1-DR': ('PAUSE-DR', 'UPDATE-DR'),
+        'PAUSE-DR': ('PAUSE-DR', 'EXIT2-DR'),
+        'EXIT2-DR': ('SHIFT-DR', 'UPDATE-DR'),
+        'UPDATE-DR': ('RUN-TEST/IDLE', 'SELECT-DR-SCAN'),
+        # IR "tree"
+        'SELECT-IR-SCAN': ('CAPTURE-IR', 'TEST-LOGIC-RESET'),
+        'CAPTURE-IR': ('SHIFT-IR', 'EXIT1-IR'),
+        'SHIFT-IR': ('SHIFT-IR', 'EXIT1-IR'),
+        'EXIT1-IR': ('PAUSE-IR', 'UPDATE-IR'),
+        'PAUSE-IR': ('PAUSE-IR', 'EXIT2-IR'),
+        'EXIT2-IR': ('SHIFT-IR', 'UPDATE-IR'),
+        'UPDATE-IR': ('RUN-TEST/IDLE', 'SELECT-DR-SCAN'),
+}
+
+# The same as a table of state indices, indexed by state index and TMS.
+next_state = [[jtag_states.index(n) for n in jtag_transitions[s]]
+              for s in jtag_states]
+shift_states = [i for i, s in enumerate(jtag_states) if s.startswith('SHIFT-')]
+exit1_states = [i for i, s in enumerate(jtag_states) if s.startswith('EXIT1-')]
+
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'jtag'
@@ -88,13 +117,13 @@ class Decoder(srd.Decoder):
     )
 
     def __init__(self):
-        # self.state = 'TEST-LOGIC-RESET'
-        self.state = 'RUN-TEST/IDLE'
+        # self.state = jtag_states.index('TEST-LOGIC-RESET')
+        self.state = jtag_states.index('RUN-TEST/IDLE')
         self.oldstate = None
-        self.bits_tdi = []
-        self.bits_tdo = []
-        self.bits_samplenums_tdi = []
-        self.bits_samplenums_tdo = []
+        # TDI/TDO bits ('0'/'1') of the current SHIFT-* state, LSB first.
+        self.bits_tdi = bytearray()
+        self.bits_tdo = bytearray()
+        self.bits_ss = []
         self.ss_item = self.es_item = None
         self.ss_bitstring = self.es_bitstring = None
         self.saved_item = None
@@ -117,52 +146,34 @@ def putx_bs(self, data):
     def putp_bs(self, data):
         self.put(self.ss_bitstring, self.es_bitstring, self.out_python, data)
 
-    def advance_state_machine(self, tms):
-        self.oldstate = self.state
-
-        # Intro "tree"
-        if self.state == 'TEST-LOGIC-RESET':
-            self.state = 'TEST-LOGIC-RESET' if (tms) else 'RUN-TEST/IDLE'
-        elif self.state == 'RUN-TEST/IDLE':
-            self.state = 'SELECT-DR-SCAN' if (tms) else 'RUN-TEST/IDLE'
-
-        # DR "tree"
-        elif self.state == 'SELECT-DR-SCAN':
-            self.state = 'SELECT-IR-SCAN' if (tms) else 'CAPTURE-DR'
-        elif self.state == 'CAPTURE-DR':
-            self.state = 'EXIT1-DR' if (tms) else 'SHIFT-DR'
-        elif self.state == 'SHIFT-DR':
-            self.state = 'EXIT1-DR' if (tms) else 'SHIFT-DR'
-        elif self.state == 'EXIT1-DR':
-            self.state = 'UPDATE-DR' if (tms) else 'PAUSE-DR'
-        elif self.state == 'PAUSE-DR':
-            self.state = 'EXIT2-DR' if (tms) else 'PAUSE-DR'
-        elif self.state == 'EXIT2-DR':
-            self.state = 'UPDATE-DR' if (tms) else 'SHIFT-DR'
-        elif self.state == 'UPDATE-DR':
-            self.state = 'SELECT-DR-SCAN' if (tms) else 'RUN-TEST/IDLE'
-
-        # IR "tree"
-        elif self.state == 'SELECT-IR-SCAN':
-            self.state = 'TEST-LOGIC-RESET' if (tms) else 'CAPTURE-IR'
-        elif self.state == 'CAPTURE-IR':
-            self.state = 'EXIT1-IR' if (tms) else 'SHIFT-IR'
-        elif self.state == 'SHIFT-IR':
-            self.state = 'EXIT1-IR' if (tms) else 'SHIFT-IR'
-        elif self.state == 'EXIT1-IR':
-            self.state = 'UPDATE-IR' if (tms) else 'PAUSE-IR'
-        elif self.state == 'PAUSE-IR':
-            self.state = 'EXIT2-IR' if (tms) else 'PAUSE-IR'
-        elif self.state == 'EXIT2-IR':
-            self.state = 'UPDATE-IR' if (tms) else 'SHIFT-IR'
-        elif self.state == 'UPDATE-IR':
-            self.state = 'SELECT-DR-SCAN' if (tms) else 'RUN-TEST/IDLE'
+    def put_bitstrings(self):
+        # Each bit ends where the next one starts, the last one ends here.
+        ss = self.bits_ss
+        es = ss[1:] + [self.samplenum]
+        n = len(ss)
+        reg = jtag_states[self.state][-2:]
+
+        for (t, bits, ann_bs, ann_bit) in (
+                (reg + ' TDI', self.bits_tdi, 18, 16),
+                (reg + ' TDO', self.bits_tdo, 19, 17)):
+            # The right-most character of the bitstring is the LSB.
+            b = bits[::-1].decode()
+            s = '%s: %s (0x%x), %d bits' % (t, b, int(b, 2), n)
+            self.putx_bs([ann_bs, [s]])
+            # Like the bitstring, the list of ss/es values starts at the MSB.
+            self.putp_bs([t, [b, [[ss[i], es[i]] for i in range(n - 1, -1, -1)]]])
+            self.putx([ann_bit, [b[0]]]) # Last bit.
+
+        self.bits_tdi = bytearray()
+        self.bits_tdo = bytearray()
+        self.bits_ss = []
 
     def handle_rising_tck_edge(self, pins):
         (tdi, tdo, tck, tms, trst, srst, rtck) = pins
 
         # Rising TCK edges always advance the state machine.
-        self.advance_state_machine(tms)
+        self.oldstate = oldstate = self.state
+        self.state = state = next_state[oldstate][tms]
 
         if self.first:
             # Save the start sample and item for later (no output yet).
@@ -172,58 +183,29 @@ def handle_rising_tck_edge(self, pins):
             # Output the saved item (from the last CLK edge to the current).
             self.es_item = self.samplenum
             # Output the old state (from last rising TCK edge to current one).
-            self.putx([jtag_states.index(self.oldstate), [self.oldstate]])
-            self.putp(['NEW STATE', self.state])
+            self.putx([oldstate, [jtag_states[oldstate]]])
+            self.putp(['NEW STATE', jtag_states[state]])
 
         # Upon SHIFT-IR/SHIFT-DR collect the current TDI/TDO values.
-        if self.state.startswith('SHIFT-'):
+        if state in shift_states:
             if self.first_bit:
                 self.ss_bitstring = self.samplenum
                 self.first_bit = False
             else:
-                self.putx([16, [str(self.bits_tdi[0])]])
-                self.putx([17, [str(self.bits_tdo[0])]])
-                # Use self.samplenum as ES of the previous bit.
-                self.bits_samplenums_tdi[0][1] = self.samplenum
-                self.bits_samplenums_tdo[0][1] = self.samplenum
+                self.putx([16, [chr(self.bits_tdi[-1])]])
+                self.putx([17, [chr(self.bits_tdo[-1])]])
 
-            self.bits_tdi.insert(0, tdi)
-            self.bits_tdo.insert(0, tdo)
+            self.bits_tdi.append(0x30 + tdi)
+            self.bits_tdo.append(0x30 + tdo)
 
             # Use self.samplenum as SS of the current bit.
-            self.bits_samplenums_tdi.insert(0, [self.samplenum, -1])
-            self.bits_samplenums_tdo.insert(0, [self.samplenum, -1])
+            self.bits_ss.append(self.samplenum)
 
         # Output all TDI/TDO bits if we just switched from SHIFT-* to EXIT1-*.
-        if self.oldstate.startswith('SHIFT-') and \
-           self.state.startswith('EXIT1-'):
-
+        if oldstate in shift_states and state in exit1_states:
             self.es_bitstring = self.samplenum
-
-            t = self.state[-2:] + ' TDI'
-            b = ''.join(map(str, self.bits_tdi))
-            h = ' (0x%x' % int('0b' + b, 2) + ')'
-            s = t + ': ' + b + h + ', ' + str(len(self.bits_tdi)) + ' bits'
-            self.putx_bs([18, [s]])
-            self.bits_samplenums_tdi[0][1] = self.samplenum # ES of last bit.
-            self.putp_bs([t, [b, self.bits_samplenums_tdi]])
-            self.putx([16, [str(self.bits_tdi[0])]]) # Last bit.
-            self.bits_tdi = []
-            self.bits_samplenums_tdi = []
-
-            t = self.state[-2:] + ' TDO'
-            b = ''.join(map(str, self.bits_tdo))
-            h = ' (0x%x' % int('0b' + b, 2) + ')'
-            s = t + ': ' + b + h + ', ' + str(len(self.bits_tdo)) + ' bits'
-            self.putx_bs([19, [s]])
-            self.bits_samplenums_tdo[0][1] = self.samplenum # ES of last bit.
-            self.putp_bs([t, [b, self.bits_samplenums_tdo]])
-            self.putx([17, [str(self.bits_tdo[0])]]) # Last bit.
-            self.bits_tdo = []
-            self.bits_samplenums_tdo = []
-
+            self.put_bitstrings()
             self.first_bit = True
-
             self.ss_bitstring = self.samplenum
 
         self.ss_item = self.samplenum
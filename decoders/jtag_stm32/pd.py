@@ -24,11 +24,11 @@
 #       as it does not implement the EXTEST, SAMPLE, and PRELOAD instructions.
 #       Instead, BYPASS is decoded for any of these instructions.
 ir = {
-    '1111': ['BYPASS', 1],  # Bypass register
-    '1110': ['IDCODE', 32], # ID code register
-    '1010': ['DPACC', 35],  # Debug port access register
-    '1011': ['APACC', 35],  # Access port access register
-    '1000': ['ABORT', 35],  # Abort register # TODO: 32 bits? Datasheet typo?
+    0b1111: ['BYPASS', 1],  # Bypass register
+    0b1110: ['IDCODE', 32], # ID code register
+    0b1010: ['DPACC', 35],  # Debug port access register
+    0b1011: ['APACC', 35],  # Access port access register
+    0b1000: ['ABORT', 35],  # Abort register # TODO: 32 bits? Datasheet typo?
 }
 
 # ARM Cortex-M3 r1p1-01rel0 ID code
@@ -63,16 +63,16 @@
 
 # ACK[2:0] in the DPACC/APACC registers (unlisted values are reserved)
 ack_val = {
-    '001': 'WAIT',
-    '010': 'OK/FAULT',
+    0b001: 'WAIT',
+    0b010: 'OK/FAULT',
 }
 
 # 32bit debug port registers (addressed via A[3:2])
 dp_reg = {
-    '00': 'Reserved', # Must be kept at reset value
-    '01': 'DP CTRL/STAT',
-    '10': 'DP SELECT',
-    '11': 'DP RDBUFF',
+    0b00: 'Reserved', # Must be kept at reset value
+    0b01: 'DP CTRL/STAT',
+    0b10: 'DP SELECT',
+    0b11: 'DP RDBUFF',
 }
 
 # APB-AP registers (each of them 32 bits wide)
@@ -100,12 +100,12 @@
 #              Bits[11:8]: Continuation code ('ARM Ltd.': 0x04)
 #              Bits[7:1]: Identity code ('ARM Ltd.': 0x3b)
 # Bits[0:0]:   Reserved (here: 0x1)
-def decode_device_id_code(bits):
-    id_hex = '0x%x' % int('0b' + bits, 2)
-    ver = cm3_idcode_ver.get(int('0b' + bits[-32:-28], 2), 'UNKNOWN')
-    part = cm3_idcode_part.get(int('0b' + bits[-28:-12], 2), 'UNKNOWN')
-    ids = jedec_id.get(int('0b' + bits[-12:-8], 2) + 1, {})
-    manuf = ids.get(int('0b' + bits[-7:-1], 2), 'UNKNOWN')
+def decode_device_id_code(value):
+    id_hex = '0x%x' % value
+    ver = cm3_idcode_ver.get((value >> 28) & 0xf, 'UNKNOWN')
+    part = cm3_idcode_part.get((value >> 12) & 0xffff, 'UNKNOWN')
+    ids = jedec_id.get(((value >> 8) & 0xf) + 1, {})
+    manuf = ids.get((value >> 1) & 0x3f, 'UNKNOWN')
     return (id_hex, manuf, ver, part)
 
 # DPACC is used to access debug port registers (CTRL/STAT, SELECT, RDBUFF).
@@ -115,20 +115,20 @@ def decode_device_id_code(bits):
 # Bits[34:3] = DATA[31:0]: 32bit data to transfer (write request)
 # Bits[2:1] = A[3:2]: 2-bit address (debug/access port register)
 # Bits[0:0] = RnW: Read request (1) or write request (0)
-def data_in(instruction, bits):
-    data, a, rnw = bits[:-3], bits[-3:-1], bits[-1]
-    data_hex = '0x%x' % int('0b' + data, 2)
-    r = 'Read request' if (rnw == '1') else 'Write request'
+def data_in(instruction, value):
+    data, a, rnw = value >> 3, (value >> 1) & 0x3, value & 0x1
+    data_hex = '0x%x' % data
+    r = 'Read request' if (rnw == 1) else 'Write request'
     # reg = dp_reg[a] if (instruction == 'DPACC') else apb_ap_reg[a]
-    reg = dp_reg[a] if (instruction == 'DPACC') else a # TODO
+    reg = dp_reg[a] if (instruction == 'DPACC') else '{:02b}'.format(a) # TODO
     return 'New transaction: DATA: %s, A: %s, RnW: %s' % (data_hex, reg, r)
 
 # APACC/DPACC, when transferring data OUT:
 # Bits[34:3] = DATA[31:0]: 32bit data which is read (read request)
 # Bits[2:0] = ACK[2:0]: 3-bit acknowledge
-def data_out(bits):
-    data, ack = bits[:-3], bits[-3:]
-    data_hex = '0x%x' % int('0b' + data, 2)
+def data_out(value):
+    data, ack = value >> 3, value & 0x7
+    data_hex = '0x%x' % data
     ack_meaning = ack_val.get(ack, 'Reserved')
     return 'Previous transaction result: DATA: %s, ACK: %s' \
            % (data_hex, ack_meaning)
@@ -168,16 +168,19 @@ def putx(self, data):
     def putf(self, s, e, data):
         self.put(self.samplenums[s][0], self.samplenums[e][1], self.out_ann, data)
 
-    def handle_reg_bypass(self, cmd, bits):
+    # The handlers get the bitstring, and its value without the LSB (which
+    # is the bypass bit of the boundary scan TAP).
+
+    def handle_reg_bypass(self, cmd, bits, value):
         self.putx([0, ['BYPASS: ' + bits]])
 
-    def handle_reg_idcode(self, cmd, bits):
+    def handle_reg_idcode(self, cmd, bits, value):
         # IDCODE is a read-only register which is always accessible.
         # IR == IDCODE: The 32bit device ID code is shifted out via DR next.
 
-        id_hex, manuf, ver, part = decode_device_id_code(bits[:-1])
-        cc = '0x%x' % int('0b' + bits[:-1][-12:-8], 2)
-        ic = '0x%x' % int('0b' + bits[:-1][-7:-1], 2)
+        id_hex, manuf, ver, part = decode_device_id_code(value)
+        cc = '0x%x' % ((value >> 8) & 0xf)
+        ic = '0x%x' % ((value >> 1) & 0x3f)
 
         self.putf(0, 0, [1, ['Reserved (BS TAP)', 'BS', 'B']])
         self.putf(1, 1, [1, ['Reserved', 'Res', 'R']])
@@ -189,19 +192,17 @@ def handle_reg_idcode(self, cmd, bits):
 
         self.ss = self.samplenums[1][0]
         self.putx([2, ['IDCODE: %s (%s: %s/%s)' % \
-                  decode_device_id_code(bits[:-1])]])
+                  decode_device_id_code(value)]])
 
-    def handle_reg_dpacc(self, cmd, bits):
-        bits = bits[:-1]
-        s = data_in('DPACC', bits) if (cmd == 'DR TDI') else data_out(bits)
+    def handle_reg_dpacc(self, cmd, bits, value):
+        s = data_in('DPACC', value) if (cmd == 'DR TDI') else data_out(value)
         self.putx([2, [s]])
 
-    def handle_reg_apacc(self, cmd, bits):
-        bits = bits[:-1]
-        s = data_in('APACC', bits) if (cmd == 'DR TDI') else data_out(bits)
+    def handle_reg_apacc(self, cmd, bits, value):
+        s = data_in('APACC', value) if (cmd == 'DR TDI') else data_out(value)
         self.putx([2, [s]])
 
-    def handle_reg_abort(self, cmd, bits):
+    def handle_reg_abort(self, cmd, bits, value):
         bits = bits[:-1]
         # Bits[31:1]: reserved. Bit[0]: DAPABORT.
         a = '' if (bits[0] == '1') else 'No '
@@ -209,10 +210,10 @@ def handle_reg_abort(self, cmd, bits):
         self.putx([2, [s]])
 
         # Warn if DAPABORT[31:1] contains non-zero bits.
-        if (bits[:-1] != ('0' * 31)):
+        if len(bits) != 32 or (value >> 1):
             self.putx([3, ['WARNING: DAPABORT[31:1] reserved!']])
 
-    def handle_reg_unknown(self, cmd, bits):
+    def handle_reg_unknown(self, cmd, bits, value):
         bits = bits[:-1]
         self.putx([2, ['Unknown instruction: %s' % bits]])
 
@@ -225,6 +226,8 @@ def decode(self, ss, es, data):
             # The right-most char in the 'val' bitstring is the LSB.
             val, self.samplenums = val
             self.samplenums.reverse()
+            # Convert once, the handlers extract fields by shifting.
+            value = int(val, 2) >> 1
 
         # State machine
         if self.state == 'IDLE':
@@ -235,8 +238,8 @@ def decode(self, ss, es, data):
             # The STM32F10xxx has two serially connected JTAG TAPs, the
             # boundary scan tap (5 bits) and the Cortex-M3 TAP (4 bits).
             # See UM 31.5 "STM32F10xxx JTAG TAP connection" for details.
-            self.state = ir.get(val[:-1][-4:], ['UNKNOWN', 0])[0]
-            bstap_ir = ir.get(val[:-1][:4], ['UNKNOWN', 0])[0]
+            self.state = ir.get(value & 0xf, ['UNKNOWN', 0])[0]
+            bstap_ir = ir.get(value >> max(len(val) - 5, 0), ['UNKNOWN', 0])[0]
             self.putf(5, 8, [1, ['IR (BS TAP): ' + bstap_ir]])
             self.putf(1, 4, [1, ['IR (M3 TAP): ' + self.state]])
             self.putf(0, 0, [1, ['Reserved (BS TAP)', 'BS', 'B']])
@@ -246,20 +249,20 @@ def decode(self, ss, es, data):
             if cmd != 'DR TDI':
                 return
             handle_reg = getattr(self, 'handle_reg_%s' % self.state.lower())
-            handle_reg(cmd, val)
+            handle_reg(cmd, val, value)
             self.state = 'IDLE'
         elif self.state in ('IDCODE', 'ABORT', 'UNKNOWN'):
             # Here we're interested in outgoing bits (TDO).
             if cmd != 'DR TDO':
                 return
             handle_reg = getattr(self, 'handle_reg_%s' % self.state.lower())
-            handle_reg(cmd, val)
+            handle_reg(cmd, val, value)
             self.state = 'IDLE'
         elif self.state in ('DPACC', 'APACC'):
             # Here we're interested in incoming and outgoing bits (TDI/TDO).
             if cmd not in ('DR TDI', 'DR TDO'):
                 return
             handle_reg = getattr(self, 'handle_reg_%s' % self.state.lower())
-            handle_reg(cmd, val)
+            handle_reg(cmd, val, value)
             if cmd == 'DR TDO': # Assumes 'DR TDI' comes before 'DR TDO'.
                 self.state = 'IDLE'
@@ -19,6 +19,7 @@
 
 import sigrokdecode as srd
 from collections import namedtuple
+from common.crc import parity
 
 class Ann:
     BIT, START, STOP, PARITY_OK, PARITY_ERR, DATA, WORD = range(7)
@@ -95,7 +96,7 @@ def handle_bits(self, datapin):
             word |= (self.bits[i + 1].val << i)
 
         # Calculate parity.
-        parity_ok = (bin(word).count('1') + self.bits[9].val) % 2 == 1
+        parity_ok = parity(word) != self.bits[9].val
 
         # Emit annotations.
         for i in range(11):
@@ -18,10 +18,15 @@
 ##
 
 import sigrokdecode as srd
+from common.pulsewidth import PulseWidths
 
 class SamplerateError(Exception):
     pass
 
+# Pulse types of the half, full and 1.5 bit cell pulse widths: a '1' bit
+# (two half cell pulses), a '0' bit, and a preamble pulse.
+PULSE_TYPES = (1, 0, 2)
+
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'spdif'
@@ -58,15 +63,17 @@ def puty(self, data):
         self.put(self.ss_edge, self.samplenum, self.out_ann, data)
 
     def __init__(self):
-        self.state = 'GET FIRST PULSE WIDTH'
+        self.state = 'GET PULSE WIDTHS'
         self.ss_edge = None
         self.first_edge = True
         self.samplenum_prev_edge = 0
         self.pulse_width = 0
+        self.pulse = -1
 
-        self.clocks = []
-        self.range1 = 0
-        self.range2 = 0
+        # Pulse widths get learned from a histogram, and then tracked. The
+        # pulses which they were learned from get decoded afterwards.
+        self.widths = PulseWidths(3, learn=256)
+        self.learned = []
 
         self.preamble_state = 0
         self.preamble = []
@@ -84,38 +91,16 @@ def metadata(self, key, value):
             self.samplerate = value
 
     def get_pulse_type(self):
-        if self.range1 == 0 or self.range2 == 0:
-            return -1
-        if self.pulse_width >= self.range2:
-            return 2
-        elif self.pulse_width >= self.range1:
-            return 0
-        else:
-            return 1
-
-    def find_first_pulse_width(self):
-        if self.pulse_width != 0:
-            self.clocks.append(self.pulse_width)
-            self.state = 'GET SECOND PULSE WIDTH'
-
-    def find_second_pulse_width(self):
-        if self.pulse_width > (self.clocks[0] * 1.3) or \
-                self.pulse_width < (self.clocks[0] * 0.7):
-            self.clocks.append(self.pulse_width)
-            self.state = 'GET THIRD PULSE WIDTH'
-
-    def find_third_pulse_width(self):
-        if not ((self.pulse_width > (self.clocks[0] * 1.3) or \
-                self.pulse_width < (self.clocks[0] * 0.7)) \
-                and (self.pulse_width > (self.clocks[1] * 1.3) or \
-                self.pulse_width < (self.clocks[1] * 0.7))):
+        return self.pulse
+
+    def find_pulse_widths(self):
+        self.learned.append((self.samplenum, self.pulse_width))
+        if self.widths.centers is None:
+            # Only keep the pulses which are still in the histogram.
+            del self.learned[:len(self.learned) - self.widths.num_learned]
             return
 
-        self.clocks.append(self.pulse_width)
-        self.clocks.sort()
-        self.range1 = (self.clocks[0] + self.clocks[1]) / 2
-        self.range2 = (self.clocks[1] + self.clocks[2]) / 2
-        spdif_bitrate = int(self.samplerate / (self.clocks[2] / 1.5))
+        spdif_bitrate = int(self.samplerate / (self.widths.centers[2] / 1.5))
         self.ss_edge = 0
 
         self.puty([0, ['Signal Bitrate: %d Mbit/s (=> %d kHz)' % \
@@ -128,12 +113,24 @@ def find_third_pulse_width(self):
         # We are done recovering the clock, now let's decode the data stream.
         self.state = 'DECODE STREAM'
 
+        # Decode the pulses up to here, with the widths learned from them.
+        samplenum = self.samplenum
+        for self.samplenum, self.pulse_width in self.learned:
+            self.pulse = PULSE_TYPES[self.widths.classify(self.pulse_width)]
+            self.decode_pulse()
+        self.samplenum = samplenum
+        self.learned = []
+
     def decode_stream(self):
         pulse = self.get_pulse_type()
 
-        if not self.seen_preamble:
-            # This is probably the start of a preamble, decode it.
+        if not self.seen_preamble or pulse == 2:
+            # This is probably the start of a preamble, decode it. Data bits
+            # don't have pulses this long, so a subframe which has one is
+            # misaligned (e.g. at the start of the capture), drop it.
             if pulse == 2:
+                self.subframe = []
+                self.seen_preamble = False
                 self.preamble.append(self.get_pulse_type())
                 self.state = 'DECODE PREAMBLE'
                 self.ss_edge = self.samplenum - self.pulse_width - 1
@@ -157,26 +154,25 @@ def decode_stream(self):
             self.bitcount += 1
 
         if self.bitcount == 28:
+            # The bits are sent LSB first: sam_rot is the audio value,
+            # sam the bits in the order in which they were received.
             aux_audio_data = self.subframe[0:4]
-            sam, sam_rot = '', ''
-            for a in aux_audio_data:
-                sam = sam + str(a[0])
-                sam_rot = str(a[0]) + sam_rot
             sample = self.subframe[4:24]
-            for s in sample:
-                sam = sam + str(s[0])
-                sam_rot = str(s[0]) + sam_rot
+            sam, sam_rot = 0, 0
+            for i, s in enumerate(self.subframe[0:24]):
+                sam = (sam << 1) | s[0]
+                sam_rot |= s[0] << i
             validity = self.subframe[24:25]
             subcode_data = self.subframe[25:26]
             channel_status = self.subframe[26:27]
             parity = self.subframe[27:28]
 
             self.putx(aux_audio_data[0][1], aux_audio_data[3][2], \
-                      [3, ['Aux 0x%x' % int(sam, 2), '0x%x' % int(sam, 2)]])
+                      [3, ['Aux 0x%x' % sam, '0x%x' % sam]])
             self.putx(sample[0][1], sample[19][2], \
-                      [3, ['Sample 0x%x' % int(sam, 2), '0x%x' % int(sam, 2)]])
+                      [3, ['Sample 0x%x' % sam, '0x%x' % sam]])
             self.putx(aux_audio_data[0][1], sample[19][2], \
-                      [4, ['Audio 0x%x' % int(sam_rot, 2), '0x%x' % int(sam_rot, 2)]])
+                      [4, ['Audio 0x%x' % sam_rot, '0x%x' % sam_rot]])
             if validity[0][0] == 0:
                 self.putx(validity[0][1], validity[0][2], [5, ['V']])
             else:
@@ -217,26 +213,29 @@ def decode_preamble(self):
 
         self.last_preamble = self.samplenum
 
+    def decode_pulse(self):
+        if self.state == 'DECODE STREAM':
+            self.decode_stream()
+        elif self.state == 'DECODE PREAMBLE':
+            self.decode_preamble()
+
     def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
 
         # Throw away first detected edge as it might be mangled data.
         self.wait({0: 'e'})
+        self.samplenum_prev_edge = self.samplenum
 
         while True:
             # Wait for any edge (rising or falling).
             (data,) = self.wait({0: 'e'})
             self.pulse_width = self.samplenum - self.samplenum_prev_edge - 1
             self.samplenum_prev_edge = self.samplenum
+            pulse = self.widths.add(self.pulse_width)
+            self.pulse = -1 if pulse is None else PULSE_TYPES[pulse]
 
-            if self.state == 'GET FIRST PULSE WIDTH':
-                self.find_first_pulse_width()
-            elif self.state == 'GET SECOND PULSE WIDTH':
-                self.find_second_pulse_width()
-            elif self.state == 'GET THIRD PULSE WIDTH':
-                self.find_third_pulse_width()
-            elif self.state == 'DECODE STREAM':
-                self.decode_stream()
-            elif self.state == 'DECODE PREAMBLE':
-                self.decode_preamble()
+            if self.state == 'GET PULSE WIDTHS':
+                self.find_pulse_widths()
+            else:
+                self.decode_pulse()
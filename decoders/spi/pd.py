@@ -174,19 +174,19 @@ def putdata(self):
         if self.have_mosi:
             self.mosibytes.append(Data(ss=ss, es=es, val=si))
 
-        # Bit annotations.
+        # Bit and dataword annotations, submitted in one go.
+        anns = []
         if self.have_miso:
-            for bit in self.misobits:
-                self.put(bit[1], bit[2], self.out_ann, [2, ['%d' % bit[0]]])
+            anns.extend((bit[1], bit[2], self.out_ann, [2, ['%d' % bit[0]]])
+                        for bit in self.misobits)
         if self.have_mosi:
-            for bit in self.mosibits:
-                self.put(bit[1], bit[2], self.out_ann, [3, ['%d' % bit[0]]])
-
-        # Dataword annotations.
+            anns.extend((bit[1], bit[2], self.out_ann, [3, ['%d' % bit[0]]])
+                        for bit in self.mosibits)
         if self.have_miso:
-            self.put(ss, es, self.out_ann, [0, ['%02X' % self.misodata]])
+            anns.append((ss, es, self.out_ann, [0, ['%02X' % self.misodata]]))
         if self.have_mosi:
-            self.put(ss, es, self.out_ann, [1, ['%02X' % self.mosidata]])
+            anns.append((ss, es, self.out_ann, [1, ['%02X' % self.mosidata]]))
+        self.put_many(anns)
 
     def reset_decoder_state(self):
         self.misodata = 0 if self.have_miso else None
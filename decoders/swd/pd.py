@@ -18,7 +18,7 @@
 ##
 
 import sigrokdecode as srd
-import re
+from collections import deque
 
 '''
 OUTPUT_PYTHON format:
@@ -46,10 +46,30 @@
     'DPARITY', # Data parity phase
 ]
 
-# Regexes for matching SWD data out of bitstring ('1' / '0' characters) format
-RE_SWDSWITCH = re.compile(bin(0xE79E)[:1:-1] + '$')
-RE_SWDREQ = re.compile(r'1(?P<apdp>.)(?P<rw>.)(?P<addr>..)(?P<parity>.)01$')
-RE_IDLE = re.compile('0' * 50 + '$')
+# SWDIO bits get shifted into an integer from the right, the most recent bit
+# is bit 0. Only the last BITS_WINDOW bits are kept, the longest sequence
+# which gets matched is the 32 bit data phase.
+BITS_WINDOW = 32
+BITS_MASK = (1 << BITS_WINDOW) - 1
+
+# JTAG->SWD sequence 0xE79E, LSB first: the last 16 bits.
+SWDSWITCH_BITS = 16
+SWDSWITCH = int(bin(0xE79E)[:1:-1], 2)
+SWDSWITCH_MASK = (1 << SWDSWITCH_BITS) - 1
+
+# Request: start (1), APnDP, RnW, A[2:3], parity, stop (0), park (1).
+SWDREQ_BITS = 8
+SWDREQ = 0b10000001
+SWDREQ_MASK = 0b10000011
+
+# Ack values, first bit received in bit 2.
+ACK_OK = 0b100
+ACK_WAIT = 0b010
+ACK_FAULT = 0b001
+ACK_NOREPLY = 0b111
+
+# Number of high SWDIO bits which make a line reset.
+LINERESET_BITS = 50
 
 # Sample edges
 RISING = 1
@@ -98,9 +118,10 @@ def __init__(self):
         self.ack = None # Ack state of the current phase
         self.ss_req = 0 # Start sample of current req
         self.turnaround = 0 # Number of turnaround edges to ignore before continuing
-        self.bits = '' # Bits from SWDIO are accumulated here, matched against expected sequences
-        self.samplenums = [] # Sample numbers that correspond to the samples in self.bits
+        self.bits = 0 # Bits from SWDIO are shifted in here, matched against expected sequences
+        self.samplenums = deque(maxlen=BITS_WINDOW) # Sample numbers of the bits in self.bits
         self.linereset_count = 0
+        self.ss_linereset = 0 # Start sample of the current run of high bits
 
         # SWD debug port state
         self.data = None
@@ -117,11 +138,15 @@ def start(self):
 
     def putx(self, ann, length, data):
         '''Output annotated data.'''
-        ann = ANNOTATIONS.index(ann)
         try:
             ss = self.samplenums[-length]
         except IndexError:
             ss = self.samplenums[0]
+        self.putss(ss, ann, data)
+
+    def putss(self, ss, ann, data):
+        '''Output annotated data, starting at sample ss.'''
+        ann = ANNOTATIONS.index(ann)
         if self.state == 'REQ':
             self.ss_req = ss
         es = self.samplenum
@@ -149,10 +174,12 @@ def decode(self):
             # as a line reset (50+ high edges) can happen from any state.
             if clk == RISING:
                 if dio == 1:
+                    if self.linereset_count == 0:
+                        self.ss_linereset = self.samplenum
                     self.linereset_count += 1
                 else:
-                    if self.linereset_count >= 50:
-                        self.putx('reset', self.linereset_count, 'LINERESET')
+                    if self.linereset_count >= LINERESET_BITS:
+                        self.putss(self.ss_linereset, 'reset', 'LINERESET')
                         self.putp('LINE_RESET', None)
                         self.reset_state()
                     self.linereset_count = 0
@@ -167,7 +194,7 @@ def decode(self):
                 self.turnaround -= 1
                 continue
 
-            self.bits += str(dio)
+            self.bits = ((self.bits << 1) | dio) & BITS_MASK
             self.samplenums.append(self.samplenum)
             {
                 'UNKNOWN': self.handle_unknown_edge,
@@ -179,8 +206,8 @@ def decode(self):
 
     def next_state(self):
         '''Step to the next SWD state, reset internal counters accordingly.'''
-        self.bits = ''
-        self.samplenums = []
+        self.bits = 0
+        self.samplenums.clear()
         self.linereset_count = 0
         if self.state == 'UNKNOWN':
             self.state = 'REQ'
@@ -207,8 +234,8 @@ def reset_state(self):
         if self.state != 'REQ': # Emit a Python data item.
             self.put_python_data()
         # Clear state.
-        self.bits = ''
-        self.samplenums = []
+        self.bits = 0
+        self.samplenums.clear()
         self.linereset_count = 0
         self.turnaround = 0
         self.sample_edge = RISING
@@ -226,34 +253,38 @@ def handle_unknown_edge(self):
 
     def handle_req_edge(self):
         '''Clock edge in the REQ state (waiting for SWD r/w request).'''
+        nbits = len(self.samplenums)
+
         # Check for a JTAG->SWD enable sequence.
-        m = re.search(RE_SWDSWITCH, self.bits)
-        if m is not None:
-            self.putx('enable', 16, 'JTAG->SWD')
+        if nbits >= SWDSWITCH_BITS and \
+                self.bits & SWDSWITCH_MASK == SWDSWITCH:
+            self.putx('enable', SWDSWITCH_BITS, 'JTAG->SWD')
             self.reset_state()
             return
 
         # Or a valid SWD Request packet.
-        m = re.search(RE_SWDREQ, self.bits)
-        if m is not None:
-            calc_parity = sum([int(x) for x in m.group('rw') + m.group('apdp') + m.group('addr')]) % 2
-            parity = '' if str(calc_parity) == m.group('parity') else 'E'
-            self.rw = 'R' if m.group('rw') == '1' else 'W'
-            self.apdp = 'AP' if m.group('apdp') == '1' else 'DP'
-            self.addr = int(m.group('addr')[::-1], 2) << 2
+        if nbits >= SWDREQ_BITS and self.bits & SWDREQ_MASK == SWDREQ:
+            apdp = (self.bits >> 6) & 1
+            rw = (self.bits >> 5) & 1
+            addr = ((self.bits >> 4) & 1) | ((self.bits >> 2) & 2)
+            calc_parity = (apdp + rw + bin(addr).count('1')) % 2
+            parity = '' if calc_parity == (self.bits >> 2) & 1 else 'E'
+            self.rw = 'R' if rw else 'W'
+            self.apdp = 'AP' if apdp else 'DP'
+            self.addr = addr << 2
             self.putx('read' if self.rw == 'R' else 'write', 8, self.get_address_description())
             self.next_state()
             return
 
     def handle_ack_edge(self):
         '''Clock edge in the ACK state (waiting for complete ACK sequence).'''
-        if len(self.bits) < 3:
+        if len(self.samplenums) < 3:
             return
-        if self.bits == '100':
+        if self.bits == ACK_OK:
             self.putx('ack', 3, 'OK')
             self.ack = 'OK'
             self.next_state()
-        elif self.bits == '001':
+        elif self.bits == ACK_FAULT:
             self.putx('ack', 3, 'FAULT')
             self.ack = 'FAULT'
             if self.orundetect == 1:
@@ -261,7 +292,7 @@ def handle_ack_edge(self):
             else:
                 self.reset_state()
             self.turnaround = 1
-        elif self.bits == '010':
+        elif self.bits == ACK_WAIT:
             self.putx('ack', 3, 'WAIT')
             self.ack = 'WAIT'
             if self.orundetect == 1:
@@ -269,7 +300,7 @@ def handle_ack_edge(self):
             else:
                 self.reset_state()
             self.turnaround = 1
-        elif self.bits == '111':
+        elif self.bits == ACK_NOREPLY:
             self.putx('ack', 3, 'NOREPLY')
             self.ack = 'NOREPLY'
             self.reset_state()
@@ -280,23 +311,19 @@ def handle_ack_edge(self):
 
     def handle_data_edge(self):
         '''Clock edge in the DATA state (waiting for 32 bits to clock past).'''
-        if len(self.bits) < 32:
+        if len(self.samplenums) < 32:
             return
-        self.data = 0
-        self.dparity = 0
-        for x in range(32):
-            if self.bits[x] == '1':
-                self.data += (1 << x)
-                self.dparity += 1
-        self.dparity = self.dparity % 2
+        # The data is sent LSB first, the first bit is in bit 31 of self.bits.
+        self.data = int('{:032b}'.format(self.bits)[::-1], 2)
+        self.dparity = bin(self.data).count('1') % 2
 
         self.putx('data', 32, '0x%08x' % self.data)
         self.next_state()
 
     def handle_dparity_edge(self):
         '''Clock edge in the DPARITY state (clocking in parity bit).'''
-        if str(self.dparity) != self.bits:
-            self.putx('parity', 1, str(self.dparity) + self.bits) # PARITY ERROR
+        if self.dparity != self.bits:
+            self.putx('parity', 1, '%d%d' % (self.dparity, self.bits)) # PARITY ERROR
         elif self.rw == 'W':
             self.handle_completed_write()
         self.next_state()
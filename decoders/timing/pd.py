@@ -20,10 +20,17 @@
 
 import sigrokdecode as srd
 from collections import deque
+from math import ceil, floor, log
 
 class SamplerateError(Exception):
     pass
 
+# Percentiles are accurate to this fraction of the value.
+RELATIVE_ACCURACY = 0.005
+
+# Maximum number of cached annotation texts.
+TEXT_CACHE_SIZE = 4096
+
 def normalize_time(t):
     if abs(t) >= 1.0:
         return '%.3f s  (%.3f Hz)' % (t, (1/t))
@@ -45,6 +52,68 @@ def normalize_time(t):
     else:
         return '%f' % t
 
+def format_duration(t):
+    for limit, unit in ((1.0, 's'), (1e-3, 'ms'), (1e-6, 'μs'), (1e-9, 'ns')):
+        if abs(t) >= limit:
+            return '%.3f %s' % (t / limit, unit)
+    return '%f' % t
+
+class IntervalStats:
+    '''Streaming statistics of intervals (in samples).
+
+    Count, sum, sum of squares, min and max are exact. Percentiles come
+    from a histogram with logarithmic buckets, which is accurate to
+    RELATIVE_ACCURACY of the value, and stays small for any number of
+    intervals.
+    '''
+
+    def __init__(self, percentiles):
+        self.gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+        self.inv_log_gamma = 1 / log(self.gamma)
+        self.buckets = {} if percentiles else None
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.sum = 0
+        self.sumsq = 0
+        self.min = None
+        self.max = None
+        if self.buckets is not None:
+            self.buckets = {}
+
+    def add(self, x):
+        self.count += 1
+        self.sum += x
+        self.sumsq += x * x
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+        if self.buckets is not None:
+            b = ceil(log(x) * self.inv_log_gamma)
+            self.buckets[b] = self.buckets.get(b, 0) + 1
+
+    def stddev(self):
+        # Exact in integers, the variance can't come out negative.
+        n = self.count
+        return ((n * self.sumsq - self.sum * self.sum) / (n * n)) ** 0.5
+
+    def percentile(self, p):
+        rank = p * (self.count - 1)
+        for b in sorted(self.buckets):
+            rank -= self.buckets[b]
+            if rank < 0:
+                break
+        # The intervals are integers, buckets below 1 / RELATIVE_ACCURACY
+        # samples hold at most one of them.
+        lo, hi = self.gamma ** (b - 1), self.gamma ** b
+        if floor(hi) - floor(lo) == 1:
+            x = floor(hi)
+        else:
+            x = 2 * hi / (self.gamma + 1)
+        return min(max(x, self.min), self.max)
+
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'timing'
@@ -61,25 +130,33 @@ class Decoder(srd.Decoder):
         ('time', 'Time'),
         ('average', 'Average'),
         ('delta', 'Delta'),
+        ('summary', 'Summary'),
     )
     annotation_rows = (
         ('time', 'Time', (0,)),
         ('average', 'Average', (1,)),
         ('delta', 'Delta', (2,)),
+        ('summary', 'Summary', (3,)),
     )
     options = (
         { 'id': 'avg_period', 'desc': 'Averaging period', 'default': 100 },
         { 'id': 'edge', 'desc': 'Edges to check', 'default': 'any', 'values': ('any', 'rising', 'falling') },
         { 'id': 'delta', 'desc': 'Show delta from last', 'default': 'no', 'values': ('yes', 'no') },
+        { 'id': 'summary', 'desc': 'Summarize every N edges (0: annotate each edge)', 'default': 0 },
+        { 'id': 'stats', 'desc': 'Min/max/stddev/percentiles in summaries', 'default': 'no', 'values': ('yes', 'no') },
     )
 
     def __init__(self):
         self.samplerate = None
         self.last_samplenum = None
         self.last_n = deque()
+        self.sum_n = 0
         self.chunks = 0
         self.level_changed = False
-        self.last_t = None
+        self.last_samples = None
+        self.texts = {}
+        self.stats = None
+        self.ss_summary = None
 
     def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
@@ -88,37 +165,95 @@ def metadata(self, key, value):
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
         self.edge = self.options['edge']
+        self.avg_period = self.options['avg_period']
+        self.delta = self.options['delta'] == 'yes'
+        self.summary = self.options['summary']
+        if self.summary > 0 or self.options['stats'] == 'yes':
+            self.stats = IntervalStats(self.options['stats'] == 'yes')
+
+    def time_text(self, num, den=1):
+        '''Return normalize_time() of num / den samples.'''
+        # Clock signals have few distinct intervals, cache their texts.
+        key = (num, den)
+        text = self.texts.get(key)
+        if text is None:
+            if len(self.texts) >= TEXT_CACHE_SIZE:
+                self.texts.clear()
+            text = normalize_time(num / den / self.samplerate)
+            self.texts[key] = text
+        return text
+
+    def put_summary(self):
+        '''Annotate the statistics of the intervals since the last summary.'''
+        s = self.stats
+        if not s.count:
+            return
+        avg = self.time_text(s.sum, s.count)
+        texts = ['%d intervals, average %s' % (s.count, avg), 'Avg. %s' % avg]
+        if s.buckets is not None:
+            rate = self.samplerate
+            fields = ', '.join('%s %s' % (name, format_duration(x / rate))
+                for name, x in (('min', s.min), ('max', s.max),
+                                ('stddev', s.stddev()),
+                                ('p50', s.percentile(0.5)),
+                                ('p90', s.percentile(0.9)),
+                                ('p99', s.percentile(0.99))))
+            texts.insert(0, texts[0] + ', ' + fields)
+        self.put(self.ss_summary, self.last_samplenum, self.out_ann,
+                 [3, texts])
+        s.reset()
 
     def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
+        if self.edge == 'rising':
+            cond = {0: 'r'}
+        elif self.edge == 'falling':
+            cond = {0: 'f'}
+        else:
+            cond = {0: 'e'}
         while True:
-            if self.edge == 'rising':
-                pin = self.wait({0: 'r'})
-            elif self.edge == 'falling':
-                pin = self.wait({0: 'f'})
-            else:
-                pin = self.wait({0: 'e'})
+            try:
+                pin = self.wait(cond)
+            except EOFError:
+                # Summarize the remaining intervals.
+                if self.stats:
+                    self.put_summary()
+                return
 
             if not self.last_samplenum:
                 self.last_samplenum = self.samplenum
                 continue
             samples = self.samplenum - self.last_samplenum
-            t = samples / self.samplerate
 
-            if t > 0:
-                self.last_n.append(t)
-            if len(self.last_n) > self.options['avg_period']:
-                self.last_n.popleft()
+            # Keep a running sum of the last avg_period intervals.
+            if self.avg_period > 0 and samples > 0:
+                self.last_n.append(samples)
+                self.sum_n += samples
+                if len(self.last_n) > self.avg_period:
+                    self.sum_n -= self.last_n.popleft()
+
+            if self.stats:
+                if not self.stats.count:
+                    self.ss_summary = self.last_samplenum
+                self.stats.add(samples)
+
+            if self.summary > 0:
+                if self.stats.count >= self.summary:
+                    self.last_samplenum = self.samplenum
+                    self.put_summary()
+                self.last_samples = samples
+                self.last_samplenum = self.samplenum
+                continue
 
             self.put(self.last_samplenum, self.samplenum, self.out_ann,
-                     [0, [normalize_time(t)]])
-            if self.options['avg_period'] > 0:
+                     [0, [self.time_text(samples)]])
+            if self.avg_period > 0:
                 self.put(self.last_samplenum, self.samplenum, self.out_ann,
-                         [1, [normalize_time(sum(self.last_n) / len(self.last_n))]])
-            if self.last_t and self.options['delta'] == 'yes':
+                         [1, [self.time_text(self.sum_n, len(self.last_n))]])
+            if self.last_samples and self.delta:
                 self.put(self.last_samplenum, self.samplenum, self.out_ann,
-                         [2, [normalize_time(t - self.last_t)]])
+                         [2, [self.time_text(samples - self.last_samples)]])
 
-            self.last_t = t
+            self.last_samples = samples
             self.last_samplenum = self.samplenum
@@ -19,6 +19,7 @@
 
 import sigrokdecode as srd
 from math import floor, ceil
+from common.crc import popcount
 
 '''
 OUTPUT_PYTHON format:
@@ -60,7 +61,7 @@ def parity_ok(parity_type, parity_bit, data, num_data_bits):
         return parity_bit == 1
 
     # Count number of 1 (high) bits in the data (and the parity bit itself!).
-    ones = bin(data).count('1') + parity_bit
+    ones = popcount(data) + parity_bit
 
     # Check for odd/even parity.
     if parity_type == 'odd':
@@ -373,6 +374,26 @@ def inspect_sample(self, rxtx, signal, inv):
         elif state == 'GET STOP BITS':
             self.get_stop_bits(rxtx, signal)
 
+    def get_frame_points(self, rxtx):
+        # Return the sample points of all bits after the START bit.
+        num_bits = self.options['num_data_bits'] + 1
+        num_bits += 0 if self.options['parity_type'] == 'none' else 1
+        return [ceil(self.get_sample_point(rxtx, bitnum))
+                for bitnum in range(1, num_bits + 1)]
+
+    def decode_single(self, rxtx, inv):
+        # With only one UART line, sample the remaining bits of a frame
+        # in one call once its START bit was seen.
+        while True:
+            if self.state[rxtx] == 'GET DATA BITS':
+                points = self.get_frame_points(rxtx)
+                pins = self.wait_points(points)
+                for self.samplenum, p in zip(points, pins):
+                    self.inspect_sample(rxtx, p[rxtx], inv)
+                continue
+            pins = self.wait(self.get_wait_cond(rxtx, inv))
+            self.inspect_sample(rxtx, pins[rxtx], inv)
+
     def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
@@ -383,6 +404,11 @@ def decode(self):
 
         opt = self.options
         inv = [opt['invert_rx'] == 'yes', opt['invert_tx'] == 'yes']
+
+        if has_pin.count(True) == 1:
+            rxtx = has_pin.index(True)
+            self.decode_single(rxtx, inv[rxtx])
+
         cond_idx = [None] * len(has_pin)
 
         while True:
@@ -19,6 +19,7 @@
 ##
 
 import sigrokdecode as srd
+from common.crc import crc5_usb, crc16_usb
 
 '''
 OUTPUT_PYTHON format:
@@ -143,34 +144,18 @@ def bitstr_to_num(bitstr):
     l.reverse()
     return int(''.join(l), 2)
 
-def reverse_number(num, count):
-    out = list(count * '0')
-    for i in range(0, count):
-        if num >> i & 1:
-            out[i] = '1';
-    return int(''.join(out), 2)
-
 def calc_crc5(bitstr):
-    poly5 = 0x25
-    crc5 = 0x1f
-    for bit in bitstr:
-        crc5 <<= 1
-        if int(bit) != (crc5 >> 5):
-            crc5 ^= poly5
-        crc5 &= 0x1f
-    crc5 ^= 0x1f
-    return reverse_number(crc5, 5)
+    crc = crc5_usb.update_bits(crc5_usb.init, bitstr_to_num(bitstr),
+                               len(bitstr))
+    return crc5_usb.finish(crc)
 
 def calc_crc16(bitstr):
-    poly16 = 0x18005
-    crc16 = 0xffff
-    for bit in bitstr:
-        crc16 <<= 1
-        if int(bit) != (crc16 >> 16):
-            crc16 ^= poly16
-        crc16 &= 0xffff
-    crc16 ^= 0xffff
-    return reverse_number(crc16, 16)
+    if len(bitstr) % 8:
+        crc = crc16_usb.update_bits(crc16_usb.init, bitstr_to_num(bitstr),
+                                    len(bitstr))
+        return crc16_usb.finish(crc)
+    data = bitstr_to_num(bitstr).to_bytes(len(bitstr) // 8, 'little')
+    return crc16_usb(data)
 
 class Decoder(srd.Decoder):
     api_version = 3
@@ -391,3 +376,11 @@ def decode(self, ss, es, data):
                 self.bits, self.state = [], 'WAIT FOR SOP'
             else:
                 pass # TODO: Error
+
+    def decode_many(self, items):
+        # Most items are bits of a packet, they skip the state machine.
+        for (ss, es, data) in items:
+            if self.state == 'GET BIT' and data[0] == 'BIT':
+                self.bits.append([data[1], ss, es])
+            else:
+                self.decode(ss, es, data)
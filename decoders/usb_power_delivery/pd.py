@@ -19,14 +19,12 @@
 
 import sigrokdecode as srd
 import struct
-import zlib   # for crc32
+from common.crc import crc32
+from common.pulsewidth import PulseWidths
 
 # BMC encoding with a 600kHz datarate
 UI_US = 1000000/600000.0
 
-# Threshold to discriminate half-1 from 0 in Binary Mark Conding
-THRESHOLD_US = (UI_US + 2 * UI_US) / 2
-
 # Control Message type
 CTRL_TYPES = {
     0: 'reserved',
@@ -369,7 +367,7 @@ def putwarn(self, longm, shortm):
     def compute_crc32(self):
         bdata = struct.pack('<H'+'I'*len(self.data), self.head & 0xffff,
                             *tuple([d & 0xffffffff for d in self.data]))
-        return zlib.crc32(bdata)
+        return crc32(bdata)
 
     def rec_sym(self, i, sym):
         self.putx(i, i+5, [7, SYM_NAME[sym]])
@@ -453,10 +451,11 @@ def __init__(self):
     def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
             self.samplerate = value
-            # 0 is 2 UI, space larger than 1.5x 0 is definitely wrong
-            self.maxbit = self.us2samples(3 * UI_US)
-            # duration threshold between half 1 and 0
-            self.threshold = self.us2samples(THRESHOLD_US)
+            # Half 1 is 1 UI, 0 is 2 UI. The widths get tracked during
+            # a packet, starting from the nominal ones.
+            ui = UI_US * self.samplerate / 1000000
+            self.nominal_widths = (ui, 2 * ui)
+            self.widths = PulseWidths(2, centers=self.nominal_widths)
 
     def start(self):
         self.out_python = self.register(srd.OUTPUT_PYTHON)
@@ -467,9 +466,6 @@ def start(self):
             meta=(int, 'Bitrate', 'Bitrate during the packet')
         )
 
-    def us2samples(self, us):
-        return int(us * self.samplerate / 1000000)
-
     def decode_packet(self):
         self.data = []
         self.idx = 0
@@ -539,7 +535,8 @@ def decode(self):
             diff = self.samplenum - self.previous
 
             # Large idle: use it as the end of packet
-            if diff > self.maxbit:
+            # (0 is 2 UI, space larger than 1.5x 0 is definitely wrong)
+            if diff > 1.5 * self.widths.centers[1]:
                 # the last edge of the packet
                 self.edges.append(self.previous)
                 # Export the packet
@@ -551,8 +548,9 @@ def decode(self):
                 self.bad = []
                 self.half_one = False
                 self.start_one = 0
+                self.widths.reset(self.nominal_widths)
             else:   # add the bit to the packet
-                is_zero = diff > self.threshold
+                is_zero = self.widths.add(diff) == 1
                 if is_zero and not self.half_one:
                     self.bits.append(0)
                     self.edges.append(self.previous)
@@ -102,33 +102,46 @@ def _update_state(self, state, bit=None):
             self._state = state
             self._bits = []
 
+    def _handle_timeout(self, d0, d1):
+        'End the current bit after the bit width has passed.'
+        if (d0, d1) == (self._inactive, self._inactive):
+            self._update_state('idle')
+        else:
+            self._update_state('invalid')
+
+    def _handle_transition(self, d0, d1):
+        'Update the state upon a change of the data lines.'
+        if self._state in (None, 'idle', 'data'):
+            if (d0, d1) == (self._active, self._inactive):
+                self._update_state('data', 0)
+            elif (d0, d1) == (self._inactive, self._active):
+                self._update_state('data', 1)
+            elif (d0, d1) == (self._active, self._active):
+                self._update_state('invalid')
+        elif self._state == 'invalid':
+            # Wait until we see an idle state before leaving invalid.
+            # This prevents inverted lines from being misread.
+            if (d0, d1) == (self._inactive, self._inactive):
+                self._update_state('idle')
+
+        self._d0_prev, self._d1_prev = d0, d1
+
     def decode(self):
         while True:
-            # TODO: Come up with more appropriate self.wait() conditions.
-            (d0, d1) = self.wait()
-
-            if d0 == self._d0_prev and d1 == self._d1_prev:
-                if self.es_bit and self.samplenum >= self.es_bit:
-                    if (d0, d1) == (self._inactive, self._inactive):
-                        self._update_state('idle')
-                    else:
-                        self._update_state('invalid')
-                continue
-
-            if self._state in (None, 'idle', 'data'):
-                if (d0, d1) == (self._active, self._inactive):
-                    self._update_state('data', 0)
-                elif (d0, d1) == (self._inactive, self._active):
-                    self._update_state('data', 1)
-                elif (d0, d1) == (self._active, self._active):
-                    self._update_state('invalid')
-            elif self._state == 'invalid':
-                # Wait until we see an idle state before leaving invalid.
-                # This prevents inverted lines from being misread.
-                if (d0, d1) == (self._inactive, self._inactive):
-                    self._update_state('idle')
+            # Process runs of unchanged line levels, not single samples.
+            for (ss, (d0, d1), count) in self.wait_runs(0x10000):
+                steady_ss = ss
+                if d0 != self._d0_prev or d1 != self._d1_prev:
+                    self.samplenum = ss
+                    self._handle_transition(d0, d1)
+                    steady_ss += 1
 
-            self._d0_prev, self._d1_prev = d0, d1
+                # Within a run only the end of the current bit can happen.
+                if self.es_bit:
+                    timeout = max(steady_ss, self.es_bit)
+                    if timeout < ss + count:
+                        self.samplenum = timeout
+                        self._handle_timeout(d0, d1)
 
     def report(self):
         return '%s: %s D0 %d D1 %d (active on %d), %d samples per bit' % (
@@ -28,8 +28,6 @@
 
 /** @cond PRIVATE */
 
-extern SRD_PRIV GSList *sessions;
-
 static void srd_inst_join_decode_thread(struct srd_decoder_inst *di);
 static void srd_inst_reset_state(struct srd_decoder_inst *di);
 SRD_PRIV void oldpins_array_free(struct srd_decoder_inst *di);
@@ -323,6 +321,12 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 		return NULL;
 	}
 
+	/* Decoders loaded from the metadata cache get imported only now. */
+	if (srd_decoder_import(dec) != SRD_OK) {
+		srd_err("Failed to import protocol decoder %s.", decoder_id);
+		return NULL;
+	}
+
 	di = g_malloc0(sizeof(struct srd_decoder_inst));
 
 	di->decoder = dec;
@@ -382,9 +386,20 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 		return NULL;
 	}
 
+	/*
+	 * Attach the instance to its Python object, for O(1) lookups.
+	 * srd_decoder_load() made sure the class derives from
+	 * sigrokdecode.Decoder.
+	 */
+	((srd_Decoder *)di->py_inst)->di = di;
+
 	PyGILState_Release(gstate);
 
 	if (options && srd_inst_option_set(di, options) != SRD_OK) {
+		gstate = PyGILState_Ensure();
+		((srd_Decoder *)di->py_inst)->di = NULL;
+		Py_DecRef(di->py_inst);
+		PyGILState_Release(gstate);
 		g_free(di->dec_channelmap);
 		g_free(di);
 		return NULL;
@@ -396,6 +411,7 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 	di->abs_end_samplenum = 0;
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->inbuf_samplenums = NULL;
 	di->abs_cur_samplenum = 0;
 	di->thread_handle = NULL;
 	di->got_new_samples = FALSE;
@@ -471,11 +487,14 @@ static void srd_inst_reset_state(struct srd_decoder_inst *di)
 	di->abs_end_samplenum = 0;
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->inbuf_samplenums = NULL;
 	di->abs_cur_samplenum = 0;
+	di->abs_first_samplenum = 0;
 	oldpins_array_free(di);
 	di->got_new_samples = FALSE;
 	di->handled_all_samples = FALSE;
 	di->want_wait_terminate = FALSE;
+	di->communicate_eof = FALSE;
 	/* Conditions and mutex got reset after joining the thread. */
 }
 
@@ -583,41 +602,16 @@ SRD_API struct srd_decoder_inst *srd_inst_find_by_id(struct srd_session *sess,
 	return di;
 }
 
-static struct srd_decoder_inst *srd_sess_inst_find_by_obj(
-		struct srd_session *sess, const GSList *stack,
-		const PyObject *obj)
-{
-	const GSList *l;
-	struct srd_decoder_inst *tmp, *di;
-
-	if (session_is_valid(sess) != SRD_OK) {
-		srd_err("Invalid session.");
-		return NULL;
-	}
-
-	di = NULL;
-	for (l = stack ? stack : sess->di_list; di == NULL && l != NULL; l = l->next) {
-		tmp = l->data;
-		if (tmp->py_inst == obj)
-			di = tmp;
-		else if (tmp->next_di)
-			di = srd_sess_inst_find_by_obj(sess, tmp->next_di, obj);
-	}
-
-	return di;
-}
-
 /**
  * Find a decoder instance by its Python object.
  *
  * I.e. find that instance's instantiation of the sigrokdecode.Decoder class.
- * This will recurse to find the instance anywhere in the stack tree of all
- * sessions.
+ * The instance is attached to the Python object when it gets created (see
+ * @ref srd_inst_new()), so this is a constant time lookup regardless of the
+ * number of sessions and stacked instances.
  *
- * @param stack Pointer to a GSList of struct srd_decoder_inst, indicating the
- *              stack to search. To start searching at the bottom level of
- *              decoder instances, pass NULL.
- * @param obj The Python class instantiation.
+ * @param obj The Python class instantiation. Must be an instance of the
+ *            sigrokdecode.Decoder type.
  *
  * @return Pointer to struct srd_decoder_inst, or NULL if not found.
  *
@@ -625,20 +619,12 @@ static struct srd_decoder_inst *srd_sess_inst_find_by_obj(
  *
  * @since 0.1.0
  */
-SRD_PRIV struct srd_decoder_inst *srd_inst_find_by_obj(const GSList *stack,
-		const PyObject *obj)
+SRD_PRIV struct srd_decoder_inst *srd_inst_find_by_obj(const PyObject *obj)
 {
-	struct srd_decoder_inst *di;
-	struct srd_session *sess;
-	GSList *l;
-
-	di = NULL;
-	for (l = sessions; di == NULL && l != NULL; l = l->next) {
-		sess = l->data;
-		di = srd_sess_inst_find_by_obj(sess, stack, obj);
-	}
+	if (!obj)
+		return NULL;
 
-	return di;
+	return ((const srd_Decoder *)obj)->di;
 }
 
 /**
@@ -689,6 +675,29 @@ SRD_API int srd_inst_initial_pins_set_all(struct srd_decoder_inst *di, GArray *i
 	return SRD_OK;
 }
 
+/**
+ * Get the statistics of a decoder instance.
+ *
+ * The values are exact when no srd_session_send() call is in progress.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param stats The statistics will be stored here. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_inst_stats_get(struct srd_decoder_inst *di,
+		struct srd_inst_stats *stats)
+{
+	if (!di || !stats)
+		return SRD_ERR_ARG;
+
+	*stats = di->stats;
+
+	return SRD_OK;
+}
+
 /** @private */
 SRD_PRIV void oldpins_array_free(struct srd_decoder_inst *di)
 {
@@ -813,38 +822,89 @@ SRD_PRIV void match_array_free(struct srd_decoder_inst *di)
 }
 
 /** @private */
-SRD_PRIV void condition_list_free(struct srd_decoder_inst *di)
+SRD_PRIV void srd_condition_list_free(struct srd_condition_list *conds)
 {
-	GSList *l, *ll;
+	PyGILState_STATE gstate;
 
-	if (!di)
+	if (!conds)
 		return;
 
-	for (l = di->condition_list; l; l = l->next) {
-		ll = l->data;
-		if (ll)
-			g_slist_free_full(ll, g_free);
+	if (conds->py_conds) {
+		gstate = PyGILState_Ensure();
+		Py_DecRef(conds->py_conds);
+		PyGILState_Release(gstate);
 	}
+	g_free(conds->cond_start);
+	g_free(conds->terms);
+	g_free(conds);
+}
+
+/** @private */
+SRD_PRIV void condition_list_free(struct srd_decoder_inst *di)
+{
+	if (!di)
+		return;
+
+	/* The cache owns all condition lists, except for the ones below. */
+	if (di->condition_cache)
+		g_ptr_array_free(di->condition_cache, TRUE);
+	di->condition_cache = NULL;
+	di->condition_cache_next = 0;
+	srd_condition_list_free(di->skip_condition);
+	di->skip_condition = NULL;
+	srd_condition_list_free(di->points_condition);
+	di->points_condition = NULL;
 
 	di->condition_list = NULL;
 }
 
 static gboolean have_non_null_conds(const struct srd_decoder_inst *di)
 {
-	GSList *l, *cond;
+	const struct srd_condition_list *conds;
+	unsigned int i;
 
-	if (!di)
+	if (!di || !(conds = di->condition_list))
 		return FALSE;
 
-	for (l = di->condition_list; l; l = l->next) {
-		cond = l->data;
-		if (cond)
+	for (i = 0; i < conds->num_conditions; i++) {
+		if (conds->cond_start[i + 1] > conds->cond_start[i])
 			return TRUE;
 	}
 
 	return FALSE;
 }
 
+/*
+ * Find the entry of a change-only chunk which applies to the specified
+ * sample, i.e. the last change at or before the sample.
+ */
+static uint64_t change_index_at(const struct srd_decoder_inst *di,
+		uint64_t abs_samplenum)
+{
+	uint64_t lo, hi, mid;
+
+	lo = 0;
+	hi = di->inbuflen / di->data_unitsize;
+	while (hi - lo > 1) {
+		mid = lo + (hi - lo) / 2;
+		if (di->inbuf_samplenums[mid] <= abs_samplenum)
+			lo = mid;
+		else
+			hi = mid;
+	}
+
+	return lo;
+}
+
+static inline const uint8_t *sample_pos_at(const struct srd_decoder_inst *di,
+		uint64_t abs_samplenum)
+{
+	if (di->inbuf_samplenums)
+		return di->inbuf + change_index_at(di, abs_samplenum) * di->data_unitsize;
+
+	return di->inbuf + ((abs_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+}
+
 static void update_old_pins_array(struct srd_decoder_inst *di,
 		const uint8_t *sample_pos)
 {
@@ -871,7 +931,7 @@ static void update_old_pins_array_initial_pins(struct srd_decoder_inst *di)
 	if (!di || !di->dec_channelmap)
 		return;
 
-	sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+	sample_pos = sample_pos_at(di, di->abs_cur_samplenum);
 
 	for (i = 0; i < di->dec_num_channels; i++) {
 		if (di->old_pins_array->data[i] != SRD_INITIAL_PIN_SAME_AS_SAMPLE0)
@@ -887,33 +947,29 @@ static gboolean term_matches(const struct srd_decoder_inst *di,
 		struct srd_term *term, const uint8_t *sample_pos)
 {
 	uint8_t old_sample, sample;
-	int byte_offset, bit_offset, ch;
 
-	/* Caller ensures di, di->dec_channelmap, term, sample_pos != NULL. */
+	/* Caller ensures di, term, sample_pos != NULL. */
 
 	if (term->type == SRD_TERM_SKIP)
 		return sample_matches(0, 0, term);
 
-	ch = term->channel;
-	byte_offset = di->dec_channelmap[ch] / 8;
-	bit_offset = di->dec_channelmap[ch] % 8;
-	sample = *(sample_pos + byte_offset) & (1 << bit_offset) ? 1 : 0;
-	old_sample = di->old_pins_array->data[ch];
+	sample = sample_pos[term->byte_offset] & term->bit_mask ? 1 : 0;
+	old_sample = di->old_pins_array->data[term->channel];
 
 	return sample_matches(old_sample, sample, term);
 }
 
 static gboolean all_terms_match(const struct srd_decoder_inst *di,
-		const GSList *cond, const uint8_t *sample_pos)
+		unsigned int cond, const uint8_t *sample_pos)
 {
-	const GSList *l;
-	struct srd_term *term;
+	const struct srd_condition_list *conds;
+	unsigned int t;
 
-	/* Caller ensures di, cond, sample_pos != NULL. */
+	/* Caller ensures di, di->condition_list, sample_pos != NULL. */
 
-	for (l = cond; l; l = l->next) {
-		term = l->data;
-		if (!term_matches(di, term, sample_pos))
+	conds = di->condition_list;
+	for (t = conds->cond_start[cond]; t < conds->cond_start[cond + 1]; t++) {
+		if (!term_matches(di, &conds->terms[t], sample_pos))
 			return FALSE;
 	}
 
@@ -935,13 +991,265 @@ static gboolean at_least_one_condition_matched(
 	return FALSE;
 }
 
+/* Load a sample of up to 8 bytes into a word, in host byte order. */
+static inline uint64_t sample_word(const uint8_t *sample_pos, int unitsize)
+{
+	uint16_t w16;
+	uint32_t w32;
+	uint64_t w64;
+
+	switch (unitsize) {
+	case 1:
+		return *sample_pos;
+	case 2:
+		memcpy(&w16, sample_pos, sizeof(w16));
+		return w16;
+	case 4:
+		memcpy(&w32, sample_pos, sizeof(w32));
+		return w32;
+	case 8:
+		memcpy(&w64, sample_pos, sizeof(w64));
+		return w64;
+	default:
+		w64 = 0;
+		memcpy(&w64, sample_pos, unitsize);
+		return w64;
+	}
+}
+
+/**
+ * Prepare the mask of sample data bits which carry the instance's channels.
+ *
+ * The mask gets used to quickly find the next transition on any of the
+ * decoder's channels, see @ref count_unchanged_samples().
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param unitsize The number of bytes per sample of the upcoming chunk.
+ *
+ * @private
+ */
+static void update_sample_mask(struct srd_decoder_inst *di, int unitsize)
+{
+	int i, byte_offset;
+
+	if (!di->sample_mask || di->data_unitsize != unitsize) {
+		g_free(di->sample_mask);
+		di->sample_mask = g_malloc(unitsize);
+	}
+	memset(di->sample_mask, 0, unitsize);
+
+	for (i = 0; i < di->dec_num_channels; i++) {
+		/* A channelmap value of -1 means "unused optional channel". */
+		if (!di->dec_channelmap || di->dec_channelmap[i] == -1)
+			continue;
+		byte_offset = di->dec_channelmap[i] / 8;
+		if (byte_offset >= unitsize)
+			continue;
+		di->sample_mask[byte_offset] |= 1 << (di->dec_channelmap[i] % 8);
+	}
+
+	di->sample_mask_word = 0;
+	if (unitsize <= (int)sizeof(uint64_t))
+		di->sample_mask_word = sample_word(di->sample_mask, unitsize);
+}
+
+/* Check whether two samples agree on all of the instance's channels. */
+static gboolean samples_equal(const struct srd_decoder_inst *di,
+		const uint8_t *pos_a, const uint8_t *pos_b)
+{
+	int unitsize, i;
+
+	unitsize = di->data_unitsize;
+	if (unitsize <= (int)sizeof(uint64_t))
+		return !((sample_word(pos_a, unitsize) ^
+			sample_word(pos_b, unitsize)) & di->sample_mask_word);
+
+	for (i = 0; i < unitsize; i++) {
+		if ((pos_a[i] ^ pos_b[i]) & di->sample_mask[i])
+			return FALSE;
+	}
+
+	return TRUE;
+}
+
+/**
+ * Count the samples which follow the specified sample and which don't
+ * change any of the decoder instance's channels.
+ *
+ * For change-only chunks the count is determined from the sample numbers
+ * of the changes, without visiting the samples inbetween.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param abs_samplenum The (absolute) number of the reference sample.
+ * @param max_count The maximum number of samples to check. Must not
+ *                  exceed the end of the current chunk.
+ *
+ * @return The number of unchanged samples following the reference sample.
+ *
+ * @private
+ */
+static uint64_t count_unchanged_samples(const struct srd_decoder_inst *di,
+		uint64_t abs_samplenum, uint64_t max_count)
+{
+	uint64_t count, mask, ref, idx, num_changes;
+	const uint8_t *sample_pos, *pos;
+	int unitsize;
+
+	unitsize = di->data_unitsize;
+
+	if (di->inbuf_samplenums) {
+		num_changes = di->inbuflen / unitsize;
+		idx = change_index_at(di, abs_samplenum);
+		sample_pos = di->inbuf + idx * unitsize;
+		for (idx++; idx < num_changes; idx++) {
+			count = di->inbuf_samplenums[idx] - abs_samplenum - 1;
+			if (count >= max_count)
+				break;
+			if (!samples_equal(di, sample_pos, di->inbuf + idx * unitsize))
+				return count;
+		}
+		return max_count;
+	}
+
+	sample_pos = sample_pos_at(di, abs_samplenum);
+	pos = sample_pos;
+
+	if (unitsize <= (int)sizeof(uint64_t)) {
+		mask = di->sample_mask_word;
+		ref = sample_word(sample_pos, unitsize) & mask;
+		for (count = 0; count < max_count; count++) {
+			pos += unitsize;
+			if ((sample_word(pos, unitsize) & mask) != ref)
+				break;
+		}
+		return count;
+	}
+
+	for (count = 0; count < max_count; count++) {
+		pos += unitsize;
+		if (!samples_equal(di, sample_pos, pos))
+			break;
+	}
+
+	return count;
+}
+
+/* Check whether the sample's pin values equal the "old" pin values. */
+static gboolean sample_equals_old_pins(const struct srd_decoder_inst *di,
+		const uint8_t *sample_pos)
+{
+	uint8_t sample;
+	int i, byte_offset, bit_offset;
+
+	for (i = 0; i < di->dec_num_channels; i++) {
+		if (di->dec_channelmap[i] == -1)
+			continue;
+		byte_offset = di->dec_channelmap[i] / 8;
+		bit_offset = di->dec_channelmap[i] % 8;
+		sample = *(sample_pos + byte_offset) & (1 << bit_offset) ? 1 : 0;
+		if (di->old_pins_array->data[i] != sample)
+			return FALSE;
+	}
+
+	return TRUE;
+}
+
+/**
+ * Check whether the current conditions permit skipping samples ahead.
+ *
+ * Runs of unchanged input samples can be skipped when every condition
+ * either consists of a single SKIP term, or contains no SKIP term at all.
+ * The counts of single SKIP term conditions are adjusted arithmetically,
+ * while all other conditions cannot start matching within a run of samples
+ * which evaluated to "no match" and had no transition.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param only_skips Will be set to TRUE when all (non-NULL) conditions
+ *                   consist of a single SKIP term. Must not be NULL.
+ *
+ * @return TRUE if samples can be skipped, FALSE otherwise.
+ *
+ * @private
+ */
+static gboolean can_skip_ahead(const struct srd_decoder_inst *di,
+		gboolean *only_skips)
+{
+	const struct srd_condition_list *conds;
+	unsigned int i, t, num_terms;
+	gboolean have_skip;
+
+	conds = di->condition_list;
+	*only_skips = TRUE;
+	for (i = 0; i < conds->num_conditions; i++) {
+		num_terms = conds->cond_start[i + 1] - conds->cond_start[i];
+		if (!num_terms)
+			continue;
+		have_skip = FALSE;
+		for (t = conds->cond_start[i]; t < conds->cond_start[i + 1]; t++) {
+			if (conds->terms[t].type == SRD_TERM_SKIP)
+				have_skip = TRUE;
+		}
+		if (have_skip && num_terms > 1) {
+			*only_skips = FALSE;
+			return FALSE;
+		}
+		if (!have_skip)
+			*only_skips = FALSE;
+	}
+
+	return TRUE;
+}
+
+/*
+ * Get the number of samples which single SKIP term conditions can skip
+ * before they match. Returns UINT64_MAX when there are no such conditions.
+ */
+static uint64_t skip_terms_remaining(const struct srd_decoder_inst *di)
+{
+	const struct srd_condition_list *conds;
+	const struct srd_term *term;
+	unsigned int i;
+	uint64_t remaining;
+
+	conds = di->condition_list;
+	remaining = UINT64_MAX;
+	for (i = 0; i < conds->num_conditions; i++) {
+		if (conds->cond_start[i + 1] - conds->cond_start[i] != 1)
+			continue;
+		term = &conds->terms[conds->cond_start[i]];
+		if (term->type != SRD_TERM_SKIP)
+			continue;
+		remaining = MIN(remaining, term->num_samples_to_skip -
+			term->num_samples_already_skipped);
+	}
+
+	return remaining;
+}
+
+/* Account for 'count' samples which were skipped without evaluation. */
+static void advance_skip_terms(struct srd_decoder_inst *di, uint64_t count)
+{
+	struct srd_condition_list *conds;
+	struct srd_term *term;
+	unsigned int i;
+
+	conds = di->condition_list;
+	for (i = 0; i < conds->num_conditions; i++) {
+		if (conds->cond_start[i + 1] - conds->cond_start[i] != 1)
+			continue;
+		term = &conds->terms[conds->cond_start[i]];
+		if (term->type == SRD_TERM_SKIP)
+			term->num_samples_already_skipped += count;
+	}
+}
+
 static gboolean find_match(struct srd_decoder_inst *di)
 {
-	static uint64_t s = 0;
-	uint64_t i, j, num_samples_to_process;
-	GSList *l, *cond;
+	uint64_t i, num_samples_to_process, skip_count;
+	const struct srd_condition_list *conds;
 	const uint8_t *sample_pos;
-	unsigned int num_conditions;
+	unsigned int j, num_conditions;
+	gboolean skip_ahead, only_skips, steady;
 
 	/* Caller ensures di != NULL. */
 
@@ -958,28 +1266,52 @@ static gboolean find_match(struct srd_decoder_inst *di)
 	}
 
 	num_samples_to_process = di->abs_end_samplenum - di->abs_cur_samplenum;
-	num_conditions = g_slist_length(di->condition_list);
+	conds = di->condition_list;
+	num_conditions = conds->num_conditions;
 
 	/* di->match_array is NULL here. Create a new GArray. */
 	di->match_array = g_array_sized_new(FALSE, TRUE, sizeof(gboolean), num_conditions);
 	g_array_set_size(di->match_array, num_conditions);
 
 	/* Sample 0: Set di->old_pins_array for SRD_INITIAL_PIN_SAME_AS_SAMPLE0 pins. */
-	if (di->abs_cur_samplenum == 0)
+	if (di->abs_cur_samplenum == di->abs_first_samplenum)
 		update_old_pins_array_initial_pins(di);
 
-	for (i = 0, s = 0; i < num_samples_to_process; i++, s++, (di->abs_cur_samplenum)++) {
+	skip_ahead = can_skip_ahead(di, &only_skips);
 
-		sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+	for (i = 0; i < num_samples_to_process; i++, (di->abs_cur_samplenum)++) {
+
+		/*
+		 * When only SKIP conditions are pending, jump straight to
+		 * the sample where the first of them will match (or to the
+		 * end of the chunk), without inspecting the samples inbetween.
+		 */
+		if (only_skips) {
+			skip_count = MIN(skip_terms_remaining(di),
+				num_samples_to_process - i);
+			if (skip_count) {
+				advance_skip_terms(di, skip_count);
+				di->stats.samples_skipped += skip_count;
+				i += skip_count;
+				di->abs_cur_samplenum += skip_count;
+				update_old_pins_array(di,
+					sample_pos_at(di, di->abs_cur_samplenum - 1));
+				if (i >= num_samples_to_process)
+					break;
+			}
+		}
+
+		sample_pos = sample_pos_at(di, di->abs_cur_samplenum);
+		steady = skip_ahead && sample_equals_old_pins(di, sample_pos);
+		di->stats.samples_checked++;
 
 		/* Check whether the current sample matches at least one of the conditions (logical OR). */
 		/* IMPORTANT: We need to check all conditions, even if there was a match already! */
-		for (l = di->condition_list, j = 0; l; l = l->next, j++) {
-			cond = l->data;
-			if (!cond)
+		for (j = 0; j < num_conditions; j++) {
+			if (conds->cond_start[j + 1] == conds->cond_start[j])
 				continue;
-			/* All terms in 'cond' must match (logical AND). */
-			di->match_array->data[j] = all_terms_match(di, cond, sample_pos);
+			/* All terms in condition 'j' must match (logical AND). */
+			di->match_array->data[j] = all_terms_match(di, j, sample_pos);
 		}
 
 		update_old_pins_array(di, sample_pos);
@@ -987,6 +1319,24 @@ static gboolean find_match(struct srd_decoder_inst *di)
 		/* If at least one condition matched we're done. */
 		if (at_least_one_condition_matched(di, num_conditions))
 			return TRUE;
+
+		/*
+		 * This sample had no transition and didn't match. Subsequent
+		 * samples without a transition won't match either (except
+		 * for SKIP conditions which run out), so move on to the
+		 * sample before the next transition in one go.
+		 */
+		if (steady) {
+			skip_count = count_unchanged_samples(di, di->abs_cur_samplenum,
+				num_samples_to_process - i - 1);
+			skip_count = MIN(skip_count, skip_terms_remaining(di));
+			if (skip_count) {
+				advance_skip_terms(di, skip_count);
+				di->stats.samples_skipped += skip_count;
+				i += skip_count;
+				di->abs_cur_samplenum += skip_count;
+			}
+		}
 	}
 
 	return FALSE;
@@ -1042,6 +1392,66 @@ SRD_PRIV int process_samples_until_condition_match(struct srd_decoder_inst *di,
 	return SRD_OK;
 }
 
+/**
+ * Get the length of the run of samples which starts at the current sample.
+ *
+ * The run consists of the current sample and all subsequent samples in the
+ * current chunk which don't change any of the decoder instance's channels.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param max_count The maximum run length to report. Must not be 0.
+ *
+ * @return The length of the run (at least 1), limited to 'max_count' and
+ *         to the end of the current chunk.
+ *
+ * @private
+ */
+SRD_PRIV uint64_t srd_inst_run_length(const struct srd_decoder_inst *di,
+		uint64_t max_count)
+{
+	uint64_t count;
+
+	count = MIN(max_count, di->abs_end_samplenum - di->abs_cur_samplenum);
+
+	return 1 + count_unchanged_samples(di, di->abs_cur_samplenum,
+		count - 1);
+}
+
+/**
+ * Move the current sample position within the current chunk.
+ *
+ * The "old" pin values are updated to the values of the new current
+ * sample, as if a wait() had matched there.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param abs_samplenum The new (absolute) current sample number. Must lie
+ *                      within the current chunk.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_seek(struct srd_decoder_inst *di, uint64_t abs_samplenum)
+{
+	di->abs_cur_samplenum = abs_samplenum;
+	update_old_pins_array(di, sample_pos_at(di, abs_samplenum));
+}
+
+/**
+ * Get a pointer to the data of a sample in the current chunk.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param abs_samplenum The (absolute) sample number. Must lie within the
+ *                      current chunk.
+ *
+ * @return Pointer to the sample's 'data_unitsize' bytes.
+ *
+ * @private
+ */
+SRD_PRIV const uint8_t *srd_inst_sample_pos(const struct srd_decoder_inst *di,
+		uint64_t abs_samplenum)
+{
+	return sample_pos_at(di, abs_samplenum);
+}
+
 /**
  * Worker thread (per PD-stack).
  *
@@ -1054,7 +1464,7 @@ static gpointer di_thread(gpointer data)
 {
 	PyObject *py_res;
 	struct srd_decoder_inst *di;
-	int wanted_term;
+	int wanted_term, eof;
 	PyGILState_STATE gstate;
 
 	if (!data)
@@ -1075,6 +1485,24 @@ static gpointer di_thread(gpointer data)
 	py_res = PyObject_CallMethod(di->py_inst, "decode", NULL);
 	srd_dbg("%s: decode() method terminated.", di->inst_id);
 
+	/*
+	 * Upon the end of the input, pass the output which decode()
+	 * submitted after its last wait() call up the stack, before
+	 * the main thread gets unblocked.
+	 */
+	eof = di->communicate_eof;
+	if (eof) {
+		if (!py_res && PyErr_ExceptionMatches(PyExc_EOFError)) {
+			PyErr_Clear();
+			py_res = Py_None;
+			Py_IncRef(py_res);
+		}
+		if (!py_res)
+			srd_exception_catch("Protocol decoder instance %s: ",
+				di->inst_id);
+		srd_inst_flush_python_queues(di);
+	}
+
 	/*
 	 * Make sure to unblock potentially pending srd_inst_decode()
 	 * calls in application threads after the decode() method might
@@ -1083,7 +1511,7 @@ static gpointer di_thread(gpointer data)
 	 * a samplerate to decode" exception is thrown.
 	 */
 	g_mutex_lock(&di->data_mutex);
-	wanted_term = di->want_wait_terminate;
+	wanted_term = di->want_wait_terminate || eof;
 	di->want_wait_terminate = TRUE;
 	di->handled_all_samples = TRUE;
 	g_cond_signal(&di->handled_all_samples_cond);
@@ -1139,7 +1567,8 @@ static gpointer di_thread(gpointer data)
  * The calls to this function must provide the samples that shall be
  * used by the protocol decoder
  *  - in the correct order ([...]5, 6, 4, 7, 8[...] is a bug),
- *  - starting from sample zero (2, 3, 4, 5, 6[...] is a bug),
+ *  - starting from sample zero (2, 3, 4, 5, 6[...] is a bug), or from
+ *    the lead-in of a shard, see srd_session_shard_set(),
  *  - consecutively, with no gaps (0, 1, 2, 4, 5[...] is a bug).
  *
  * The start- and end-sample numbers are absolute sample numbers (relative
@@ -1186,6 +1615,41 @@ static gpointer di_thread(gpointer data)
 SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	int ret;
+
+	ret = srd_inst_decode_start(di, abs_start_samplenum,
+		abs_end_samplenum, inbuf, inbuflen, unitsize, NULL);
+	if (ret != SRD_OK)
+		return ret;
+
+	srd_inst_decode_wait(di);
+
+	return SRD_OK;
+}
+
+/**
+ * Hand a chunk of samples to a decoder instance's worker thread.
+ *
+ * This is the first half of @ref srd_inst_decode(), which returns as soon
+ * as the chunk was passed to the worker thread. The caller must not touch
+ * the sample data until @ref srd_inst_decode_wait() has returned for the
+ * instance. The parameters are the same as for @ref srd_inst_decode(),
+ * with the addition of 'samplenums'.
+ *
+ * If 'samplenums' is not NULL, the chunk holds change-only data: the
+ * i-th sample in 'inbuf' applies from absolute sample number samplenums[i]
+ * up to the next change (or the end of the chunk). The first change must
+ * be at 'abs_start_samplenum', sample numbers must strictly increase.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_decode_start(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		const uint64_t *samplenums)
 {
 	/* Return an error upon unusable input. */
 	if (!di) {
@@ -1205,6 +1669,11 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		return SRD_ERR_ARG;
 	}
 
+	if (di->communicate_eof) {
+		srd_dbg("Samples after the end of the input.");
+		return SRD_ERR_ARG;
+	}
+
 	if (abs_start_samplenum != di->abs_cur_samplenum ||
 	    abs_end_samplenum < abs_start_samplenum) {
 		srd_dbg("Incorrect sample numbers: start=%" PRIu64 ", cur=%"
@@ -1213,12 +1682,10 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		return SRD_ERR_ARG;
 	}
 
-	di->data_unitsize = unitsize;
-
 	srd_dbg("Decoding: abs start sample %" PRIu64 ", abs end sample %"
 		PRIu64 " (%" PRIu64 " samples, %" PRIu64 " bytes, unitsize = "
 		"%d), instance %s.", abs_start_samplenum, abs_end_samplenum,
-		abs_end_samplenum - abs_start_samplenum, inbuflen, di->data_unitsize,
+		abs_end_samplenum - abs_start_samplenum, inbuflen, (int)unitsize,
 		di->inst_id);
 
 	/* If this is the first call, start the worker thread. */
@@ -1231,10 +1698,13 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 
 	/* Push the new sample chunk to the worker thread. */
 	g_mutex_lock(&di->data_mutex);
+	update_sample_mask(di, (int)unitsize);
+	di->data_unitsize = unitsize;
 	di->abs_start_samplenum = abs_start_samplenum;
 	di->abs_end_samplenum = abs_end_samplenum;
 	di->inbuf = inbuf;
 	di->inbuflen = inbuflen;
+	di->inbuf_samplenums = samplenums;
 	di->got_new_samples = TRUE;
 	di->handled_all_samples = FALSE;
 	di->want_wait_terminate = FALSE;
@@ -1243,8 +1713,55 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 	g_cond_signal(&di->got_new_samples_cond);
 	g_mutex_unlock(&di->data_mutex);
 
-	/* When all samples in this chunk were handled, return. */
+	return SRD_OK;
+}
+
+/**
+ * Wait until a decoder instance's worker thread has handled all samples.
+ *
+ * This is the second half of @ref srd_inst_decode(), for a chunk which was
+ * previously passed to @ref srd_inst_decode_start().
+ *
+ * @param di The decoder instance to wait for. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_decode_wait(struct srd_decoder_inst *di)
+{
+	g_mutex_lock(&di->data_mutex);
+	while (!di->handled_all_samples && !di->want_wait_terminate)
+		g_cond_wait(&di->handled_all_samples_cond, &di->data_mutex);
+	g_mutex_unlock(&di->data_mutex);
+}
+
+/**
+ * Tell a decoder instance's worker thread that no more samples follow.
+ *
+ * The pending wait() call of the instance's decode() method raises
+ * EOFError, such that the decoder can submit what it has accumulated.
+ * This returns when decode() has returned. Instances which never
+ * received samples have no worker thread, and are left alone.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di)
+{
+	if (!di)
+		return SRD_ERR_ARG;
+
+	if (!di->thread_handle)
+		return SRD_OK;
+
+	srd_dbg("%s: Sending EOF.", di->inst_id);
 	g_mutex_lock(&di->data_mutex);
+	di->communicate_eof = TRUE;
+	di->got_new_samples = TRUE;
+	di->handled_all_samples = FALSE;
+	g_cond_signal(&di->got_new_samples_cond);
 	while (!di->handled_all_samples && !di->want_wait_terminate)
 		g_cond_wait(&di->handled_all_samples_cond, &di->data_mutex);
 	g_mutex_unlock(&di->data_mutex);
@@ -1266,12 +1783,19 @@ SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di)
 	srd_inst_reset_state(di);
 
 	gstate = PyGILState_Ensure();
+	/* The Python object might outlive the instance, detach it. */
+	((srd_Decoder *)di->py_inst)->di = NULL;
 	Py_DecRef(di->py_inst);
+	Py_XDECREF((PyObject *)di->ann_text_cache);
+	Py_XDECREF((PyObject *)di->py_decode);
+	Py_XDECREF((PyObject *)di->py_decode_many);
+	Py_XDECREF((PyObject *)di->py_input_queue);
 	PyGILState_Release(gstate);
 
 	g_free(di->inst_id);
 	g_free(di->dec_channelmap);
 	g_free(di->channel_samples);
+	g_free(di->sample_mask);
 	g_slist_free(di->next_di);
 	for (l = di->pd_output; l; l = l->next) {
 		pdo = l->data;
@@ -40,12 +40,35 @@ enum {
 struct srd_term {
 	int type;
 	int channel;
+	/* Location of the channel's bit within a sample. */
+	int byte_offset;
+	uint8_t bit_mask;
 	uint64_t num_samples_to_skip;
 	uint64_t num_samples_already_skipped;
 };
 
+/*
+ * A compiled list of conditions, with the terms of all conditions in one
+ * array. Condition i consists of the terms from terms[cond_start[i]] up to
+ * (excluding) terms[cond_start[i + 1]]. Conditions without terms are
+ * ignored.
+ */
+struct srd_condition_list {
+	/* Copy of the Python conditions this was compiled from, or NULL. */
+	PyObject *py_conds;
+	unsigned int num_conditions;
+	unsigned int *cond_start;
+	struct srd_term *terms;
+};
+
 /* Custom Python types: */
 
+typedef struct {
+	PyObject_HEAD
+	/* The decoder instance which owns this Python object (if any). */
+	struct srd_decoder_inst *di;
+} srd_Decoder;
+
 typedef struct {
 	PyObject_HEAD
 	struct srd_decoder_inst *di;
@@ -64,6 +87,21 @@ struct srd_session {
 
 	/* List of frontend callbacks to receive decoder output. */
 	GSList *callbacks;
+
+	/* Whether the decoder stacks run concurrently in srd_session_send(). */
+	gboolean parallel;
+
+	/* Whether timings get collected, see srd_session_stats_set(). */
+	gboolean stats_enabled;
+
+	/* Session level statistics (without the instances' sums). */
+	struct srd_session_stats stats;
+
+	/* Sample range of a shard, see srd_session_shard_set(). */
+	gboolean sharded;
+	uint64_t shard_lead_in;
+	uint64_t shard_start;
+	uint64_t shard_end;
 };
 
 /* srd.c */
@@ -75,15 +113,26 @@ SRD_PRIV struct srd_pd_callback *srd_pd_output_callback_find(struct srd_session
 		int output_type);
 
 /* instance.c */
-SRD_PRIV struct srd_decoder_inst *srd_inst_find_by_obj( const GSList *stack,
-		const PyObject *obj);
+SRD_PRIV struct srd_decoder_inst *srd_inst_find_by_obj(const PyObject *obj);
 SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di);
 SRD_PRIV void match_array_free(struct srd_decoder_inst *di);
+SRD_PRIV void srd_condition_list_free(struct srd_condition_list *conds);
 SRD_PRIV void condition_list_free(struct srd_decoder_inst *di);
 SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_PRIV int srd_inst_decode_start(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		const uint64_t *samplenums);
+SRD_PRIV void srd_inst_decode_wait(struct srd_decoder_inst *di);
+SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di);
 SRD_PRIV int process_samples_until_condition_match(struct srd_decoder_inst *di, gboolean *found_match);
+SRD_PRIV uint64_t srd_inst_run_length(const struct srd_decoder_inst *di,
+		uint64_t max_count);
+SRD_PRIV void srd_inst_seek(struct srd_decoder_inst *di, uint64_t abs_samplenum);
+SRD_PRIV const uint8_t *srd_inst_sample_pos(const struct srd_decoder_inst *di,
+		uint64_t abs_samplenum);
 SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di);
 SRD_PRIV void srd_inst_free_all(struct srd_session *sess);
 
@@ -107,9 +156,11 @@ SRD_PRIV int srd_log(int loglevel, const char *format, ...) G_GNUC_PRINTF(2, 3);
 
 /* decoder.c */
 SRD_PRIV long srd_decoder_apiver(const struct srd_decoder *d);
+SRD_PRIV int srd_decoder_import(struct srd_decoder *d);
 
 /* type_decoder.c */
 SRD_PRIV PyObject *srd_Decoder_type_new(void);
+SRD_PRIV void srd_inst_flush_python_queues(struct srd_decoder_inst *di);
 
 /* type_logic.c */
 SRD_PRIV PyObject *srd_logic_type_new(void);
@@ -29,6 +29,7 @@ extern "C" {
 #endif
 
 struct srd_session;
+struct srd_condition_list;
 
 /**
  * @file
@@ -192,6 +193,14 @@ struct srd_decoder {
 
 	/** sigrokdecode.Decoder class. */
 	void *py_dec;
+
+	/**
+	 * Name of the Python module (the decoder's directory). Decoders
+	 * which were loaded from the metadata cache only get imported when
+	 * the first instance is created, until then py_mod and py_dec are
+	 * NULL.
+	 */
+	char *module_name;
 };
 
 enum srd_initial_pin {
@@ -228,6 +237,37 @@ struct srd_decoder_annotation_row {
 	GSList *ann_classes;
 };
 
+/**
+ * Statistics of a decoder instance, see srd_inst_stats_get().
+ *
+ * Counters are always maintained, timings (in microseconds) only get
+ * collected when enabled with srd_session_stats_set().
+ */
+struct srd_inst_stats {
+	/** Number of samples which were checked against wait() conditions. */
+	uint64_t samples_checked;
+	/** Number of samples which were skipped without checking them. */
+	uint64_t samples_skipped;
+	/** Number of times wait() or wait_runs() returned to the decoder. */
+	uint64_t waits;
+	/** Number of output items, indexed by enum srd_output_type. */
+	uint64_t puts[SRD_OUTPUT_META + 1];
+	/** Time spent in the frontend's output callbacks. */
+	uint64_t callback_time;
+};
+
+/** Statistics of a decoder session, see srd_session_stats_get(). */
+struct srd_session_stats {
+	/** Number of chunks of samples which were sent to the session. */
+	uint64_t chunks;
+	/** Number of samples which were sent to the session. */
+	uint64_t samples;
+	/** Time spent in srd_session_send() and its variants. */
+	uint64_t send_time;
+	/** Sums of the statistics of all of the session's decoder instances. */
+	struct srd_inst_stats insts;
+};
+
 struct srd_decoder_inst {
 	struct srd_decoder *decoder;
 	struct srd_session *sess;
@@ -241,7 +281,22 @@ struct srd_decoder_inst {
 	GSList *next_di;
 
 	/** List of conditions a PD wants to wait for. */
-	GSList *condition_list;
+	struct srd_condition_list *condition_list;
+
+	/** Recently compiled condition lists, for reuse by later wait() calls. */
+	GPtrArray *condition_cache;
+
+	/** Index of the 'condition_cache' entry to replace next. */
+	unsigned int condition_cache_next;
+
+	/** Condition list for wait() calls without conditions. */
+	struct srd_condition_list *skip_condition;
+
+	/** Condition list of the current wait_points() call. */
+	struct srd_condition_list *points_condition;
+
+	/** Statistics, see srd_inst_stats_get(). */
+	struct srd_inst_stats stats;
 
 	/** Array of booleans denoting which conditions matched. */
 	GArray *match_array;
@@ -258,12 +313,43 @@ struct srd_decoder_inst {
 	/** Length (in bytes) of the input sample buffer. */
 	uint64_t inbuflen;
 
+	/**
+	 * Sample numbers at which the samples in 'inbuf' start to apply, if
+	 * the chunk holds change-only (run-length) data. NULL for chunks of
+	 * raw samples.
+	 */
+	const uint64_t *inbuf_samplenums;
+
 	/** Absolute current samplenumber. */
 	uint64_t abs_cur_samplenum;
 
+	/** Absolute number of the first sample the instance receives. */
+	uint64_t abs_first_samplenum;
+
 	/** Array of "old" (previous sample) pin values. */
 	GArray *old_pins_array;
 
+	/** Cache of interned annotation texts (a Python dict). */
+	void *ann_text_cache;
+
+	/** Bound decode() method, for OUTPUT_PYTHON data from lower PDs. */
+	void *py_decode;
+
+	/** Bound decode_many() method, if the decoder implements it. */
+	void *py_decode_many;
+
+	/** Queue of (ss, es, data) tuples for decode_many() (a Python list). */
+	void *py_input_queue;
+
+	/**
+	 * Mask of the sample data bits which carry this instance's channels
+	 * ('data_unitsize' bytes), rebuilt for every chunk of input samples.
+	 */
+	uint8_t *sample_mask;
+
+	/** The sample mask as a single word (unit sizes up to 8 bytes). */
+	uint64_t sample_mask_word;
+
 	/** Handle for this PD stack's worker thread. */
 	GThread *thread_handle;
 
@@ -276,6 +362,9 @@ struct srd_decoder_inst {
 	/** Requests termination of wait() and decode(). */
 	gboolean want_wait_terminate;
 
+	/** Indicates that no more samples follow, wait() raises EOFError. */
+	gboolean communicate_eof;
+
 	GCond got_new_samples_cond;
 	GCond handled_all_samples_cond;
 	GMutex data_mutex;
@@ -298,6 +387,18 @@ struct srd_proto_data {
 	struct srd_pd_output *pdo;
 	void *data;
 };
+
+/**
+ * Annotation output of a protocol decoder.
+ *
+ * The annotation data and its texts are owned by libsigrokdecode, frontends
+ * must neither free nor modify them. They are valid at least until the
+ * output callback returns. Frequently used texts are interned per decoder
+ * instance: identical texts are then passed as the very same 'ann_text'
+ * vector, which stays valid until the decoder instance gets destroyed.
+ * Frontends which keep annotation texts beyond the callback must copy them,
+ * but may use pointer comparison of 'ann_text' to avoid repeated copies.
+ */
 struct srd_proto_data_annotation {
 	int ann_class;
 	char **ann_text;
@@ -311,10 +412,15 @@ struct srd_proto_data_binary {
 typedef void (*srd_pd_output_callback)(struct srd_proto_data *pdata,
 					void *cb_data);
 
+typedef void (*srd_pd_output_bulk_callback)(struct srd_proto_data *pdata,
+					unsigned int count, void *cb_data);
+
 struct srd_pd_callback {
 	int output_type;
 	srd_pd_output_callback cb;
 	void *cb_data;
+	/** Alternative to 'cb', receives arrays of output items. */
+	srd_pd_output_bulk_callback bulk_cb;
 };
 
 /* srd.c */
@@ -329,9 +435,28 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 SRD_API int srd_session_send(struct srd_session *sess,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_API int srd_session_send_rle(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint64_t *samplenums, const uint8_t *values,
+		uint64_t num_changes, uint64_t unitsize);
+SRD_API int srd_session_send_file(struct srd_session *sess,
+		const char *filename, uint64_t unitsize, uint64_t samplerate);
+SRD_API int srd_session_send_eof(struct srd_session *sess);
+SRD_API int srd_session_shard_set(struct srd_session *sess,
+		uint64_t lead_in, uint64_t start, uint64_t end);
+SRD_API int srd_shard_points_find(const uint8_t *data, uint64_t num_samples,
+		uint64_t unitsize, uint64_t idle_mask, uint64_t idle_value,
+		uint64_t min_idle, unsigned int num_shards, GArray **points);
+SRD_API int srd_session_parallel_set(struct srd_session *sess,
+		gboolean parallel);
+SRD_API int srd_session_stats_set(struct srd_session *sess, gboolean enable);
+SRD_API int srd_session_stats_get(struct srd_session *sess,
+		struct srd_session_stats *stats);
 SRD_API int srd_session_destroy(struct srd_session *sess);
 SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 		int output_type, srd_pd_output_callback cb, void *cb_data);
+SRD_API int srd_pd_output_bulk_callback_add(struct srd_session *sess,
+		int output_type, srd_pd_output_bulk_callback cb, void *cb_data);
 
 /* decoder.c */
 SRD_API const GSList *srd_decoder_list(void);
@@ -355,6 +480,8 @@ SRD_API struct srd_decoder_inst *srd_inst_find_by_id(struct srd_session *sess,
 		const char *inst_id);
 SRD_API int srd_inst_initial_pins_set_all(struct srd_decoder_inst *di,
 		GArray *initial_pins);
+SRD_API int srd_inst_stats_get(struct srd_decoder_inst *di,
+		struct srd_inst_stats *stats);
 
 /* log.c */
 typedef int (*srd_log_callback)(void *cb_data, int loglevel,
@@ -22,8 +22,12 @@
 #include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
 #include <inttypes.h>
+#include <string.h>
 #include <glib.h>
 
+/* Number of sample data bytes per chunk of srd_session_send_file(). */
+#define SEND_FILE_CHUNK_SIZE	(4 * 1024 * 1024)
+
 /**
  * @file
  *
@@ -79,6 +83,11 @@ SRD_API int srd_session_new(struct srd_session **sess)
 	*sess = g_malloc(sizeof(struct srd_session));
 	(*sess)->session_id = ++max_session_id;
 	(*sess)->di_list = (*sess)->callbacks = NULL;
+	(*sess)->parallel = FALSE;
+	(*sess)->stats_enabled = FALSE;
+	memset(&(*sess)->stats, 0, sizeof((*sess)->stats));
+	(*sess)->sharded = FALSE;
+	(*sess)->shard_lead_in = (*sess)->shard_start = (*sess)->shard_end = 0;
 
 	/* Keep a list of all sessions, so we can clean up as needed. */
 	sessions = g_slist_append(sessions, *sess);
@@ -117,6 +126,11 @@ SRD_API int srd_session_start(struct srd_session *sess)
 	ret = SRD_OK;
 	for (d = sess->di_list; d; d = d->next) {
 		di = d->data;
+		if (sess->sharded) {
+			/* Samples start at the shard's lead-in. */
+			di->abs_first_samplenum = sess->shard_lead_in;
+			di->abs_cur_samplenum = sess->shard_lead_in;
+		}
 		if ((ret = srd_inst_start(di)) != SRD_OK)
 			break;
 	}
@@ -218,6 +232,58 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 	return ret;
 }
 
+/*
+ * Pass a chunk of samples (raw, or change-only when 'samplenums' is not
+ * NULL) to all of the session's decoder stacks.
+ */
+static int send_chunk(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		const uint64_t *samplenums)
+{
+	GSList *d, *l;
+	gint64 t_start;
+	int ret;
+
+	t_start = sess->stats_enabled ? g_get_monotonic_time() : 0;
+
+	ret = SRD_OK;
+	if (!sess->parallel) {
+		for (d = sess->di_list; d; d = d->next) {
+			if ((ret = srd_inst_decode_start(d->data,
+					abs_start_samplenum, abs_end_samplenum,
+					inbuf, inbuflen, unitsize,
+					samplenums)) != SRD_OK)
+				break;
+			srd_inst_decode_wait(d->data);
+		}
+	} else {
+		/*
+		 * Hand the chunk to all decoder stacks first, then wait for
+		 * all of them, such that their worker threads run concurrently.
+		 * Only wait for those stacks which actually received the chunk.
+		 */
+		for (d = sess->di_list; d; d = d->next) {
+			if ((ret = srd_inst_decode_start(d->data,
+					abs_start_samplenum, abs_end_samplenum,
+					inbuf, inbuflen, unitsize,
+					samplenums)) != SRD_OK)
+				break;
+		}
+		for (l = sess->di_list; l != d; l = l->next)
+			srd_inst_decode_wait(l->data);
+	}
+
+	if (ret == SRD_OK) {
+		sess->stats.chunks++;
+		sess->stats.samples += abs_end_samplenum - abs_start_samplenum;
+	}
+	if (sess->stats_enabled)
+		sess->stats.send_time += g_get_monotonic_time() - t_start;
+
+	return ret;
+}
+
 /**
  * Send a chunk of logic sample data to a running decoder session.
  *
@@ -232,7 +298,8 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
  * The calls to this function must provide the samples that shall be
  * used by the protocol decoder
  *  - in the correct order ([...]5, 6, 4, 7, 8[...] is a bug),
- *  - starting from sample zero (2, 3, 4, 5, 6[...] is a bug),
+ *  - starting from sample zero (2, 3, 4, 5, 6[...] is a bug), or from
+ *    the lead-in of a shard, see srd_session_shard_set(),
  *  - consecutively, with no gaps (0, 1, 2, 4, 5[...] is a bug).
  *
  * The start- and end-sample numbers are absolute sample numbers (relative
@@ -279,6 +346,183 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 SRD_API int srd_session_send(struct srd_session *sess,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	return send_chunk(sess, abs_start_samplenum, abs_end_samplenum,
+		inbuf, inbuflen, unitsize, NULL);
+}
+
+/**
+ * Send a chunk of change-only logic sample data to a running decoder session.
+ *
+ * This is an alternative to srd_session_send() for captures which are
+ * available as a list of transitions. Instead of every single sample, the
+ * chunk only holds the samples at which any channel changed: the i-th
+ * sample in 'values' applies from the absolute sample number samplenums[i]
+ * up to the next change, or up to the end of the chunk. Decoders handle
+ * such chunks without ever expanding the unchanged samples inbetween.
+ *
+ * The layout of the samples in 'values' and the rules for the absolute
+ * start- and end-sample numbers are the same as for srd_session_send().
+ * Chunks in either format can be mixed within a session.
+ *
+ * Example (4096 samples total, a pulse on channel 0 at samples 1000-1499,
+ * sent as a single chunk):
+ *   const uint64_t samplenums[] = { 0, 1000, 1500 };
+ *   const uint8_t values[] = { 0x00, 0x01, 0x00 };
+ *   srd_session_send_rle(s, 0, 4096, samplenums, values, 3, 1);
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param abs_start_samplenum The absolute starting sample number for the
+ *              chunk, relative to the start of capture.
+ * @param abs_end_samplenum The absolute ending sample number for the
+ *              chunk, relative to the start of capture.
+ * @param samplenums Absolute sample numbers of the changes. Must not be
+ *              NULL. The first entry must be 'abs_start_samplenum', the
+ *              entries must strictly increase and be less than
+ *              'abs_end_samplenum'.
+ * @param values The samples at the changes, 'unitsize' bytes each.
+ *              Must not be NULL.
+ * @param num_changes The number of changes. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_rle(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint64_t *samplenums, const uint8_t *values,
+		uint64_t num_changes, uint64_t unitsize)
+{
+	uint64_t i;
+
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (!samplenums || !values || !num_changes || !unitsize)
+		return SRD_ERR_ARG;
+
+	if (samplenums[0] != abs_start_samplenum) {
+		srd_err("First change must be at the chunk's start sample.");
+		return SRD_ERR_ARG;
+	}
+	for (i = 0; i < num_changes; i++) {
+		if ((i && samplenums[i] <= samplenums[i - 1]) ||
+		    samplenums[i] >= abs_end_samplenum) {
+			srd_err("Invalid sample number %" PRIu64 " of change %"
+				PRIu64 ".", samplenums[i], i);
+			return SRD_ERR_ARG;
+		}
+	}
+
+	return send_chunk(sess, abs_start_samplenum, abs_end_samplenum,
+		values, num_changes * unitsize, unitsize, samplenums);
+}
+
+/**
+ * Send the logic sample data of a raw capture file to a running session.
+ *
+ * The file is mapped into memory and passed to the decoders in chunks
+ * of SEND_FILE_CHUNK_SIZE bytes (rounded down to whole samples), without
+ * copying the sample data. The file's samples are numbered starting at
+ * sample 0, so the session must not have received samples before. The
+ * layout of the samples is the same as for srd_session_send(), trailing
+ * bytes which don't form a complete sample are ignored.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param filename The name of the capture file. Must not be NULL.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ * @param samplerate The samplerate of the capture, which gets passed to
+ *                   the decoders before the samples. 0 if the samplerate
+ *                   is unknown, or was already set using
+ *                   srd_session_metadata_set().
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_file(struct srd_session *sess,
+		const char *filename, uint64_t unitsize, uint64_t samplerate)
+{
+	GMappedFile *file;
+	GError *error;
+	const uint8_t *data;
+	uint64_t num_samples, chunk_samples, start, end;
+	int ret;
+
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (!filename || !unitsize)
+		return SRD_ERR_ARG;
+
+	error = NULL;
+	if (!(file = g_mapped_file_new(filename, FALSE, &error))) {
+		srd_err("Cannot map capture file: %s.", error->message);
+		g_error_free(error);
+		return SRD_ERR;
+	}
+
+	data = (const uint8_t *)g_mapped_file_get_contents(file);
+	num_samples = g_mapped_file_get_length(file) / unitsize;
+	if (!data || !num_samples) {
+		srd_err("Capture file '%s' holds no samples.", filename);
+		g_mapped_file_unref(file);
+		return SRD_ERR_ARG;
+	}
+
+	if (samplerate && (ret = srd_session_metadata_set(sess,
+			SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(samplerate))) != SRD_OK) {
+		g_mapped_file_unref(file);
+		return ret;
+	}
+
+	srd_dbg("Sending %" PRIu64 " samples from capture file '%s'.",
+		num_samples, filename);
+
+	chunk_samples = MAX(SEND_FILE_CHUNK_SIZE / unitsize, 1);
+	ret = SRD_OK;
+	for (start = 0; start < num_samples; start = end) {
+		end = start + MIN(chunk_samples, num_samples - start);
+		ret = send_chunk(sess, start, end, data + start * unitsize,
+			(end - start) * unitsize, unitsize, NULL);
+		if (ret != SRD_OK)
+			break;
+	}
+
+	g_mapped_file_unref(file);
+
+	return ret;
+}
+
+/**
+ * Tell a running decoder session that the end of the input was reached.
+ *
+ * The decoders' pending wait() calls raise EOFError, which lets them
+ * submit output that they accumulated (e.g. the final sizes of a file
+ * which they write to their binary output). Decoders which don't handle
+ * EOFError just stop. This returns when all decoders are done, after
+ * their output has been passed to the callbacks and up the stacks.
+ *
+ * No more samples can be sent to the session afterwards.
+ *
+ * @param sess The session to use. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_eof(struct srd_session *sess)
 {
 	GSList *d;
 	int ret;
@@ -288,15 +532,286 @@ SRD_API int srd_session_send(struct srd_session *sess,
 		return SRD_ERR_ARG;
 	}
 
+	srd_dbg("Sending EOF to session %d.", sess->session_id);
 	for (d = sess->di_list; d; d = d->next) {
-		if ((ret = srd_inst_decode(d->data, abs_start_samplenum,
-				abs_end_samplenum, inbuf, inbuflen, unitsize)) != SRD_OK)
+		if ((ret = srd_inst_send_eof(d->data)) != SRD_OK)
 			return ret;
 	}
 
 	return SRD_OK;
 }
 
+/**
+ * Restrict a session to one shard (a time segment) of a capture.
+ *
+ * A long capture can be split into shards at points where the bus is idle
+ * (see srd_shard_points_find()), which then get decoded concurrently in
+ * separate sessions, usually in separate processes.
+ *
+ * The session's samples start at 'lead_in' instead of sample 0. This lets
+ * the decoders see the idle bus before the shard starts (decoders which
+ * receive samples from the middle of a transfer can lose synchronization,
+ * so the lead-in should not reach beyond the idle period). Output
+ * items are only passed to the frontend's callbacks if their start sample
+ * lies within [start, end), items of the lead-in are duplicates of the
+ * previous shard's output. The samples which are sent to the session
+ * should extend beyond 'end' for a while, such that the decoders can
+ * complete items which started before it. Concatenating the output of all
+ * shards in order then yields the output for the whole capture.
+ *
+ * Stacked decoders receive all of the lower decoders' output, also that
+ * of the lead-in.
+ *
+ * Must be called before srd_session_start().
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param lead_in The number of the first sample which gets sent to the
+ *                session. Must be <= start.
+ * @param start The number of the shard's first sample.
+ * @param end The number of the sample after the shard. Must be > start.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_shard_set(struct srd_session *sess,
+		uint64_t lead_in, uint64_t start, uint64_t end)
+{
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (lead_in > start || start >= end) {
+		srd_err("Invalid shard %" PRIu64 "/%" PRIu64 "-%" PRIu64 ".",
+			lead_in, start, end);
+		return SRD_ERR_ARG;
+	}
+
+	srd_dbg("Session %d decodes shard %" PRIu64 "-%" PRIu64 " (lead-in "
+		"from %" PRIu64 ").", sess->session_id, start, end, lead_in);
+
+	sess->sharded = TRUE;
+	sess->shard_lead_in = lead_in;
+	sess->shard_start = start;
+	sess->shard_end = end;
+
+	return SRD_OK;
+}
+
+/* Get the sample at 'data' as a single word (unit sizes up to 8 bytes). */
+static uint64_t shard_sample_word(const uint8_t *data, uint64_t unitsize)
+{
+	uint64_t word, i;
+
+	word = 0;
+	for (i = 0; i < unitsize; i++)
+		word |= (uint64_t)data[i] << (8 * i);
+
+	return word;
+}
+
+/**
+ * Find points at which a capture can be split into shards.
+ *
+ * A boundary is placed in the middle of the first idle period which ends
+ * after each of the points that would split the capture into 'num_shards'
+ * equally sized parts. The bus is considered idle while the bits in
+ * 'idle_mask' of the samples equal those in 'idle_value' for at least
+ * 'min_idle' samples. Examples are a UART's RX line being high for longer
+ * than a frame, SCL and SDA being high after an I²C STOP condition, a CAN
+ * bus being recessive for longer than the interframe space, or the CS#
+ * line of SPI being deasserted. Decoders resynchronize to the bus there.
+ *
+ * Bit n of the mask and value refers to bit (n % 8) of byte (n / 8) of a
+ * sample, i.e. to the sample data as sent to srd_session_send().
+ *
+ * @param data The samples of the capture. Must not be NULL.
+ * @param num_samples The number of samples. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be 1..8.
+ * @param idle_mask The sample bits which must be constant while idle.
+ * @param idle_value The values of the 'idle_mask' bits while idle.
+ * @param min_idle The minimum length of an idle period, in samples.
+ *                 Must be > 0.
+ * @param num_shards The wanted number of shards. Must be > 0.
+ * @param points Will be set to a newly allocated array of uint64_t sample
+ *               numbers, which the caller must g_array_free(). The first
+ *               is 0, the last is 'num_samples', shard i covers the samples
+ *               [points[i], points[i + 1]). Fewer than 'num_shards' shards
+ *               result if the capture lacks idle periods. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_shard_points_find(const uint8_t *data, uint64_t num_samples,
+		uint64_t unitsize, uint64_t idle_mask, uint64_t idle_value,
+		uint64_t min_idle, unsigned int num_shards, GArray **points)
+{
+	uint64_t i, target, run_start, cut;
+	unsigned int shard;
+	gboolean idle, was_idle;
+
+	if (!data || !num_samples || !unitsize || unitsize > 8 ||
+	    !min_idle || !num_shards || !points)
+		return SRD_ERR_ARG;
+
+	*points = g_array_sized_new(FALSE, FALSE, sizeof(uint64_t),
+		num_shards + 1);
+	cut = 0;
+	g_array_append_val(*points, cut);
+
+	shard = 1;
+	target = num_samples / num_shards;
+	was_idle = FALSE;
+	run_start = 0;
+	for (i = 0; i <= num_samples && shard < num_shards; i++) {
+		idle = i < num_samples && (shard_sample_word(data + i * unitsize,
+			unitsize) & idle_mask) == (idle_value & idle_mask);
+		if (idle == was_idle)
+			continue;
+		was_idle = idle;
+		if (idle) {
+			run_start = i;
+			continue;
+		}
+
+		/* An idle period [run_start, i) just ended. */
+		if (i - run_start < min_idle || i <= target)
+			continue;
+		cut = run_start + (i - run_start) / 2;
+		if (cut <= g_array_index(*points, uint64_t, (*points)->len - 1))
+			continue;
+		g_array_append_val(*points, cut);
+		while (shard < num_shards && target <= cut)
+			target = num_samples / num_shards * ++shard;
+	}
+
+	g_array_append_val(*points, num_samples);
+
+	srd_dbg("Found %u shards for %u wanted.", (*points)->len - 1,
+		num_shards);
+
+	return SRD_OK;
+}
+
+/**
+ * Enable or disable concurrent decoding of a session's decoder stacks.
+ *
+ * By default srd_session_send() passes a chunk of samples to one decoder
+ * stack after the other, and waits for each stack to handle all of the
+ * chunk's samples before the next stack receives it.
+ *
+ * In parallel mode the chunk is handed to all stacks at once, and
+ * srd_session_send() returns after all of them have handled it. This lets
+ * the stacks' worker threads overlap their condition matching and frontend
+ * callbacks (execution of Python code is still serialized by the GIL).
+ *
+ * @note In parallel mode the frontend's output callbacks can get invoked
+ *       concurrently from several threads, and output of different stacks
+ *       is no longer delivered in a fixed order. Callbacks must be
+ *       thread-safe when this mode is enabled.
+ *
+ * @param sess The session to configure. Must not be NULL.
+ * @param parallel TRUE to decode all stacks concurrently, FALSE to decode
+ *                 them one after another.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_parallel_set(struct srd_session *sess,
+		gboolean parallel)
+{
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	srd_dbg("%s parallel decoding in session %d.",
+		parallel ? "Enabling" : "Disabling", sess->session_id);
+
+	sess->parallel = parallel ? TRUE : FALSE;
+
+	return SRD_OK;
+}
+
+/**
+ * Enable or disable the collection of timings in a session.
+ *
+ * Statistics counters of the session and its decoder instances are always
+ * maintained. Timings involve reading the clock and only get collected
+ * while enabled. They are disabled by default.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param enable TRUE to collect timings, FALSE to stop collecting them.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_stats_set(struct srd_session *sess, gboolean enable)
+{
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	sess->stats_enabled = enable ? TRUE : FALSE;
+
+	return SRD_OK;
+}
+
+static void add_inst_stats(struct srd_inst_stats *sum, GSList *di_list)
+{
+	GSList *l;
+	struct srd_decoder_inst *di;
+	unsigned int i;
+
+	for (l = di_list; l; l = l->next) {
+		di = l->data;
+		sum->samples_checked += di->stats.samples_checked;
+		sum->samples_skipped += di->stats.samples_skipped;
+		sum->waits += di->stats.waits;
+		for (i = 0; i < G_N_ELEMENTS(sum->puts); i++)
+			sum->puts[i] += di->stats.puts[i];
+		sum->callback_time += di->stats.callback_time;
+		add_inst_stats(sum, di->next_di);
+	}
+}
+
+/**
+ * Get the statistics of a session.
+ *
+ * Besides the session's own counters, this sums up the statistics of
+ * all decoder instances in the session (including stacked ones). The
+ * values are exact when no srd_session_send() call is in progress.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param stats The statistics will be stored here. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_stats_get(struct srd_session *sess,
+		struct srd_session_stats *stats)
+{
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (!stats)
+		return SRD_ERR_ARG;
+
+	*stats = sess->stats;
+	memset(&stats->insts, 0, sizeof(stats->insts));
+	add_inst_stats(&stats->insts, sess->di_list);
+
+	return SRD_OK;
+}
+
 /**
  * Destroy a decoding session.
  *
@@ -361,6 +876,57 @@ SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 	pd_cb->output_type = output_type;
 	pd_cb->cb = cb;
 	pd_cb->cb_data = cb_data;
+	pd_cb->bulk_cb = NULL;
+	sess->callbacks = g_slist_append(sess->callbacks, pd_cb);
+
+	return SRD_OK;
+}
+
+/**
+ * Register/add a decoder output callback function which receives output
+ * items in bulk.
+ *
+ * This is an alternative to srd_pd_output_callback_add(). Instead of one
+ * call per output item, the function receives an array of 'count' items
+ * (struct srd_proto_data) per call. Decoders which submit their output via
+ * the put_many() method have all items of one put_many() call which are of
+ * the same output type delivered in a single call (in their original
+ * order), other output is delivered as arrays of one item. The array and
+ * its items are only valid for the duration of the call.
+ *
+ * Only one callback (regular or bulk) per output type can be registered.
+ *
+ * @param sess The output session in which to register the callback.
+ * @param output_type The output type this callback will receive.
+ * @param cb The function to call. Must not be NULL.
+ * @param cb_data Private data for the callback function. Can be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_pd_output_bulk_callback_add(struct srd_session *sess,
+		int output_type, srd_pd_output_bulk_callback cb, void *cb_data)
+{
+	struct srd_pd_callback *pd_cb;
+
+	if (session_is_valid(sess) != SRD_OK) {
+		srd_err("Invalid session.");
+		return SRD_ERR_ARG;
+	}
+
+	if (!cb) {
+		srd_err("Invalid callback.");
+		return SRD_ERR_ARG;
+	}
+
+	srd_dbg("Registering new bulk callback for output type %d.", output_type);
+
+	pd_cb = g_malloc(sizeof(struct srd_pd_callback));
+	pd_cb->output_type = output_type;
+	pd_cb->cb = NULL;
+	pd_cb->cb_data = cb_data;
+	pd_cb->bulk_cb = cb;
 	sess->callbacks = g_slist_append(sess->callbacks, pd_cb);
 
 	return SRD_OK;
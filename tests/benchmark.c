@@ -0,0 +1,718 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, see <http://www.gnu.org/licenses/>.
+ */
+
+/*
+ * Throughput benchmarks for libsigrokdecode.
+ *
+ * This is not part of the unit test suite (timing results depend on the
+ * machine and its load). Build it with "make tests/benchmark" and run it
+ * from the build directory.
+ */
+
+#include <config.h>
+#include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <glib.h>
+#include <inttypes.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/resource.h>
+
+#define DEFAULT_SAMPLERATE	24000000
+#define DEFAULT_ACTIVITY	50
+
+#define UART_BAUDRATE		115200
+#define UART_BITLEN		10
+#define SPI_CLOCK		1000000
+#define I2C_CLOCK		400000
+#define CAN_BITRATE		1000000
+#define USB_LS_BITRATE		1500000
+#define JTAG_CLOCK		1000000
+#define SWD_CLOCK		1000000
+#define I2S_CLOCK		(48000 * 32)
+#define PARALLEL_CLOCK		1000000
+
+/*
+ * State of a signal generator: the samples are written to 'buf' one
+ * symbol at a time, where 'pos' is the (fractional) sample position at
+ * which the current symbol ends. This keeps the timing exact over long
+ * runs, whatever the ratio between samplerate and bus clock.
+ */
+struct gen {
+	uint8_t *buf;
+	uint64_t len;
+	uint64_t n;
+	unsigned int unitsize;
+	double samplerate;
+	double activity;
+	double pos;
+	double burst_start;
+};
+
+struct bench_proto {
+	const char *id;
+	unsigned int unitsize;
+	void (*gen)(struct gen *g);
+	/* Decoder to stack on top, or NULL. */
+	const char *stacked_id;
+};
+
+static uint64_t num_annotations;
+
+static void ann_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	(void)pdata;
+	(void)cb_data;
+
+	num_annotations++;
+}
+
+/* Repeat a sample up to the (fractional) sample position 'end'. */
+static void gen_until(struct gen *g, uint16_t value, double end)
+{
+	uint64_t last;
+	unsigned int i;
+	uint8_t *p;
+
+	g->pos = end;
+	last = (uint64_t)(end + 0.5);
+	if (last > g->len)
+		last = g->len;
+	while (g->n < last) {
+		p = g->buf + g->n * g->unitsize;
+		for (i = 0; i < g->unitsize; i++)
+			p[i] = (value >> (8 * i)) & 0xff;
+		g->n++;
+	}
+}
+
+/* Hold a sample for the given number of seconds. */
+static void gen_hold(struct gen *g, uint16_t value, double secs)
+{
+	gen_until(g, value, g->pos + secs * g->samplerate);
+}
+
+/* One clock cycle, with the data lines changing while the clock is low. */
+static void gen_clock(struct gen *g, uint16_t value, uint16_t clk,
+		double period)
+{
+	gen_hold(g, value & ~clk, period / 2);
+	gen_hold(g, value | clk, period / 2);
+}
+
+/*
+ * End a burst of bus activity, and let the bus idle for as long as it
+ * takes to reach the configured activity ratio.
+ */
+static void gen_idle(struct gen *g, uint16_t value)
+{
+	double busy;
+
+	busy = g->pos - g->burst_start;
+	gen_until(g, value, g->pos + busy * (1 - g->activity) / g->activity);
+	g->burst_start = g->pos;
+}
+
+static gboolean gen_done(const struct gen *g)
+{
+	return g->n >= g->len;
+}
+
+/* UART 8N1 frames on RX (bit 0), with TX (bit 1) idling high. */
+static void gen_uart(struct gen *g)
+{
+	int bit, level;
+	uint8_t value;
+
+	value = 0;
+	while (!gen_done(g)) {
+		for (bit = -1; bit <= 8; bit++) {
+			if (bit == -1)
+				level = 0;
+			else if (bit == 8)
+				level = 1;
+			else
+				level = (value >> bit) & 1;
+			gen_hold(g, 0x02 | level, 1.0 / UART_BAUDRATE);
+		}
+		value++;
+		gen_idle(g, 0x03);
+	}
+}
+
+/* SPI mode 0 transfers of 8 words: CLK, MISO, MOSI, CS# on bits 0-3. */
+static void gen_spi(struct gen *g)
+{
+	const double period = 1.0 / SPI_CLOCK;
+	int i, bit;
+	uint16_t data;
+	uint8_t value;
+
+	value = 0;
+	while (!gen_done(g)) {
+		gen_hold(g, 0x00, period);
+		for (i = 0; i < 8; i++, value++) {
+			for (bit = 7; bit >= 0; bit--) {
+				data = (((value >> bit) & 1) << 2) |
+					((~value >> bit) & 1) << 1;
+				gen_clock(g, data, 0x01, period);
+			}
+		}
+		gen_hold(g, 0x00, period);
+		gen_idle(g, 0x08);
+	}
+}
+
+/* One I2C bit (SCL on bit 0, SDA on bit 1), in quarter clock periods. */
+static void gen_i2c_bit(struct gen *g, int bit)
+{
+	const double quarter = 1.0 / (4 * I2C_CLOCK);
+	uint16_t sda;
+
+	sda = bit << 1;
+	gen_hold(g, sda, quarter);
+	gen_hold(g, sda | 0x01, 2 * quarter);
+	gen_hold(g, sda, quarter);
+}
+
+/* I2C writes of 4 data bytes to address 0x50, acknowledged by the slave. */
+static void gen_i2c(struct gen *g)
+{
+	const double quarter = 1.0 / (4 * I2C_CLOCK);
+	int i, bit;
+	uint8_t byte, value;
+
+	value = 0;
+	while (!gen_done(g)) {
+		/* START condition. */
+		gen_hold(g, 0x03, quarter);
+		gen_hold(g, 0x01, quarter);
+		gen_hold(g, 0x00, quarter);
+		for (i = 0; i < 5; i++) {
+			byte = (i == 0) ? (0x50 << 1) : value++;
+			for (bit = 7; bit >= 0; bit--)
+				gen_i2c_bit(g, (byte >> bit) & 1);
+			gen_i2c_bit(g, 0);
+		}
+		/* STOP condition. */
+		gen_hold(g, 0x00, quarter);
+		gen_hold(g, 0x01, quarter);
+		gen_hold(g, 0x03, quarter);
+		gen_idle(g, 0x03);
+	}
+}
+
+/*
+ * Build a classic CAN data frame with an 11-bit identifier, including
+ * stuff bits, CRC, ACK (asserted by a receiver), EOF and interframe space.
+ * Returns the number of bits.
+ */
+static int can_frame(uint8_t *bits, uint16_t id, const uint8_t *data, int dlc)
+{
+	uint8_t raw[19 + 64 + 15];
+	uint16_t crc;
+	int i, n, num_raw, count, last;
+
+	num_raw = 0;
+	raw[num_raw++] = 0; /* SOF */
+	for (i = 10; i >= 0; i--)
+		raw[num_raw++] = (id >> i) & 1;
+	raw[num_raw++] = 0; /* RTR */
+	raw[num_raw++] = 0; /* IDE */
+	raw[num_raw++] = 0; /* r0 */
+	for (i = 3; i >= 0; i--)
+		raw[num_raw++] = (dlc >> i) & 1;
+	for (i = 0; i < dlc * 8; i++)
+		raw[num_raw++] = (data[i / 8] >> (7 - i % 8)) & 1;
+
+	crc = 0;
+	for (i = 0; i < num_raw; i++) {
+		if (raw[i] ^ ((crc >> 14) & 1))
+			crc = ((crc << 1) ^ 0x4599) & 0x7fff;
+		else
+			crc = (crc << 1) & 0x7fff;
+	}
+	for (i = 14; i >= 0; i--)
+		raw[num_raw++] = (crc >> i) & 1;
+
+	/* A stuff bit of opposite level follows five bits of equal level. */
+	n = count = 0;
+	last = -1;
+	for (i = 0; i < num_raw; i++) {
+		bits[n++] = raw[i];
+		if (raw[i] == last) {
+			count++;
+		} else {
+			last = raw[i];
+			count = 1;
+		}
+		if (count == 5) {
+			last = !last;
+			bits[n++] = last;
+			count = 1;
+		}
+	}
+
+	bits[n++] = 1; /* CRC delimiter */
+	bits[n++] = 0; /* ACK slot */
+	bits[n++] = 1; /* ACK delimiter */
+	for (i = 0; i < 7 + 3; i++)
+		bits[n++] = 1; /* EOF, interframe space */
+
+	return n;
+}
+
+/* CAN frames with 8 data bytes and incrementing identifiers on bit 0. */
+static void gen_can(struct gen *g)
+{
+	uint8_t bits[160], data[8];
+	uint16_t id;
+	int i, num_bits;
+
+	id = 0;
+	while (!gen_done(g)) {
+		for (i = 0; i < 8; i++)
+			data[i] = id + i;
+		num_bits = can_frame(bits, id, data, 8);
+		for (i = 0; i < num_bits; i++)
+			gen_hold(g, bits[i], 1.0 / CAN_BITRATE);
+		id = (id + 1) & 0x7ff;
+		gen_idle(g, 0x01);
+	}
+}
+
+/*
+ * Low-speed USB DATA0 packets with 8 bytes of payload, on D+ (bit 0) and
+ * D- (bit 1). The bits are NRZI encoded and stuffed after six ones.
+ */
+static void gen_usb_signalling(struct gen *g)
+{
+	const double bit = 1.0 / USB_LS_BITRATE;
+	const uint16_t j = 0x02, k = 0x01, se0 = 0x00;
+	uint8_t packet[12];
+	uint16_t level;
+	int i, b, ones;
+	uint8_t value;
+
+	value = 0;
+	while (!gen_done(g)) {
+		packet[0] = 0x80; /* SYNC */
+		packet[1] = 0xc3; /* DATA0 */
+		for (i = 2; i < 12; i++)
+			packet[i] = value++;
+		level = j;
+		ones = 0;
+		for (i = 0; i < 12 * 8; i++) {
+			b = (packet[i / 8] >> (i % 8)) & 1;
+			if (!b)
+				level = (level == j) ? k : j;
+			gen_hold(g, level, bit);
+			ones = b ? ones + 1 : 0;
+			if (ones == 6) {
+				level = (level == j) ? k : j;
+				gen_hold(g, level, bit);
+				ones = 0;
+			}
+		}
+		/* EOP */
+		gen_hold(g, se0, 2 * bit);
+		gen_hold(g, j, bit);
+		gen_idle(g, j);
+	}
+}
+
+/* One 1-Wire time slot at standard speed. */
+static void gen_onewire_bit(struct gen *g, int bit)
+{
+	if (bit) {
+		gen_hold(g, 0, 6e-6);
+		gen_hold(g, 1, 64e-6);
+	} else {
+		gen_hold(g, 0, 60e-6);
+		gen_hold(g, 1, 10e-6);
+	}
+}
+
+/* 1-Wire reset/presence, followed by Skip ROM and 9 more bytes. */
+static void gen_onewire_link(struct gen *g)
+{
+	int i, bit;
+	uint8_t byte, value;
+
+	value = 0;
+	gen_hold(g, 1, 10e-6);
+	while (!gen_done(g)) {
+		gen_hold(g, 0, 500e-6);
+		gen_hold(g, 1, 30e-6);
+		gen_hold(g, 0, 120e-6);
+		gen_hold(g, 1, 350e-6);
+		for (i = 0; i < 10; i++) {
+			byte = (i == 0) ? 0xcc : (i == 1) ? 0xbe : value++;
+			for (bit = 0; bit < 8; bit++)
+				gen_onewire_bit(g, (byte >> bit) & 1);
+		}
+		gen_idle(g, 1);
+	}
+}
+
+/*
+ * One JTAG TCK cycle: TDI, TDO, TCK, TMS on bits 0-3, with TRST# and
+ * SRST# (bits 4 and 5) inactive.
+ */
+static void gen_jtag_bit(struct gen *g, int tms, int tdi, int tdo)
+{
+	gen_clock(g, 0x30 | (tms << 3) | (tdo << 1) | tdi, 0x04,
+		1.0 / JTAG_CLOCK);
+}
+
+/*
+ * Shift 'len' bits through the IR or DR, starting and ending in the
+ * Run-Test/Idle state.
+ */
+static void gen_jtag_scan(struct gen *g, gboolean ir, uint32_t data, int len)
+{
+	int i;
+
+	gen_jtag_bit(g, 1, 0, 0); /* Select-DR-Scan */
+	if (ir)
+		gen_jtag_bit(g, 1, 0, 0); /* Select-IR-Scan */
+	gen_jtag_bit(g, 0, 0, 0); /* Capture */
+	gen_jtag_bit(g, 0, 0, 0); /* Shift */
+	for (i = 0; i < len; i++)
+		gen_jtag_bit(g, i == len - 1, (data >> i) & 1,
+			(~data >> i) & 1);
+	gen_jtag_bit(g, 1, 0, 0); /* Update */
+	gen_jtag_bit(g, 0, 0, 0); /* Run-Test/Idle */
+}
+
+/* JTAG IR and 32-bit DR scans, after a TAP reset. */
+static void gen_jtag(struct gen *g)
+{
+	uint32_t value;
+	int i;
+
+	for (i = 0; i < 5; i++)
+		gen_jtag_bit(g, 1, 0, 0);
+	gen_jtag_bit(g, 0, 0, 0);
+
+	value = 0x12345678;
+	while (!gen_done(g)) {
+		gen_jtag_scan(g, TRUE, 0x0e, 4);
+		gen_jtag_scan(g, FALSE, value, 32);
+		value = value * 1103515245 + 12345;
+		gen_idle(g, 0x30);
+	}
+}
+
+/* One SWD cycle: SWCLK on bit 0, SWDIO on bit 1. */
+static void gen_swd_bit(struct gen *g, int swdio)
+{
+	gen_clock(g, swdio << 1, 0x01, 1.0 / SWD_CLOCK);
+}
+
+/* SWD reads of the DP IDCODE register, after a line reset. */
+static void gen_swd(struct gen *g)
+{
+	/* Start, DP, read, A[2:3] = 0, parity, stop, park. */
+	const uint8_t request[] = { 1, 0, 1, 0, 0, 1, 0, 1 };
+	uint32_t value;
+	int i, parity;
+
+	for (i = 0; i < 56; i++)
+		gen_swd_bit(g, 1);
+	for (i = 0; i < 2; i++)
+		gen_swd_bit(g, 0);
+
+	value = 0x0ba01477;
+	while (!gen_done(g)) {
+		for (i = 0; i < 8; i++)
+			gen_swd_bit(g, request[i]);
+		gen_swd_bit(g, 1); /* Turnaround */
+		gen_swd_bit(g, 1); /* ACK: OK */
+		gen_swd_bit(g, 0);
+		gen_swd_bit(g, 0);
+		parity = 0;
+		for (i = 0; i < 32; i++) {
+			gen_swd_bit(g, (value >> i) & 1);
+			parity ^= (value >> i) & 1;
+		}
+		gen_swd_bit(g, parity);
+		gen_swd_bit(g, 1); /* Turnaround */
+		for (i = 0; i < 8; i++)
+			gen_swd_bit(g, 0);
+		value = value * 1103515245 + 12345;
+		gen_idle(g, 0x00);
+	}
+}
+
+/*
+ * I2S bursts of 4 stereo frames with 16-bit samples: SCK, WS, SD on bits
+ * 0-2. WS changes one clock before the MSB of each sample.
+ */
+static void gen_i2s(struct gen *g)
+{
+	int i, ch, bit, ws;
+	uint16_t sample;
+
+	sample = 0;
+	while (!gen_done(g)) {
+		for (i = 0; i < 4; i++) {
+			for (ch = 0; ch < 2; ch++, sample += 0x1111) {
+				for (bit = 15; bit >= 0; bit--) {
+					ws = (bit == 0) ? !ch : ch;
+					gen_clock(g, (((sample >> bit) & 1) << 2) |
+						(ws << 1), 0x01, 1.0 / I2S_CLOCK);
+				}
+			}
+		}
+		gen_idle(g, 0x00);
+	}
+}
+
+/* Bursts of 16 words on a parallel bus: CLK on bit 0, D0-D7 on bits 1-8. */
+static void gen_parallel(struct gen *g)
+{
+	int i;
+	uint8_t value;
+
+	value = 0;
+	while (!gen_done(g)) {
+		for (i = 0; i < 16; i++, value++)
+			gen_clock(g, value << 1, 0x01, 1.0 / PARALLEL_CLOCK);
+		gen_idle(g, 0x00);
+	}
+}
+
+/* Fill a buffer of 'len' samples with the given generator's signals. */
+static void gen_run(uint8_t *buf, uint64_t len, unsigned int unitsize,
+		uint64_t samplerate, double activity, void (*gen)(struct gen *g))
+{
+	struct gen g;
+
+	memset(&g, 0, sizeof(g));
+	g.buf = buf;
+	g.len = len;
+	g.unitsize = unitsize;
+	g.samplerate = samplerate;
+	g.activity = activity;
+	gen(&g);
+}
+
+static const struct bench_proto protos[] = {
+	{ "uart", 1, gen_uart, NULL },
+	{ "spi", 1, gen_spi, NULL },
+	{ "i2c", 1, gen_i2c, NULL },
+	{ "can", 1, gen_can, NULL },
+	{ "usb_signalling", 1, gen_usb_signalling, NULL },
+	{ "usb_signalling", 1, gen_usb_signalling, "usb_packet" },
+	{ "onewire_link", 1, gen_onewire_link, NULL },
+	{ "jtag", 1, gen_jtag, NULL },
+	{ "swd", 1, gen_swd, NULL },
+	{ "i2s", 1, gen_i2s, NULL },
+	{ "parallel", 2, gen_parallel, NULL },
+};
+
+/* Peak resident set size of the process so far (KiB on Linux). */
+static long peak_rss(void)
+{
+	struct rusage ru;
+
+	if (getrusage(RUSAGE_SELF, &ru) != 0)
+		return 0;
+
+	return ru.ru_maxrss;
+}
+
+/*
+ * Measure the cost of put() depending on the number of other sessions
+ * and stacked instances. The decoding session is created last, such that
+ * a linear search for the calling instance would have to visit all of the
+ * others first.
+ */
+static void bench_put(unsigned int num_sessions, unsigned int num_stacked,
+		const uint8_t *buf, uint64_t num_samples)
+{
+	struct srd_session **idle, *sess;
+	struct srd_decoder_inst *di, *di_top;
+	unsigned int i, j;
+	gint64 t_start, t_end;
+	double secs;
+
+	idle = g_malloc0(sizeof(*idle) * (num_sessions + 1));
+	for (i = 0; i < num_sessions; i++) {
+		srd_session_new(&idle[i]);
+		di = srd_inst_new(idle[i], "uart", NULL);
+		for (j = 0; j < num_stacked; j++) {
+			di_top = srd_inst_new(idle[i], "midi", NULL);
+			srd_inst_stack(idle[i], di, di_top);
+		}
+	}
+
+	srd_session_new(&sess);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_cb, NULL);
+	srd_inst_new(sess, "uart", NULL);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+		g_variant_new_uint64(UART_BAUDRATE * UART_BITLEN));
+	srd_session_start(sess);
+
+	num_annotations = 0;
+	t_start = g_get_monotonic_time();
+	srd_session_send(sess, 0, num_samples, buf, num_samples, 1);
+	t_end = g_get_monotonic_time();
+	secs = (t_end - t_start) / (double)G_USEC_PER_SEC;
+
+	printf("put: %4u sessions x %3u stacked: %10" PRIu64 " annotations, "
+		"%8.3f s, %10.0f annotations/s\n", num_sessions, num_stacked,
+		num_annotations, secs, secs > 0 ? num_annotations / secs : 0);
+
+	srd_session_destroy(sess);
+	for (i = 0; i < num_sessions; i++)
+		srd_session_destroy(idle[i]);
+	g_free(idle);
+}
+
+/*
+ * Measure the throughput of a single decoder, with the samples being
+ * passed to the session in chunks of 'chunk' samples (or all at once).
+ */
+static void bench_decode(const struct bench_proto *proto, uint64_t samplerate,
+		const uint8_t *buf, uint64_t num_samples, uint64_t chunk)
+{
+	struct srd_session *sess;
+	struct srd_decoder_inst *di, *di_top;
+	uint64_t start, n;
+	gint64 t_start, t_end;
+	double secs;
+	char chunk_str[32], name[64];
+
+	srd_session_new(&sess);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_cb, NULL);
+	di = srd_inst_new(sess, proto->id, NULL);
+	if (proto->stacked_id) {
+		di_top = srd_inst_new(sess, proto->stacked_id, NULL);
+		srd_inst_stack(sess, di, di_top);
+		snprintf(name, sizeof(name), "%s,%s", proto->id,
+			proto->stacked_id);
+	} else {
+		snprintf(name, sizeof(name), "%s", proto->id);
+	}
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+		g_variant_new_uint64(samplerate));
+	srd_session_start(sess);
+
+	if (!chunk)
+		chunk = num_samples;
+
+	num_annotations = 0;
+	t_start = g_get_monotonic_time();
+	for (start = 0; start < num_samples; start += n) {
+		n = MIN(chunk, num_samples - start);
+		srd_session_send(sess, start, start + n,
+			buf + start * proto->unitsize, n * proto->unitsize,
+			proto->unitsize);
+	}
+	t_end = g_get_monotonic_time();
+	secs = (t_end - t_start) / (double)G_USEC_PER_SEC;
+
+	if (chunk == num_samples)
+		snprintf(chunk_str, sizeof(chunk_str), "all");
+	else
+		snprintf(chunk_str, sizeof(chunk_str), "%" PRIu64, chunk);
+	printf("decode: %-14s chunk %7s: %10" PRIu64 " annotations, "
+		"%8.3f s, %12.0f samples/s, %10.0f annotations/s, "
+		"peak RSS %ld KiB\n", name, chunk_str, num_annotations,
+		secs, secs > 0 ? num_samples / secs : 0,
+		secs > 0 ? num_annotations / secs : 0, peak_rss());
+
+	srd_session_destroy(sess);
+}
+
+/*
+ * Usage: benchmark [num_samples [samplerate [activity]]]
+ *
+ * The activity is the percentage of time during which the generated
+ * signals show bus traffic, the rest of the time the bus is idle.
+ */
+int main(int argc, char **argv)
+{
+	uint8_t *buf;
+	uint64_t num_samples, samplerate;
+	double activity;
+	const unsigned int num_sessions[] = { 0, 16, 256 };
+	const unsigned int num_stacked[] = { 0, 8, 64 };
+	const uint64_t chunks[] = { 4096, 65536, 0 };
+	unsigned int i, j;
+
+	num_samples = 1000000;
+	samplerate = DEFAULT_SAMPLERATE;
+	activity = DEFAULT_ACTIVITY;
+	if (argc > 1)
+		num_samples = strtoull(argv[1], NULL, 10);
+	if (argc > 2)
+		samplerate = strtoull(argv[2], NULL, 10);
+	if (argc > 3)
+		activity = strtod(argv[3], NULL);
+	if (!num_samples || !samplerate || activity <= 0 || activity > 100) {
+		fprintf(stderr, "Usage: %s [num_samples [samplerate "
+			"[activity]]]\n", argv[0]);
+		return EXIT_FAILURE;
+	}
+
+	srd_log_loglevel_set(SRD_LOG_NONE);
+	/* Don't touch the user's decoder metadata cache, unless asked to. */
+	g_setenv("SIGROKDECODE_CACHE_DIR", "", FALSE);
+	if (srd_init(DECODERS_TESTDIR) != SRD_OK)
+		return EXIT_FAILURE;
+	if (srd_decoder_load("midi") != SRD_OK) {
+		srd_exit();
+		return EXIT_FAILURE;
+	}
+	for (i = 0; i < G_N_ELEMENTS(protos); i++) {
+		if (srd_decoder_load(protos[i].id) != SRD_OK ||
+		    (protos[i].stacked_id &&
+		     srd_decoder_load(protos[i].stacked_id) != SRD_OK)) {
+			srd_exit();
+			return EXIT_FAILURE;
+		}
+	}
+
+	/* Two bytes per sample are enough for all of the generators. */
+	if (!(buf = g_try_malloc(num_samples * 2))) {
+		srd_exit();
+		return EXIT_FAILURE;
+	}
+
+	gen_run(buf, num_samples, 1, UART_BAUDRATE * UART_BITLEN, 1, gen_uart);
+	for (i = 0; i < G_N_ELEMENTS(num_sessions); i++) {
+		for (j = 0; j < G_N_ELEMENTS(num_stacked); j++)
+			bench_put(num_sessions[i], num_stacked[j],
+				buf, num_samples);
+	}
+
+	for (i = 0; i < G_N_ELEMENTS(protos); i++) {
+		gen_run(buf, num_samples, protos[i].unitsize, samplerate,
+			activity / 100, protos[i].gen);
+		for (j = 0; j < G_N_ELEMENTS(chunks); j++)
+			bench_decode(&protos[i], samplerate, buf, num_samples,
+				chunks[j]);
+	}
+
+	g_free(buf);
+	srd_exit();
+
+	return EXIT_SUCCESS;
+}
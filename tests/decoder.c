@@ -20,6 +20,7 @@
 #include <config.h>
 #include <libsigrokdecode.h> /* First, to avoid compiler warning. */
 #include <stdlib.h>
+#include <string.h>
 #include <check.h>
 #include "lib.h"
 
@@ -112,6 +113,49 @@ START_TEST(test_load_valid_and_bogus)
 }
 END_TEST
 
+/*
+ * Check whether decoders which were loaded from the metadata cache match
+ * the imported ones, and whether they get imported upon srd_inst_new().
+ * If they don't (or it segfaults) this test will fail.
+ */
+START_TEST(test_load_cached)
+{
+	struct srd_session *sess;
+	struct srd_decoder *dec;
+	const struct srd_decoder_option *opt;
+	unsigned int num_decoders, num_options, num_annotations, num_rows;
+
+	/* srdtest_setup() points SIGROKDECODE_CACHE_DIR to an empty dir. */
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	num_decoders = g_slist_length((GSList *)srd_decoder_list());
+	dec = srd_decoder_get_by_id("uart");
+	fail_unless(dec != NULL && dec->py_dec != NULL);
+	num_options = g_slist_length(dec->options);
+	num_annotations = g_slist_length(dec->annotations);
+	num_rows = g_slist_length(dec->annotation_rows);
+	srd_exit();
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	fail_unless(g_slist_length((GSList *)srd_decoder_list()) == num_decoders);
+	dec = srd_decoder_get_by_id("uart");
+	fail_unless(dec != NULL && dec->py_dec == NULL,
+			"uart PD was not loaded from the cache.");
+	fail_unless(g_slist_length(dec->options) == num_options);
+	fail_unless(g_slist_length(dec->annotations) == num_annotations);
+	fail_unless(g_slist_length(dec->annotation_rows) == num_rows);
+	opt = dec->options->data;
+	fail_unless(!strcmp(opt->id, "baudrate"));
+	fail_unless(g_variant_get_int64(opt->def) == 115200);
+	srd_session_new(&sess);
+	fail_unless(srd_inst_new(sess, "uart", NULL) != NULL);
+	fail_unless(dec->py_dec != NULL);
+	fail_unless(srd_decoder_doc_get(dec) != NULL);
+	srd_exit();
+}
+END_TEST
+
 /*
  * Check whether srd_decoder_load() fails when run multiple times.
  * If it returns a value != SRD_OK (or segfaults) this test will fail.
@@ -425,6 +469,7 @@ Suite *suite_decoder(void)
 	tcase_add_test(tc, test_load);
 	tcase_add_test(tc, test_load_bogus);
 	tcase_add_test(tc, test_load_valid_and_bogus);
+	tcase_add_test(tc, test_load_cached);
 	tcase_add_test(tc, test_load_multiple);
 	tcase_add_test(tc, test_load_nonexisting_pd_dir);
 	suite_add_tcase(s, tc);
@@ -450,12 +495,14 @@ Suite *suite_decoder(void)
 	suite_add_tcase(s, tc);
 
 	tc = tcase_create("get_by_id");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
 	tcase_add_test(tc, test_get_by_id);
 	tcase_add_test(tc, test_get_by_id_multiple);
 	tcase_add_test(tc, test_get_by_id_bogus);
 	suite_add_tcase(s, tc);
 
 	tc = tcase_create("doc_get");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
 	tcase_add_test(tc, test_doc_get);
 	tcase_add_test(tc, test_doc_get_null);
 	suite_add_tcase(s, tc);
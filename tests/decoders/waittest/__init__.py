@@ -0,0 +1,38 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+This decoder is used by the unit tests (see tests/session.c). It runs a
+sequence of wait() calls, and reports the results as annotation texts.
+
+The 'calls' option is a Python literal, a list of wait() arguments,
+numbers of samples for wait_runs(), or tuples of wait_points() arguments.
+The calls are repeated until the end of the input, unless the 'repeat'
+option is 'no'. The annotation texts are (pins in channel order, matched
+is '-' for None):
+
+ - wait(): "<samplenum> <pins> <matched>", e.g. "12 011 10"
+ - wait_runs(): "runs <samplenum>:<pins>:<length> ... @<samplenum>"
+ - wait_points(): "points <pins> ... @<samplenum> <matched>"
+ - "ValueError @<samplenum>" and "EOF @<samplenum>" for these exceptions
+
+The 'dicts' option selects the objects which wait() gets: the ones of
+the literal ('literal'), copies ('fresh'), or the same dict and list
+objects for all calls, which get modified accordingly ('shared').
+'''
+
+from .pd import Decoder
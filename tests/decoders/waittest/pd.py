@@ -0,0 +1,118 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+import ast
+import copy
+import sigrokdecode as srd
+
+def pins_str(pins):
+    return ''.join(str(p) for p in pins)
+
+class Decoder(srd.Decoder):
+    api_version = 3
+    id = 'waittest'
+    name = 'Wait test'
+    longname = 'Decoder.wait() test'
+    desc = 'Report the results of wait() calls, for the unit tests.'
+    license = 'gplv2+'
+    inputs = ['logic']
+    outputs = []
+    channels = (
+        {'id': 'd0', 'name': 'D0', 'desc': 'Data line 0'},
+        {'id': 'd1', 'name': 'D1', 'desc': 'Data line 1'},
+        {'id': 'd2', 'name': 'D2', 'desc': 'Data line 2'},
+    )
+    options = (
+        {'id': 'calls', 'desc': 'wait() arguments', 'default': '[{0: "e"}]'},
+        {'id': 'repeat', 'desc': 'Repeat the calls', 'default': 'yes',
+            'values': ('yes', 'no')},
+        {'id': 'dicts', 'desc': 'Condition objects', 'default': 'literal',
+            'values': ('literal', 'fresh', 'shared')},
+    )
+    annotations = (
+        ('result', 'Result'),
+    )
+
+    def __init__(self):
+        self.samplenum = 0
+        self.matched = None
+        self.shared_dicts = []
+        self.shared_list = []
+
+    def start(self):
+        self.out_ann = self.register(srd.OUTPUT_ANN)
+
+    def report(self, text):
+        self.put(self.samplenum, self.samplenum, self.out_ann, [0, [text]])
+
+    def matched_str(self):
+        if self.matched is None:
+            return '-'
+        return ''.join('1' if m else '0' for m in self.matched)
+
+    def conditions(self, conds):
+        # Pass the literal's objects (which get reused when the calls
+        # are repeated), new objects for every call, or the same objects
+        # for every call, which get modified to hold the conditions.
+        dicts = self.options['dicts']
+        if dicts == 'fresh':
+            return copy.deepcopy(conds)
+        if dicts != 'shared' or conds is None:
+            return conds
+        items = [conds] if isinstance(conds, dict) else conds
+        while len(self.shared_dicts) < len(items):
+            self.shared_dicts.append({})
+        for d, c in zip(self.shared_dicts, items):
+            d.clear()
+            d.update(c)
+        if isinstance(conds, dict):
+            return self.shared_dicts[0]
+        self.shared_list[:] = self.shared_dicts[:len(items)]
+        return self.shared_list
+
+    def call(self, args):
+        if isinstance(args, int):
+            runs = self.wait_runs(args)
+            self.report('runs %s @%d' % (' '.join('%d:%s:%d' %
+                (s, pins_str(p), n) for s, p, n in runs), self.samplenum))
+            return
+        if isinstance(args, tuple):
+            pins = self.wait_points(*args)
+            self.report('points %s @%d %s' % (' '.join(pins_str(p)
+                for p in pins) or '-', self.samplenum, self.matched_str()))
+            return
+        pins = self.wait(self.conditions(args))
+        self.report('%d %s %s' % (self.samplenum, pins_str(pins),
+            self.matched_str()))
+
+    def decode(self):
+        calls = ast.literal_eval(self.options['calls'])
+        try:
+            while True:
+                for args in calls:
+                    try:
+                        self.call(args)
+                    except ValueError:
+                        self.report('ValueError @%d' % self.samplenum)
+                if self.options['repeat'] != 'yes':
+                    break
+
+            # Idle until the end of the input.
+            while True:
+                self.wait({'skip': 1 << 40})
+        except EOFError:
+            self.report('EOF @%d' % self.samplenum)
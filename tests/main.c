@@ -19,18 +19,47 @@
 
 #include <config.h>
 #include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <glib.h>
+#include <glib/gstdio.h>
 #include <stdlib.h>
+#include <unistd.h>
 #include <check.h>
 #include "lib.h"
 
+/* Decoder metadata cache of the running test, kept out of the user's. */
+static char *cache_dir;
+
+static void remove_cache(void)
+{
+	char *cache_file;
+
+	cache_file = g_build_filename(cache_dir, "decoders.cache", NULL);
+	g_unlink(cache_file);
+	g_rmdir(cache_dir);
+	g_free(cache_file);
+}
+
 void srdtest_setup(void)
 {
+	char *name;
+
 	/* Silence libsigrokdecode while the unit tests run. */
 	srd_log_loglevel_set(SRD_LOG_NONE);
+
+	/* The decoder metadata cache gets created there when needed. */
+	name = g_strdup_printf("libsigrokdecode-test-%d", (int)getpid());
+	cache_dir = g_build_filename(g_get_tmp_dir(), name, NULL);
+	g_free(name);
+	remove_cache();
+	g_setenv("SIGROKDECODE_CACHE_DIR", cache_dir, TRUE);
 }
 
 void srdtest_teardown(void)
 {
+	g_unsetenv("SIGROKDECODE_CACHE_DIR");
+	remove_cache();
+	g_free(cache_dir);
+	cache_dir = NULL;
 }
 
 int main(void)
@@ -20,8 +20,13 @@
 #include <config.h>
 #include <libsigrokdecode-internal.h> /* First, to avoid compiler warning. */
 #include <libsigrokdecode.h>
+#include <glib/gstdio.h>
+#include <inttypes.h>
+#include <stdarg.h>
 #include <stdint.h>
 #include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
 #include <check.h>
 #include "lib.h"
 
@@ -224,6 +229,1384 @@ START_TEST(test_session_metadata_set_bogus)
 }
 END_TEST
 
+/*
+ * Check whether srd_session_parallel_set() works.
+ * If it returns != SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_parallel_set)
+{
+	int ret;
+	struct srd_session *sess;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	fail_unless(sess->parallel == FALSE, "Parallel mode is the default.");
+	ret = srd_session_parallel_set(sess, TRUE);
+	fail_unless(ret == SRD_OK, "srd_session_parallel_set() failed: %d.", ret);
+	fail_unless(sess->parallel == TRUE);
+	ret = srd_session_parallel_set(sess, FALSE);
+	fail_unless(ret == SRD_OK, "srd_session_parallel_set() failed: %d.", ret);
+	fail_unless(sess->parallel == FALSE);
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_session_parallel_set() fails for bogus sessions.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_parallel_set_bogus)
+{
+	int ret;
+
+	srd_init(NULL);
+	ret = srd_session_parallel_set(NULL, TRUE);
+	fail_unless(ret != SRD_OK, "srd_session_parallel_set(NULL) worked.");
+	srd_exit();
+}
+END_TEST
+
+struct ann_counter {
+	struct srd_session *sess;
+	int count;
+	gboolean foreign;
+};
+
+static void ann_counter_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct ann_counter *c;
+
+	c = cb_data;
+	if (pdata->pdo->di->sess != c->sess)
+		c->foreign = TRUE;
+	c->count++;
+}
+
+/* Generate UART 8N1 frames on bit 0 (RX), with TX (bit 1) idling high. */
+static uint64_t gen_uart(uint8_t *buf, const uint8_t *data, int len,
+		int bitlen)
+{
+	uint64_t n;
+	int i, bit, j, level;
+
+	n = 0;
+	for (j = 0; j < 2 * bitlen; j++)
+		buf[n++] = 0x03;
+	for (i = 0; i < len; i++) {
+		for (bit = -1; bit <= 8; bit++) {
+			if (bit == -1)
+				level = 0;
+			else if (bit == 8)
+				level = 1;
+			else
+				level = (data[i] >> bit) & 1;
+			for (j = 0; j < bitlen; j++)
+				buf[n++] = 0x02 | level;
+		}
+	}
+	for (j = 0; j < 2 * bitlen; j++)
+		buf[n++] = 0x03;
+
+	return n;
+}
+
+/*
+ * Check whether decoding in multiple sessions (with stacked instances)
+ * delivers the output of each instance to its own session.
+ * If annotations go missing or end up in another session (or it
+ * segfaults) this test will fail.
+ */
+START_TEST(test_session_send_multiple)
+{
+	int ret, i;
+	uint64_t num_samples;
+	uint8_t buf[2048];
+	const uint8_t data[] = { 0x55, 0xaa, 0x00, 0xff };
+	struct srd_session *sess[3];
+	struct srd_decoder_inst *di, *di_top;
+	struct ann_counter counters[3];
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+	srd_decoder_load("midi");
+
+	num_samples = gen_uart(buf, data, sizeof(data), 10);
+
+	for (i = 0; i < 3; i++) {
+		srd_session_new(&sess[i]);
+		counters[i].sess = sess[i];
+		counters[i].count = 0;
+		counters[i].foreign = FALSE;
+		srd_pd_output_callback_add(sess[i], SRD_OUTPUT_ANN,
+			ann_counter_cb, &counters[i]);
+		di = srd_inst_new(sess[i], "uart", NULL);
+		fail_unless(di != NULL, "srd_inst_new() failed.");
+		di_top = srd_inst_new(sess[i], "midi", NULL);
+		fail_unless(di_top != NULL, "srd_inst_new() failed.");
+		srd_inst_stack(sess[i], di, di_top);
+		conf_check_ok(sess[i], SRD_CONF_SAMPLERATE, 115200 * 10);
+		ret = srd_session_start(sess[i]);
+		fail_unless(ret == SRD_OK, "srd_session_start() failed: %d.", ret);
+	}
+
+	/* Decode in the last session first, to not favour list order. */
+	for (i = 2; i >= 0; i--) {
+		ret = srd_session_send(sess[i], 0, num_samples, buf,
+			num_samples, 1);
+		fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	}
+
+	for (i = 0; i < 3; i++) {
+		fail_unless(counters[i].count > 0,
+			"Session %d received no annotations.", i);
+		fail_unless(!counters[i].foreign,
+			"Session %d received foreign annotations.", i);
+		srd_session_destroy(sess[i]);
+	}
+
+	srd_exit();
+}
+END_TEST
+
+static void ann_counter_bulk_cb(struct srd_proto_data *pdata,
+		unsigned int count, void *cb_data)
+{
+	unsigned int i;
+
+	for (i = 0; i < count; i++)
+		ann_counter_cb(&pdata[i], cb_data);
+}
+
+/*
+ * Check whether bulk output callbacks receive the same output as
+ * regular output callbacks.
+ * If the numbers of annotations differ (or it segfaults) this test
+ * will fail.
+ */
+START_TEST(test_session_bulk_callback)
+{
+	int ret, i;
+	uint64_t num_samples;
+	uint8_t buf[2048];
+	const uint8_t data[] = { 0x12, 0x34, 0x56 };
+	struct srd_session *sess[2];
+	struct ann_counter counters[2];
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	num_samples = gen_uart(buf, data, sizeof(data), 10);
+
+	for (i = 0; i < 2; i++) {
+		srd_session_new(&sess[i]);
+		counters[i].sess = sess[i];
+		counters[i].count = 0;
+		counters[i].foreign = FALSE;
+		if (i == 0)
+			ret = srd_pd_output_callback_add(sess[i],
+				SRD_OUTPUT_ANN, ann_counter_cb, &counters[i]);
+		else
+			ret = srd_pd_output_bulk_callback_add(sess[i],
+				SRD_OUTPUT_ANN, ann_counter_bulk_cb, &counters[i]);
+		fail_unless(ret == SRD_OK, "Adding callback failed: %d.", ret);
+		srd_inst_new(sess[i], "uart", NULL);
+		conf_check_ok(sess[i], SRD_CONF_SAMPLERATE, 115200 * 10);
+		srd_session_start(sess[i]);
+		ret = srd_session_send(sess[i], 0, num_samples, buf,
+			num_samples, 1);
+		fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	}
+
+	fail_unless(counters[0].count > 0, "No annotations received.");
+	fail_unless(counters[0].count == counters[1].count,
+		"Bulk callback received %d instead of %d annotations.",
+		counters[1].count, counters[0].count);
+
+	/* Bulk callbacks must not be NULL. */
+	ret = srd_pd_output_bulk_callback_add(sess[0], SRD_OUTPUT_BINARY,
+		NULL, NULL);
+	fail_unless(ret != SRD_OK, "Adding a NULL bulk callback worked.");
+
+	srd_session_destroy(sess[0]);
+	srd_session_destroy(sess[1]);
+	srd_exit();
+}
+END_TEST
+
+struct ann_digest {
+	int count;
+	uint64_t sum;
+};
+
+static void ann_digest_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct ann_digest *d;
+	struct srd_proto_data_annotation *pda;
+
+	d = cb_data;
+	pda = pdata->data;
+	d->count++;
+	d->sum = d->sum * 31 + pdata->start_sample;
+	d->sum = d->sum * 31 + pdata->end_sample;
+	d->sum = d->sum * 31 + pda->ann_class;
+}
+
+/*
+ * Check whether change-only input yields the same annotations as the
+ * equivalent raw samples, also when split into multiple chunks.
+ */
+START_TEST(test_session_send_rle)
+{
+	int ret, i;
+	uint64_t num_samples, num_changes, split, n;
+	uint8_t buf[2048], values[2048];
+	uint64_t samplenums[2048];
+	const uint8_t data[] = { 0x12, 0x34, 0x56 };
+	struct srd_session *sess[2];
+	struct ann_digest digests[2];
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	num_samples = gen_uart(buf, data, sizeof(data), 10);
+
+	/* Split in the middle of a run, then convert to changes. */
+	split = 97;
+	num_changes = 0;
+	for (n = 0; n < num_samples; n++) {
+		if (n && n != split && buf[n] == buf[n - 1])
+			continue;
+		samplenums[num_changes] = n;
+		values[num_changes++] = buf[n];
+	}
+	for (i = 0; i < 2; i++) {
+		srd_session_new(&sess[i]);
+		digests[i].count = 0;
+		digests[i].sum = 0;
+		srd_pd_output_callback_add(sess[i], SRD_OUTPUT_ANN,
+			ann_digest_cb, &digests[i]);
+		srd_inst_new(sess[i], "uart", NULL);
+		conf_check_ok(sess[i], SRD_CONF_SAMPLERATE, 115200 * 10);
+		srd_session_start(sess[i]);
+	}
+
+	ret = srd_session_send(sess[0], 0, num_samples, buf, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+
+	for (n = 0; samplenums[n] != split; n++)
+		;
+	ret = srd_session_send_rle(sess[1], 0, split, samplenums, values,
+		n, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send_rle() failed: %d.", ret);
+	ret = srd_session_send_rle(sess[1], split, num_samples,
+		&samplenums[n], &values[n], num_changes - n, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send_rle() failed: %d.", ret);
+
+	fail_unless(digests[0].count > 0, "No annotations received.");
+	fail_unless(digests[0].count == digests[1].count &&
+		digests[0].sum == digests[1].sum,
+		"Change-only input yields different annotations.");
+
+	/* The first change must be at the chunk's start. */
+	ret = srd_session_send_rle(sess[1], num_samples, num_samples + 10,
+		samplenums, values, 1, 1);
+	fail_unless(ret != SRD_OK, "Invalid change-only chunk was accepted.");
+
+	srd_session_destroy(sess[0]);
+	srd_session_destroy(sess[1]);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether decoding a capture file yields the same annotations as
+ * sending its samples from a buffer.
+ */
+START_TEST(test_session_send_file)
+{
+	int ret, i, fd;
+	uint64_t num_samples;
+	uint8_t buf[2048];
+	const uint8_t data[] = { 0x12, 0x34, 0x56 };
+	struct srd_session *sess[2];
+	struct ann_digest digests[2];
+	gchar *filename;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	num_samples = gen_uart(buf, data, sizeof(data), 10);
+
+	fd = g_file_open_tmp("srd-test-XXXXXX", &filename, NULL);
+	fail_unless(fd >= 0, "Cannot create capture file.");
+	close(fd);
+	fail_unless(g_file_set_contents(filename, (const gchar *)buf,
+		num_samples, NULL), "Cannot write capture file.");
+
+	for (i = 0; i < 2; i++) {
+		srd_session_new(&sess[i]);
+		digests[i].count = 0;
+		digests[i].sum = 0;
+		srd_pd_output_callback_add(sess[i], SRD_OUTPUT_ANN,
+			ann_digest_cb, &digests[i]);
+		srd_inst_new(sess[i], "uart", NULL);
+		conf_check_ok(sess[i], SRD_CONF_SAMPLERATE, 115200 * 10);
+		srd_session_start(sess[i]);
+	}
+
+	ret = srd_session_send(sess[0], 0, num_samples, buf, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	ret = srd_session_send_file(sess[1], filename, 1, 0);
+	fail_unless(ret == SRD_OK, "srd_session_send_file() failed: %d.", ret);
+
+	fail_unless(digests[0].count > 0, "No annotations received.");
+	fail_unless(digests[0].count == digests[1].count &&
+		digests[0].sum == digests[1].sum,
+		"Capture file yields different annotations.");
+
+	ret = srd_session_send_file(sess[1], NULL, 1, 0);
+	fail_unless(ret != SRD_OK, "NULL filename was accepted.");
+
+	g_unlink(filename);
+	g_free(filename);
+	srd_session_destroy(sess[0]);
+	srd_session_destroy(sess[1]);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether the statistics of a session and its instances account
+ * for the sent samples and the decoder's output.
+ */
+START_TEST(test_session_stats)
+{
+	int ret;
+	uint64_t num_samples;
+	uint8_t buf[2048];
+	const uint8_t data[] = { 0x12, 0x34, 0x56 };
+	struct srd_session *sess;
+	struct srd_decoder_inst *di;
+	struct srd_session_stats sess_stats;
+	struct srd_inst_stats inst_stats;
+	struct ann_counter counter;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	num_samples = gen_uart(buf, data, sizeof(data), 10);
+
+	srd_session_new(&sess);
+	counter.sess = sess;
+	counter.count = 0;
+	counter.foreign = FALSE;
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_counter_cb,
+		&counter);
+	di = srd_inst_new(sess, "uart", NULL);
+	conf_check_ok(sess, SRD_CONF_SAMPLERATE, 115200 * 10);
+	ret = srd_session_stats_set(sess, TRUE);
+	fail_unless(ret == SRD_OK, "srd_session_stats_set() failed: %d.", ret);
+	srd_session_start(sess);
+	srd_session_send(sess, 0, num_samples, buf, num_samples, 1);
+
+	ret = srd_session_stats_get(sess, &sess_stats);
+	fail_unless(ret == SRD_OK, "srd_session_stats_get() failed: %d.", ret);
+	ret = srd_inst_stats_get(di, &inst_stats);
+	fail_unless(ret == SRD_OK, "srd_inst_stats_get() failed: %d.", ret);
+
+	fail_unless(sess_stats.chunks == 1, "Got %" PRIu64 " chunks.",
+		sess_stats.chunks);
+	fail_unless(sess_stats.samples == num_samples, "Got %" PRIu64
+		" samples.", sess_stats.samples);
+	fail_unless(counter.count > 0, "No annotations received.");
+	fail_unless(inst_stats.puts[SRD_OUTPUT_ANN] == (uint64_t)counter.count,
+		"Counted %" PRIu64 " instead of %d annotations.",
+		inst_stats.puts[SRD_OUTPUT_ANN], counter.count);
+	fail_unless(inst_stats.waits > 0, "No wait() calls counted.");
+	fail_unless(inst_stats.samples_checked + inst_stats.samples_skipped > 0,
+		"No samples counted.");
+	fail_unless(!memcmp(&inst_stats, &sess_stats.insts, sizeof(inst_stats)),
+		"Session and instance statistics differ.");
+
+	ret = srd_session_stats_get(sess, NULL);
+	fail_unless(ret != SRD_OK, "srd_session_stats_get(NULL) worked.");
+	ret = srd_inst_stats_get(NULL, &inst_stats);
+	fail_unless(ret != SRD_OK, "srd_inst_stats_get(NULL) worked.");
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+struct ann_text_check {
+	char **start_bit_text;
+	int count;
+	gboolean differs;
+};
+
+static void ann_text_check_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct ann_text_check *c;
+	struct srd_proto_data_annotation *pda;
+
+	c = cb_data;
+	pda = pdata->data;
+	if (strcmp(pda->ann_text[0], "Start bit"))
+		return;
+
+	c->count++;
+	if (!c->start_bit_text)
+		c->start_bit_text = pda->ann_text;
+	else if (c->start_bit_text != pda->ann_text)
+		c->differs = TRUE;
+}
+
+/*
+ * Check whether identical annotation texts are passed to the frontend
+ * as the very same (interned) string vector.
+ */
+START_TEST(test_session_ann_text_interned)
+{
+	int ret;
+	uint64_t num_samples;
+	uint8_t buf[2048];
+	const uint8_t data[] = { 0x12, 0x34, 0x56 };
+	struct srd_session *sess;
+	struct ann_text_check check;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	num_samples = gen_uart(buf, data, sizeof(data), 10);
+
+	memset(&check, 0, sizeof(check));
+	srd_session_new(&sess);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN,
+		ann_text_check_cb, &check);
+	srd_inst_new(sess, "uart", NULL);
+	conf_check_ok(sess, SRD_CONF_SAMPLERATE, 115200 * 10);
+	srd_session_start(sess);
+	ret = srd_session_send(sess, 0, num_samples, buf, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+
+	fail_unless(check.count == (int)sizeof(data),
+		"Got %d instead of %d start bits.", check.count,
+		(int)sizeof(data));
+	fail_unless(!check.differs, "Annotation texts were not interned.");
+
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+struct stacked_digest {
+	struct srd_decoder_inst *di;
+	struct ann_digest digest;
+	uint64_t last_es;
+};
+
+/* Only look at the annotations of one (the stacked) instance. */
+static void stacked_digest_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct stacked_digest *d;
+
+	d = cb_data;
+	if (pdata->pdo->di != d->di)
+		return;
+	ann_digest_cb(pdata, &d->digest);
+	d->last_es = MAX(d->last_es, pdata->end_sample);
+}
+
+static void hold_level(uint8_t *buf, uint64_t *n, uint8_t level, int len)
+{
+	while (len--)
+		buf[(*n)++] = level;
+}
+
+/*
+ * Generate low-speed USB DATA0 packets on D+ (bit 0) and D- (bit 1),
+ * NRZI encoded and with a stuff bit after six ones.
+ */
+static uint64_t gen_usb(uint8_t *buf, int num_packets, int bitlen)
+{
+	const uint8_t j = 0x02, k = 0x01, se0 = 0x00;
+	uint8_t packet[12], level;
+	uint64_t n;
+	int p, i, b, ones;
+
+	n = 0;
+	hold_level(buf, &n, j, 4 * bitlen);
+	for (p = 0; p < num_packets; p++) {
+		packet[0] = 0x80; /* SYNC */
+		packet[1] = 0xc3; /* DATA0 */
+		for (i = 2; i < 12; i++)
+			packet[i] = p + i;
+		level = j;
+		ones = 0;
+		for (i = 0; i < 12 * 8; i++) {
+			b = (packet[i / 8] >> (i % 8)) & 1;
+			if (!b)
+				level = (level == j) ? k : j;
+			hold_level(buf, &n, level, bitlen);
+			ones = b ? ones + 1 : 0;
+			if (ones == 6) {
+				level = (level == j) ? k : j;
+				hold_level(buf, &n, level, bitlen);
+				ones = 0;
+			}
+		}
+		hold_level(buf, &n, se0, 2 * bitlen);
+		hold_level(buf, &n, j, 8 * bitlen);
+	}
+
+	return n;
+}
+
+/*
+ * Check whether a stacked decoder which takes its input in batches
+ * (usb_packet implements decode_many()) gets all of it by the end of
+ * each srd_session_send() call, regardless of the chunk sizes.
+ */
+START_TEST(test_session_send_stacked_batches)
+{
+	int ret, i;
+	uint64_t num_samples, start, n;
+	uint8_t *buf;
+	const uint64_t chunks[] = { 0, 1000, 97 };
+	struct srd_session *sess;
+	struct srd_decoder_inst *di;
+	struct stacked_digest d[G_N_ELEMENTS(chunks)];
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("usb_signalling");
+	srd_decoder_load("usb_packet");
+
+	buf = g_malloc(64 * 1024);
+	num_samples = gen_usb(buf, 64, 8);
+
+	for (i = 0; i < (int)G_N_ELEMENTS(chunks); i++) {
+		memset(&d[i], 0, sizeof(d[i]));
+		srd_session_new(&sess);
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN,
+			stacked_digest_cb, &d[i]);
+		di = srd_inst_new(sess, "usb_signalling", NULL);
+		d[i].di = srd_inst_new(sess, "usb_packet", NULL);
+		fail_unless(di && d[i].di, "srd_inst_new() failed.");
+		srd_inst_stack(sess, di, d[i].di);
+		conf_check_ok(sess, SRD_CONF_SAMPLERATE, 1500000 * 8);
+		srd_session_start(sess);
+		for (start = 0; start < num_samples; start += n) {
+			n = chunks[i] ? MIN(chunks[i], num_samples - start) :
+				num_samples;
+			ret = srd_session_send(sess, start, start + n,
+				buf + start, n, 1);
+			fail_unless(ret == SRD_OK,
+				"srd_session_send() failed: %d.", ret);
+		}
+		fail_unless(d[i].last_es + 16 * 8 >= num_samples,
+			"Chunk size %" PRIu64 ": last packet is missing.",
+			chunks[i]);
+		srd_session_destroy(sess);
+	}
+
+	fail_unless(d[0].digest.count > 0, "No annotations received.");
+	for (i = 1; i < (int)G_N_ELEMENTS(chunks); i++) {
+		fail_unless(d[i].digest.count == d[0].digest.count &&
+			d[i].digest.sum == d[0].digest.sum,
+			"Chunk size %" PRIu64 " yields different annotations.",
+			chunks[i]);
+	}
+
+	g_free(buf);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether decoding a capture in shards, and concatenating the
+ * shards' output, yields the same annotations as decoding it at once.
+ */
+START_TEST(test_session_shard)
+{
+	int ret, i;
+	uint64_t num_samples, start, end, lead_in, lead_out;
+	uint8_t buf[8192];
+	const uint8_t data[] = { 0x55, 0xaa, 0x5a };
+	struct srd_session *sess;
+	struct ann_digest d_all, d_shards;
+	GArray *points;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	/* Frames with 40 samples of idle bus between groups of three. */
+	num_samples = 0;
+	for (i = 0; i < 16; i++)
+		num_samples += gen_uart(buf + num_samples, data,
+			sizeof(data), 10);
+
+	/* Within the frames RX is never high for more than 20 samples. */
+	ret = srd_shard_points_find(buf, num_samples, 1, 0x01, 0x01, 30,
+		4, &points);
+	fail_unless(ret == SRD_OK, "srd_shard_points_find() failed: %d.", ret);
+	fail_unless(points->len == 5, "Got %u instead of 4 shards.",
+		points->len - 1);
+	fail_unless(g_array_index(points, uint64_t, 4) == num_samples,
+		"Last shard doesn't end at the last sample.");
+	for (i = 1; i < 4; i++) {
+		start = g_array_index(points, uint64_t, i);
+		fail_unless((buf[start - 15] & buf[start + 15] & 0x01),
+			"Shard %d doesn't start in an idle period.", i);
+	}
+
+	memset(&d_all, 0, sizeof(d_all));
+	srd_session_new(&sess);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_digest_cb, &d_all);
+	srd_inst_new(sess, "uart", NULL);
+	conf_check_ok(sess, SRD_CONF_SAMPLERATE, 115200 * 10);
+	srd_session_start(sess);
+	srd_session_send(sess, 0, num_samples, buf, num_samples, 1);
+	srd_session_destroy(sess);
+
+	memset(&d_shards, 0, sizeof(d_shards));
+	for (i = 0; i < 4; i++) {
+		start = g_array_index(points, uint64_t, i);
+		end = g_array_index(points, uint64_t, i + 1);
+		lead_in = start ? start - 15 : 0;
+		lead_out = MIN(end + 100, num_samples);
+		srd_session_new(&sess);
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN,
+			ann_digest_cb, &d_shards);
+		srd_inst_new(sess, "uart", NULL);
+		conf_check_ok(sess, SRD_CONF_SAMPLERATE, 115200 * 10);
+		ret = srd_session_shard_set(sess, lead_in, start, end);
+		fail_unless(ret == SRD_OK, "srd_session_shard_set() failed: "
+			"%d.", ret);
+		srd_session_start(sess);
+		ret = srd_session_send(sess, lead_in, lead_out, buf + lead_in,
+			lead_out - lead_in, 1);
+		fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+		srd_session_destroy(sess);
+	}
+
+	fail_unless(d_all.count > 0, "No annotations received.");
+	fail_unless(d_shards.count == d_all.count && d_shards.sum == d_all.sum,
+		"Shards yield %d instead of %d (or different) annotations.",
+		d_shards.count, d_all.count);
+
+	srd_session_new(&sess);
+	ret = srd_session_shard_set(sess, 10, 5, 20);
+	fail_unless(ret != SRD_OK, "Lead-in after the shard start worked.");
+	ret = srd_session_shard_set(sess, 0, 20, 20);
+	fail_unless(ret != SRD_OK, "Empty shard worked.");
+	srd_session_destroy(sess);
+	g_array_free(points, TRUE);
+	ret = srd_shard_points_find(buf, num_samples, 9, 0x01, 0x01, 30,
+		4, &points);
+	fail_unless(ret != SRD_OK, "Unit size 9 worked.");
+
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether a session which isn't restricted to a shard delivers all
+ * annotations, even if it reuses the memory of a sharded session.
+ */
+START_TEST(test_session_unsharded)
+{
+	int ret, i;
+	uint64_t num_samples;
+	uint8_t buf[2048];
+	const uint8_t data[] = { 0x55, 0xaa, 0x00, 0xff };
+	struct srd_session *sess;
+	struct ann_digest digests[2];
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	num_samples = gen_uart(buf, data, sizeof(data), 10);
+
+	for (i = 0; i < 2; i++) {
+		srd_session_new(&sess);
+		ret = srd_session_shard_set(sess, 1000, 1000, 1001);
+		fail_unless(ret == SRD_OK, "srd_session_shard_set() failed: "
+			"%d.", ret);
+		srd_session_destroy(sess);
+
+		/* Session 0 is plain, session 1 covers the whole capture. */
+		memset(&digests[i], 0, sizeof(digests[i]));
+		srd_session_new(&sess);
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN,
+			ann_digest_cb, &digests[i]);
+		srd_inst_new(sess, "uart", NULL);
+		conf_check_ok(sess, SRD_CONF_SAMPLERATE, 115200 * 10);
+		if (i == 1)
+			srd_session_shard_set(sess, 0, 0, num_samples);
+		srd_session_start(sess);
+		ret = srd_session_send(sess, 0, num_samples, buf,
+			num_samples, 1);
+		fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+		srd_session_destroy(sess);
+	}
+
+	fail_unless(digests[1].count > 0, "No annotations received.");
+	fail_unless(digests[0].count == digests[1].count &&
+		digests[0].sum == digests[1].sum,
+		"Plain session yields %d instead of %d (or different) "
+		"annotations.", digests[0].count, digests[1].count);
+
+	srd_exit();
+}
+END_TEST
+
+struct wav_output {
+	uint8_t header[44];
+	uint8_t final_header[44];
+	uint64_t size;
+	int num_final;
+};
+
+static void wav_output_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_binary *pdb;
+	struct wav_output *w;
+
+	w = cb_data;
+	pdb = pdata->data;
+	if (pdb->bin_class == 1) {
+		fail_unless(pdb->size == sizeof(w->final_header),
+			"Final WAV header has %" PRIu64 " bytes.", pdb->size);
+		memcpy(w->final_header, pdb->data, pdb->size);
+		w->num_final++;
+		return;
+	}
+	if (!w->size && pdb->size >= sizeof(w->header))
+		memcpy(w->header, pdb->data, sizeof(w->header));
+	w->size += pdb->size;
+}
+
+static uint32_t get_le32(const uint8_t *p)
+{
+	return p[0] | (p[1] << 8) | (p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+/*
+ * Check whether i2s streams its WAV output at the end of each chunk of
+ * input, such that frontends which never call srd_session_send_eof() get
+ * all complete frames. srd_session_send_eof() then lets it submit the
+ * header with the final sizes. No more samples can be sent afterwards.
+ */
+START_TEST(test_session_send_eof)
+{
+	int ret, frame, ch, bit, i;
+	uint64_t num_samples, n, len, data_size;
+	uint8_t buf[64 * 2 * 16 * 2], level;
+	uint16_t sample;
+	const uint64_t chunks[] = { sizeof(buf), 100 };
+	struct srd_session *sess;
+	struct wav_output w;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("i2s");
+
+	/* SCK on bit 0, WS on bit 1, SD on bit 2, two samples per bit. */
+	num_samples = 0;
+	sample = 0;
+	for (frame = 0; frame < 64; frame++) {
+		for (ch = 0; ch < 2; ch++, sample += 0x1111) {
+			for (bit = 15; bit >= 0; bit--) {
+				level = (((sample >> bit) & 1) << 2) |
+					(((bit == 0) ? !ch : ch) << 1);
+				buf[num_samples++] = level;
+				buf[num_samples++] = level | 0x01;
+			}
+		}
+	}
+
+	/* The last frame is incomplete, WS doesn't change after it. */
+	data_size = 63 * 2 * 2;
+
+	for (i = 0; i < 2; i++) {
+		memset(&w, 0, sizeof(w));
+		srd_session_new(&sess);
+		srd_pd_output_callback_add(sess, SRD_OUTPUT_BINARY,
+			wav_output_cb, &w);
+		srd_inst_new(sess, "i2s", NULL);
+		conf_check_ok(sess, SRD_CONF_SAMPLERATE, 48000 * 32 * 2);
+		srd_session_start(sess);
+		for (n = 0; n < num_samples; n += len) {
+			len = MIN(chunks[i], num_samples - n);
+			ret = srd_session_send(sess, n, n + len, buf + n, len, 1);
+			fail_unless(ret == SRD_OK, "srd_session_send() failed: "
+				"%d.", ret);
+		}
+		fail_unless(w.size == sizeof(w.header) + data_size,
+			"Got %" PRIu64 " bytes of WAV output in chunks of %"
+			PRIu64 ".", w.size, chunks[i]);
+		fail_unless(get_le32(w.header + 4) == 0xffffffff &&
+			get_le32(w.header + 40) == 0xffffffff,
+			"Streamed WAV header has sizes.");
+		fail_unless(w.header[34] == 16, "Samples are not 16 bit.");
+
+		ret = srd_session_send_eof(sess);
+		fail_unless(ret == SRD_OK, "srd_session_send_eof() failed: "
+			"%d.", ret);
+		fail_unless(w.num_final == 1, "Got %d final WAV headers.",
+			w.num_final);
+		fail_unless(w.size == sizeof(w.header) + data_size,
+			"Got more WAV data at the end of the input.");
+		fail_unless(get_le32(w.final_header + 4) == 36 + data_size &&
+			get_le32(w.final_header + 40) == data_size,
+			"Wrong sizes in the final WAV header.");
+		fail_unless(get_le32(w.final_header + 24) == 48000,
+			"Frame rate is %u, not 48000.",
+			get_le32(w.final_header + 24));
+		fail_unless(!memcmp(w.header + 8, w.final_header + 8, 16) &&
+			!memcmp(w.header + 32, w.final_header + 32, 8),
+			"Streamed WAV format differs from the final one.");
+
+		ret = srd_session_send(sess, num_samples, 2 * num_samples, buf,
+			num_samples, 1);
+		fail_unless(ret != SRD_OK, "Sending samples after EOF worked.");
+		srd_session_destroy(sess);
+	}
+
+	ret = srd_session_send_eof(NULL);
+	fail_unless(ret != SRD_OK, "srd_session_send_eof(NULL) worked.");
+
+	srd_exit();
+}
+END_TEST
+
+static void ann_text_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_annotation *pda;
+
+	pda = pdata->data;
+	g_string_append_printf(cb_data, "%s\n", pda->ann_text[0]);
+}
+
+/*
+ * Run the "waittest" PD (see tests/decoders/waittest) with the options
+ * given as name/value pairs, terminated by NULL. The samples are a string
+ * of hex digits, one per sample (D0 is bit 0), which get sent in chunks
+ * of 'chunk' samples, followed by an EOF if 'eof' is set.
+ * Returns the texts of the PD's annotations, one per line.
+ */
+static char *run_waittest(const char *samples, uint64_t chunk,
+		gboolean eof, ...)
+{
+	int ret;
+	uint64_t num_samples, n, len;
+	uint8_t buf[256];
+	const char *name;
+	va_list args;
+	GHashTable *options;
+	GString *texts;
+	struct srd_session *sess;
+
+	num_samples = strlen(samples);
+	fail_unless(num_samples <= sizeof(buf), "Too many samples.");
+	for (n = 0; n < num_samples; n++)
+		buf[n] = g_ascii_xdigit_value(samples[n]);
+
+	options = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+		(GDestroyNotify)g_variant_unref);
+	va_start(args, eof);
+	while ((name = va_arg(args, const char *))) {
+		g_hash_table_insert(options, g_strdup(name),
+			g_variant_ref_sink(g_variant_new_string(
+			va_arg(args, const char *))));
+	}
+	va_end(args);
+
+	texts = g_string_new(NULL);
+	srd_session_new(&sess);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_text_cb, texts);
+	fail_unless(srd_inst_new(sess, "waittest", options) != NULL,
+		"Cannot create a waittest instance.");
+	g_hash_table_destroy(options);
+	srd_session_start(sess);
+	for (n = 0; n < num_samples; n += len) {
+		len = MIN(chunk, num_samples - n);
+		ret = srd_session_send(sess, n, n + len, buf + n, len, 1);
+		fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	}
+	if (eof) {
+		ret = srd_session_send_eof(sess);
+		fail_unless(ret == SRD_OK, "srd_session_send_eof() failed: %d.",
+			ret);
+	}
+	srd_session_destroy(sess);
+
+	return g_string_free(texts, FALSE);
+}
+
+/* Compare (and free) the annotation texts of a run_waittest() call. */
+static void check_texts(char *texts, const char *expected,
+		const char *calls, uint64_t chunk)
+{
+	fail_unless(!strcmp(texts, expected), "%s in chunks of %" PRIu64
+		" samples yields:\n%sinstead of:\n%s", calls, chunk,
+		texts, expected);
+	g_free(texts);
+}
+
+/*
+ * Check whether wait() matches at the same samples, no matter how the
+ * input is split into chunks. Single sample chunks and chunks of 8 put
+ * edges at the first sample of a chunk (samples 16 and 24), where the
+ * previous sample is from the preceding chunk. The conditions cover the
+ * skip ahead over unchanged samples, with several channels and SKIP
+ * terms, also in the same condition.
+ */
+START_TEST(test_session_wait_chunks)
+{
+	unsigned int i, j;
+	const char *samples = "00011133322226664444555577711000";
+	const uint64_t chunks[] = { 32, 1, 8 };
+	const char *tests[][2] = {
+		{ "[[{0: 'r'}, {1: 'f'}, {'skip': 7}]]",
+		  "3 100 100\n10 010 001\n16 001 010\n20 101 100\n"
+		  "27 100 011\n" },
+		{ "[[{'skip': 5}, {'skip': 3}, {2: 'e'}]]",
+		  "3 100 010\n6 110 010\n9 010 010\n12 010 010\n"
+		  "13 011 001\n16 001 010\n19 001 010\n22 101 010\n"
+		  "25 111 010\n27 100 001\n30 000 010\n" },
+		{ "[[{0: 'h', 'skip': 2}, {1: 'e'}]]",
+		  "5 100 10\n6 110 01\n8 110 10\n16 001 01\n22 101 10\n"
+		  "24 111 11\n26 111 10\n27 100 01\n" },
+		{ "[{0: 'e', 2: 'l'}]",
+		  "3 100 1\n9 010 1\n29 000 1\n" },
+		{ "[{}, {1: 'r'}]",
+		  "0 000 1\n6 110 1\n7 110 1\n24 111 1\n25 111 1\n" },
+	};
+
+	srd_init(TESTS_DECODERS_DIR);
+	srd_decoder_load("waittest");
+
+	for (i = 0; i < G_N_ELEMENTS(tests); i++) {
+		for (j = 0; j < G_N_ELEMENTS(chunks); j++) {
+			check_texts(run_waittest(samples, chunks[j], FALSE,
+				"calls", tests[i][0], NULL), tests[i][1],
+				tests[i][0], chunks[j]);
+		}
+	}
+
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check the runs which wait_runs() returns. Runs end at the window's
+ * end and at the end of a chunk (samples 8, 16 and 24 start a chunk
+ * when splitting in chunks of 8). A wait() after wait_runs() continues
+ * after the last sample which was covered, and sees its pin values as
+ * the previous ones. At the end of the input, wait_runs() raises
+ * EOFError, and ValueError for an empty window.
+ */
+START_TEST(test_session_wait_runs)
+{
+	unsigned int i;
+	const char *samples = "0000000000111113333333222200";
+	const struct {
+		const char *calls;
+		uint64_t chunk;
+		const char *expected;
+	} tests[] = {
+		{ "[3]", 28,
+		  "runs 0:000:3 @2\nruns 3:000:3 @5\nruns 6:000:3 @8\n"
+		  "runs 9:000:1 10:100:2 @11\nruns 12:100:3 @14\n"
+		  "runs 15:110:3 @17\nruns 18:110:3 @20\n"
+		  "runs 21:110:1 22:010:2 @23\nruns 24:010:2 26:000:1 @26\n"
+		  "runs 27:000:1 @27\n" },
+		{ "[3]", 8,
+		  "runs 0:000:3 @2\nruns 3:000:3 @5\nruns 6:000:2 @7\n"
+		  "runs 8:000:2 10:100:1 @10\nruns 11:100:3 @13\n"
+		  "runs 14:100:1 15:110:1 @15\nruns 16:110:3 @18\n"
+		  "runs 19:110:3 @21\nruns 22:010:2 @23\n"
+		  "runs 24:010:2 26:000:1 @26\nruns 27:000:1 @27\n" },
+		{ "[12, {0: 'e'}]", 28,
+		  "runs 0:000:10 10:100:2 @11\n22 010 1\n"
+		  "runs 23:010:3 26:000:2 @27\n" },
+		{ "[12, {0: 'e'}]", 8,
+		  "runs 0:000:8 @7\n10 100 1\nruns 11:100:4 15:110:1 @15\n"
+		  "22 010 1\nruns 23:010:1 @23\n" },
+		{ "[{1: 'r'}, 1, {0: 'e'}]", 28,
+		  "15 110 1\nruns 16:110:1 @16\n22 010 1\n" },
+	};
+
+	srd_init(TESTS_DECODERS_DIR);
+	srd_decoder_load("waittest");
+
+	for (i = 0; i < G_N_ELEMENTS(tests); i++) {
+		check_texts(run_waittest(samples, tests[i].chunk, FALSE,
+			"calls", tests[i].calls, NULL), tests[i].expected,
+			tests[i].calls, tests[i].chunk);
+	}
+
+	check_texts(run_waittest(samples, 8, TRUE, "calls", "[100]", NULL),
+		"runs 0:000:8 @7\nruns 8:000:2 10:100:5 15:110:1 @15\n"
+		"runs 16:110:6 22:010:2 @23\nruns 24:010:2 26:000:2 @27\n"
+		"EOF @27\n", "[100]", 8);
+	check_texts(run_waittest(samples, 28, TRUE, "calls", "[0, 5]",
+		"repeat", "no", NULL),
+		"ValueError @0\nruns 0:000:5 @4\nEOF @4\n", "[0, 5]", 28);
+
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether compiled (and cached) conditions behave like the
+ * conditions which wait() gets: with the same objects in every call,
+ * with new objects, and with the same objects modified between calls.
+ * More distinct conditions than the cache holds are used, and conditions
+ * which only differ in the order of their terms (SKIP terms only count
+ * samples for which the terms before them matched).
+ */
+START_TEST(test_session_wait_cached)
+{
+	unsigned int i, j;
+	const char *dicts[] = { "literal", "fresh", "shared" };
+	const struct {
+		const char *calls;
+		const char *samples;
+		const char *expected;
+	} tests[] = {
+		{ "[{0: 'r'}, {0: 'f'}, [{1: 'e'}, {2: 'h'}], {'skip': 2}]",
+		  "00011133322226664444555577711000",
+		  "3 100 1\n9 010 1\n13 011 01\n15 011 1\n20 101 1\n"
+		  "29 000 1\n" },
+		{ "[{0: 'e'}, {1: 'e'}, {2: 'e'}, {0: 'r'}, {1: 'r'}, "
+		  "{2: 'r'}, {0: 'f'}, {1: 'f'}, {2: 'f'}]",
+		  "01234567012345670123456701234567",
+		  "1 100 1\n2 010 1\n4 001 1\n5 101 1\n6 011 1\n12 001 1\n"
+		  "14 011 1\n16 000 1\n24 000 1\n25 100 1\n26 010 1\n"
+		  "28 001 1\n29 101 1\n30 011 1\n" },
+		{ "[{'skip': 3, 0: 'e'}, {0: 'e', 'skip': 3}]",
+		  "00011133322226664444555577711000",
+		  "3 100 1\n" },
+		{ "[[{'skip': 2, 1: 'h'}, {2: 'r'}], "
+		  "[{1: 'h', 'skip': 2}, {2: 'r'}]]",
+		  "00011133322226664444555577711000",
+		  "6 110 10\n8 110 10\n10 010 10\n12 010 10\n13 011 01\n"
+		  "15 011 10\n24 111 10\n26 111 10\n" },
+	};
+
+	srd_init(TESTS_DECODERS_DIR);
+	srd_decoder_load("waittest");
+
+	for (i = 0; i < G_N_ELEMENTS(tests); i++) {
+		for (j = 0; j < G_N_ELEMENTS(dicts); j++) {
+			check_texts(run_waittest(tests[i].samples, 32, FALSE,
+				"calls", tests[i].calls, "dicts", dicts[j],
+				NULL), tests[i].expected, tests[i].calls, 32);
+		}
+	}
+
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check the pin values which wait_points() returns, with sample points
+ * within a chunk and across chunks, at the current sample, and after an
+ * abort condition matched (partial result, with self.matched set).
+ * Sample numbers before the current sample or the previous one raise
+ * ValueError without moving on, a later wait() continues where the last
+ * successful call left off.
+ */
+START_TEST(test_session_wait_points)
+{
+	unsigned int i;
+	const char *samples = "00011133322226664444555577711000";
+	const char *calls = "[([0, 2, 5],), ([5, 9, 14],), ([20, 18],), "
+		"([3],), {0: 'e'}, ([21, 23, 26, 30], [{1: 'r'}]), "
+		"([24, 31],), ([],)]";
+	const char *expected = "points 000 000 100 @5 -\n"
+		"points 100 010 011 @14 -\nValueError @14\nValueError @14\n"
+		"20 101 1\npoints 101 101 @24 1\npoints 111 000 @31 -\n"
+		"points - @31 -\n";
+	const uint64_t chunks[] = { 32, 8, 1 };
+	char *eof_calls;
+
+	srd_init(TESTS_DECODERS_DIR);
+	srd_decoder_load("waittest");
+
+	for (i = 0; i < G_N_ELEMENTS(chunks); i++) {
+		check_texts(run_waittest(samples, chunks[i], FALSE,
+			"calls", calls, "repeat", "no", NULL), expected,
+			calls, chunks[i]);
+	}
+
+	/* Sample points beyond the end of the input raise EOFError. */
+	eof_calls = g_strdup_printf("[%s, ([40],)]", calls);
+	check_texts(run_waittest(samples, 8, TRUE, "calls", eof_calls,
+		"repeat", "no", NULL), "points 000 000 100 @5 -\n"
+		"points 100 010 011 @14 -\nValueError @14\nValueError @14\n"
+		"20 101 1\npoints 101 101 @24 1\npoints 111 000 @31 -\n"
+		"points - @31 -\nEOF @31\n", eof_calls, 8);
+	g_free(eof_calls);
+
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether uart yields the same annotations with only RX (where
+ * it gets the bits of a frame from a single wait_points() call) as with
+ * both RX and TX, also when frames span several chunks.
+ */
+START_TEST(test_session_wait_points_uart)
+{
+	int ret, i;
+	uint64_t num_samples, n, len;
+	uint8_t buf[2048];
+	const uint8_t data[] = { 0x12, 0x34, 0x56, 0xff, 0x00, 0x80 };
+	struct srd_session *sess[2];
+	struct srd_decoder_inst *di;
+	struct ann_digest digests[2];
+	GHashTable *channels;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("uart");
+
+	num_samples = gen_uart(buf, data, sizeof(data), 10);
+	for (i = 0; i < 2; i++) {
+		srd_session_new(&sess[i]);
+		digests[i].count = 0;
+		digests[i].sum = 0;
+		srd_pd_output_callback_add(sess[i], SRD_OUTPUT_ANN,
+			ann_digest_cb, &digests[i]);
+		di = srd_inst_new(sess[i], "uart", NULL);
+		conf_check_ok(sess[i], SRD_CONF_SAMPLERATE, 115200 * 10);
+	}
+
+	/* The second instance only gets RX. */
+	channels = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+		(GDestroyNotify)g_variant_unref);
+	g_hash_table_insert(channels, g_strdup("rx"),
+		g_variant_ref_sink(g_variant_new_int32(0)));
+	ret = srd_inst_channel_set_all(di, channels);
+	g_hash_table_destroy(channels);
+	fail_unless(ret == SRD_OK, "srd_inst_channel_set_all() failed: %d.",
+		ret);
+
+	srd_session_start(sess[0]);
+	ret = srd_session_send(sess[0], 0, num_samples, buf, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+
+	srd_session_start(sess[1]);
+	for (n = 0; n < num_samples; n += len) {
+		len = MIN(37, num_samples - n);
+		ret = srd_session_send(sess[1], n, n + len, buf + n, len, 1);
+		fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.",
+			ret);
+	}
+
+	fail_unless(digests[0].count > 0, "No annotations received.");
+	fail_unless(digests[0].count == digests[1].count &&
+		digests[0].sum == digests[1].sum,
+		"Annotations differ with only RX.");
+
+	srd_session_destroy(sess[0]);
+	srd_session_destroy(sess[1]);
+	srd_exit();
+}
+END_TEST
+
+/* Annotation texts except for the bits (stuff bits and others) of can. */
+static void can_field_text_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_annotation *pda;
+
+	pda = pdata->data;
+	if (pda->ann_class != 15 && pda->ann_class != 17)
+		g_string_append_printf(cb_data, "%s\n", pda->ann_text[0]);
+}
+
+/* Update the CAN FD CRC-17 with one bit. */
+static uint32_t can_fd_crc17(uint32_t crc, int bit)
+{
+	if (bit ^ ((crc >> 16) & 1))
+		return ((crc << 1) ^ 0x1685b) & 0x1ffff;
+	return (crc << 1) & 0x1ffff;
+}
+
+/*
+ * Build a CAN FD data frame with an 11-bit identifier, the BRS and ESI
+ * bits set, and up to 8 data bytes (CRC-17). This includes the dynamic
+ * stuff bits, the stuff count and the fixed stuff bits of the CRC field,
+ * but not the CRC delimiter and the bits after it.
+ * Returns the number of bits, and the index of the BRS bit in 'brs'.
+ */
+static int can_fd_frame(uint8_t *bits, int *brs, uint16_t id,
+		const uint8_t *data, int dlc)
+{
+	uint8_t raw[22 + 8 * 8], tail[4 + 17];
+	uint32_t crc;
+	int i, n, num_raw, count, last, stuff, gray;
+
+	num_raw = 0;
+	raw[num_raw++] = 0; /* SOF */
+	for (i = 10; i >= 0; i--)
+		raw[num_raw++] = (id >> i) & 1;
+	raw[num_raw++] = 0; /* RRS */
+	raw[num_raw++] = 0; /* IDE */
+	raw[num_raw++] = 1; /* FDF */
+	raw[num_raw++] = 0; /* res */
+	raw[num_raw++] = 1; /* BRS */
+	raw[num_raw++] = 1; /* ESI */
+	for (i = 3; i >= 0; i--)
+		raw[num_raw++] = (dlc >> i) & 1;
+	for (i = 0; i < dlc * 8; i++)
+		raw[num_raw++] = (data[i / 8] >> (7 - i % 8)) & 1;
+
+	/*
+	 * Dynamic stuff bits up to the last data bit, which are covered by
+	 * the CRC. The fixed stuff bit in front of the stuff count replaces
+	 * a dynamic one after the last data bit.
+	 */
+	n = count = stuff = 0;
+	last = -1;
+	crc = 1 << 16;
+	for (i = 0; i < num_raw; i++) {
+		if (i == 16)
+			*brs = n;
+		bits[n++] = raw[i];
+		crc = can_fd_crc17(crc, raw[i]);
+		if (raw[i] == last) {
+			count++;
+		} else {
+			last = raw[i];
+			count = 1;
+		}
+		if (count == 5 && i < num_raw - 1) {
+			last = !last;
+			bits[n++] = last;
+			crc = can_fd_crc17(crc, last);
+			count = 1;
+			stuff++;
+		}
+	}
+
+	/* Stuff count: Gray code of the count modulo 8, and even parity. */
+	gray = (stuff % 8) ^ ((stuff % 8) >> 1);
+	for (i = 0; i < 3; i++)
+		tail[i] = (gray >> (2 - i)) & 1;
+	tail[3] = tail[0] ^ tail[1] ^ tail[2];
+	for (i = 0; i < 4; i++)
+		crc = can_fd_crc17(crc, tail[i]);
+	for (i = 0; i < 17; i++)
+		tail[4 + i] = (crc >> (16 - i)) & 1;
+
+	/* A fixed stuff bit precedes the stuff count and every 4 bits. */
+	for (i = 0; i < 4 + 17; i++) {
+		if (i % 4 == 0) {
+			bits[n] = !bits[n - 1];
+			n++;
+		}
+		bits[n++] = tail[i];
+	}
+
+	return n;
+}
+
+/*
+ * Check whether can decodes a CAN FD frame with a faster data bit rate
+ * (BRS) from an error passive node (ESI). ESI is recessive like BRS, so
+ * there is no edge to resynchronize on after the bit rate switch.
+ */
+START_TEST(test_session_can_fd)
+{
+	int ret, i, num_bits, brs, len;
+	uint64_t num_samples;
+	uint8_t bits[200], buf[4096];
+	const uint8_t data[] = { 0x00, 0xff, 0x55, 0xaa, 0x0f, 0xf0, 0x80, 0x01 };
+	const char *expected =
+		"Start of frame\n"
+		"Identifier: 291 (0x123)\n"
+		"Identifier extension bit: standard frame\n"
+		"FD format indicator: FD frame\n"
+		"Remote request substitution: 0\n"
+		"Reserved bit: 0\n"
+		"Bit rate switch: 1\n"
+		"Error state indicator: error passive\n"
+		"Data length code: 8\n"
+		"Data byte 0: 0x00\n"
+		"Data byte 1: 0xff\n"
+		"Data byte 2: 0x55\n"
+		"Data byte 3: 0xaa\n"
+		"Data byte 4: 0x0f\n"
+		"Data byte 5: 0xf0\n"
+		"Data byte 6: 0x80\n"
+		"Data byte 7: 0x01\n"
+		"Stuff count: 7\n"
+		"CRC sequence: 0x16638\n"
+		"CRC delimiter: 1\n"
+		"ACK slot: ACK\n"
+		"ACK delimiter: 1\n"
+		"End of frame\n";
+	struct srd_session *sess;
+	GHashTable *options;
+	GString *texts;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load("can");
+
+	num_bits = can_fd_frame(bits, &brs, 0x123, data, sizeof(data));
+	bits[num_bits++] = 1; /* CRC delimiter */
+	bits[num_bits++] = 0; /* ACK slot */
+	for (i = 0; i < 1 + 7 + 3; i++)
+		bits[num_bits++] = 1; /* ACK delimiter, EOF, interframe space */
+
+	/*
+	 * 40 samples per bit at 1 Mbit/s, 10 at 4 Mbit/s, sample point at
+	 * 70%. The bit rate switches at the sample points of the BRS bit and
+	 * the CRC delimiter.
+	 */
+	num_samples = 0;
+	hold_level(buf, &num_samples, 1, 20);
+	for (i = 0; i < num_bits; i++) {
+		if (i < brs || i > num_bits - 13)
+			len = 40;
+		else if (i == brs)
+			len = 28 + 3;
+		else if (i == num_bits - 13)
+			len = 7 + 12;
+		else
+			len = 10;
+		hold_level(buf, &num_samples, bits[i], len);
+	}
+
+	options = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+		(GDestroyNotify)g_variant_unref);
+	g_hash_table_insert(options, g_strdup("fast_bitrate"),
+		g_variant_ref_sink(g_variant_new_int64(4000000)));
+	texts = g_string_new(NULL);
+	srd_session_new(&sess);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, can_field_text_cb,
+		texts);
+	fail_unless(srd_inst_new(sess, "can", options) != NULL,
+		"Cannot create a can instance.");
+	g_hash_table_destroy(options);
+	conf_check_ok(sess, SRD_CONF_SAMPLERATE, 40000000);
+	srd_session_start(sess);
+	ret = srd_session_send(sess, 0, num_samples, buf, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+
+	fail_unless(!strcmp(texts->str, expected),
+		"Got:\n%sinstead of:\n%s", texts->str, expected);
+
+	g_string_free(texts, TRUE);
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
 Suite *suite_session(void)
 {
 	Suite *s;
@@ -244,6 +1627,32 @@ Suite *suite_session(void)
 	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
 	tcase_add_test(tc, test_session_metadata_set);
 	tcase_add_test(tc, test_session_metadata_set_bogus);
+	tcase_add_test(tc, test_session_parallel_set);
+	tcase_add_test(tc, test_session_parallel_set_bogus);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("send");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_send_multiple);
+	tcase_add_test(tc, test_session_bulk_callback);
+	tcase_add_test(tc, test_session_ann_text_interned);
+	tcase_add_test(tc, test_session_send_rle);
+	tcase_add_test(tc, test_session_send_file);
+	tcase_add_test(tc, test_session_stats);
+	tcase_add_test(tc, test_session_send_stacked_batches);
+	tcase_add_test(tc, test_session_shard);
+	tcase_add_test(tc, test_session_unsharded);
+	tcase_add_test(tc, test_session_send_eof);
+	tcase_add_test(tc, test_session_can_fd);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("wait");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_wait_chunks);
+	tcase_add_test(tc, test_session_wait_runs);
+	tcase_add_test(tc, test_session_wait_cached);
+	tcase_add_test(tc, test_session_wait_points);
+	tcase_add_test(tc, test_session_wait_points_uart);
 	suite_add_tcase(s, tc);
 
 	return s;
@@ -0,0 +1,339 @@
+/*
+ * This file is part of the libsigrokdecode project.
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation; either version 2 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, see <http://www.gnu.org/licenses/>.
+ */
+
+/*
+ * Decode a raw logic capture file in parallel worker processes.
+ *
+ * The capture is split into shards in the middle of periods where the bus
+ * is idle (see srd_shard_points_find()). Each shard is decoded by a
+ * separate process. Its samples start half an idle period early, which
+ * lets the decoders see the idle bus, and extend into the next shard for
+ * a while (the lead-out), which lets them complete the shard's last
+ * items. The workers only keep the annotations which start within their
+ * shard (see srd_session_shard_set()), which get printed in shard order.
+ *
+ * Samples are mapped to the decoder's channels in the order in which the
+ * decoder declares them, starting at bit 0 of the sample data.
+ *
+ * This is not installed. Build it with "make tools/shard-decode".
+ */
+
+#include <config.h>
+#include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <glib.h>
+#include <inttypes.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+/* Number of samples per srd_session_send() call of the workers. */
+#define CHUNK_SAMPLES		(1024 * 1024)
+
+struct job {
+	const uint8_t *data;
+	uint64_t num_samples;
+	uint64_t unitsize;
+	uint64_t samplerate;
+	uint64_t lead_in;
+	uint64_t lead_out;
+	char **stack;
+};
+
+static void usage(const char *name)
+{
+	fprintf(stderr, "Usage: %s [options] <pd[:opt=value...][,pd...]> "
+		"<file>\n"
+		"  -r <samplerate>  Samplerate in Hz (required)\n"
+		"  -u <unitsize>    Bytes per sample (default: 1)\n"
+		"  -j <jobs>        Number of worker processes "
+		"(default: number of CPUs)\n"
+		"  -m <mask>        Sample bits which don't change while the "
+		"bus is idle (default: 0x1)\n"
+		"  -v <value>       Values of these bits while idle "
+		"(default: the mask)\n"
+		"  -i <samples>     Minimum length of an idle period "
+		"(default: 1000)\n"
+		"  -o <samples>     Lead-out of the shards "
+		"(default: 4 idle periods)\n", name);
+}
+
+static void ann_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_annotation *pda;
+
+	pda = pdata->data;
+	fprintf(cb_data, "%" PRIu64 "-%" PRIu64 " %s: %s\n",
+		pdata->start_sample, pdata->end_sample,
+		pdata->pdo->di->inst_id, pda->ann_text[0]);
+}
+
+/* Convert an option's value to the type of the option's default. */
+static GVariant *option_value(const struct srd_decoder *dec,
+		const char *key, const char *value)
+{
+	GSList *l;
+	const struct srd_decoder_option *o;
+
+	for (l = dec->options; l; l = l->next) {
+		o = l->data;
+		if (strcmp(o->id, key))
+			continue;
+		if (g_variant_is_of_type(o->def, G_VARIANT_TYPE_INT64))
+			return g_variant_new_int64(strtoll(value, NULL, 0));
+		if (g_variant_is_of_type(o->def, G_VARIANT_TYPE_DOUBLE))
+			return g_variant_new_double(strtod(value, NULL));
+		return g_variant_new_string(value);
+	}
+
+	fprintf(stderr, "Decoder %s has no option '%s'.\n", dec->id, key);
+
+	return NULL;
+}
+
+/* Create the instances of a "pd:opt=value,pd" stack description. */
+static int create_stack(struct srd_session *sess, char **stack)
+{
+	struct srd_decoder *dec;
+	struct srd_decoder_inst *di, *di_prev;
+	GHashTable *options;
+	GVariant *value;
+	char **tokens, *sep;
+	int i, j;
+
+	di_prev = NULL;
+	for (i = 0; stack[i]; i++) {
+		tokens = g_strsplit(stack[i], ":", 0);
+		if (srd_decoder_load(tokens[0]) != SRD_OK ||
+		    !(dec = srd_decoder_get_by_id(tokens[0]))) {
+			fprintf(stderr, "Cannot load decoder '%s'.\n", tokens[0]);
+			g_strfreev(tokens);
+			return SRD_ERR;
+		}
+		options = g_hash_table_new_full(g_str_hash, g_str_equal,
+			g_free, (GDestroyNotify)g_variant_unref);
+		for (j = 1; tokens[j]; j++) {
+			value = NULL;
+			if ((sep = strchr(tokens[j], '='))) {
+				*sep = '\0';
+				value = option_value(dec, tokens[j], sep + 1);
+			}
+			if (!value) {
+				g_hash_table_destroy(options);
+				g_strfreev(tokens);
+				return SRD_ERR_ARG;
+			}
+			g_hash_table_insert(options, g_strdup(tokens[j]),
+				g_variant_ref_sink(value));
+		}
+		di = srd_inst_new(sess, tokens[0], options);
+		g_hash_table_destroy(options);
+		g_strfreev(tokens);
+		if (!di)
+			return SRD_ERR;
+		if (di_prev && srd_inst_stack(sess, di_prev, di) != SRD_OK)
+			return SRD_ERR;
+		di_prev = di;
+	}
+
+	return SRD_OK;
+}
+
+/* Decode the samples [start, end) in a worker process. */
+static int decode_shard(const struct job *job, uint64_t start, uint64_t end,
+		FILE *out)
+{
+	struct srd_session *sess;
+	uint64_t lead_in, lead_out, pos, n;
+	int ret;
+
+	lead_in = start > job->lead_in ? start - job->lead_in : 0;
+	lead_out = MIN(end + job->lead_out, job->num_samples);
+
+	if ((ret = srd_init(NULL)) != SRD_OK)
+		return ret;
+	srd_session_new(&sess);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, ann_cb, out);
+	if ((ret = create_stack(sess, job->stack)) != SRD_OK ||
+	    (ret = srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+			g_variant_new_uint64(job->samplerate))) != SRD_OK ||
+	    (ret = srd_session_shard_set(sess, lead_in, start,
+			end)) != SRD_OK ||
+	    (ret = srd_session_start(sess)) != SRD_OK) {
+		srd_exit();
+		return ret;
+	}
+
+	for (pos = lead_in; pos < lead_out; pos += n) {
+		n = MIN(CHUNK_SAMPLES, lead_out - pos);
+		ret = srd_session_send(sess, pos, pos + n,
+			job->data + pos * job->unitsize, n * job->unitsize,
+			job->unitsize);
+		if (ret != SRD_OK)
+			break;
+	}
+
+	srd_exit();
+
+	return ret;
+}
+
+int main(int argc, char **argv)
+{
+	GMappedFile *file;
+	GError *error;
+	GArray *points;
+	FILE **outs;
+	struct job job;
+	pid_t *pids;
+	uint64_t idle_mask, idle_value, min_idle, start, end;
+	unsigned int num_jobs, num_shards, i;
+	long num_cpus;
+	int opt, status, ret;
+	char buf[4096];
+	size_t len;
+	gboolean have_value;
+
+	memset(&job, 0, sizeof(job));
+	job.unitsize = 1;
+	num_cpus = sysconf(_SC_NPROCESSORS_ONLN);
+	num_jobs = num_cpus > 0 ? num_cpus : 1;
+	idle_mask = 0x1;
+	idle_value = 0;
+	have_value = FALSE;
+	min_idle = 1000;
+
+	while ((opt = getopt(argc, argv, "r:u:j:m:v:i:o:")) != -1) {
+		switch (opt) {
+		case 'r':
+			job.samplerate = strtoull(optarg, NULL, 0);
+			break;
+		case 'u':
+			job.unitsize = strtoull(optarg, NULL, 0);
+			break;
+		case 'j':
+			num_jobs = strtoul(optarg, NULL, 0);
+			break;
+		case 'm':
+			idle_mask = strtoull(optarg, NULL, 0);
+			break;
+		case 'v':
+			idle_value = strtoull(optarg, NULL, 0);
+			have_value = TRUE;
+			break;
+		case 'i':
+			min_idle = strtoull(optarg, NULL, 0);
+			break;
+		case 'o':
+			job.lead_out = strtoull(optarg, NULL, 0);
+			break;
+		default:
+			usage(argv[0]);
+			return EXIT_FAILURE;
+		}
+	}
+	if (argc - optind != 2 || !job.samplerate || !job.unitsize ||
+	    job.unitsize > 8 || !num_jobs || !min_idle) {
+		usage(argv[0]);
+		return EXIT_FAILURE;
+	}
+	if (!have_value)
+		idle_value = idle_mask;
+	/* Cuts are in the middle of idle periods, the lead-in stays idle. */
+	job.lead_in = min_idle / 2;
+	if (!job.lead_out)
+		job.lead_out = 4 * min_idle;
+	job.stack = g_strsplit(argv[optind], ",", 0);
+
+	error = NULL;
+	if (!(file = g_mapped_file_new(argv[optind + 1], FALSE, &error))) {
+		fprintf(stderr, "Cannot map %s: %s.\n", argv[optind + 1],
+			error->message);
+		g_error_free(error);
+		return EXIT_FAILURE;
+	}
+	job.data = (const uint8_t *)g_mapped_file_get_contents(file);
+	job.num_samples = g_mapped_file_get_length(file) / job.unitsize;
+	if (!job.data || !job.num_samples) {
+		fprintf(stderr, "%s holds no samples.\n", argv[optind + 1]);
+		return EXIT_FAILURE;
+	}
+
+	if (srd_shard_points_find(job.data, job.num_samples, job.unitsize,
+			idle_mask, idle_value, min_idle, num_jobs,
+			&points) != SRD_OK) {
+		usage(argv[0]);
+		return EXIT_FAILURE;
+	}
+	num_shards = points->len - 1;
+
+	/*
+	 * The workers write their output to temporary files, which keeps
+	 * them from blocking on a pipe while the others are still running.
+	 */
+	outs = g_malloc0(sizeof(*outs) * num_shards);
+	pids = g_malloc0(sizeof(*pids) * num_shards);
+	ret = EXIT_SUCCESS;
+	for (i = 0; i < num_shards; i++) {
+		if (!(outs[i] = tmpfile())) {
+			perror("tmpfile");
+			ret = EXIT_FAILURE;
+			break;
+		}
+		start = g_array_index(points, uint64_t, i);
+		end = g_array_index(points, uint64_t, i + 1);
+		fflush(NULL);
+		if ((pids[i] = fork()) == 0) {
+			status = decode_shard(&job, start, end, outs[i]);
+			fflush(outs[i]);
+			_exit(status == SRD_OK ? EXIT_SUCCESS : EXIT_FAILURE);
+		}
+		if (pids[i] < 0) {
+			perror("fork");
+			ret = EXIT_FAILURE;
+			break;
+		}
+	}
+
+	for (i = 0; i < num_shards && pids[i] > 0; i++) {
+		if (waitpid(pids[i], &status, 0) < 0 || !WIFEXITED(status) ||
+		    WEXITSTATUS(status) != EXIT_SUCCESS) {
+			fprintf(stderr, "Decoding shard %u failed.\n", i);
+			ret = EXIT_FAILURE;
+		}
+	}
+
+	/* Merge the output of the shards, which are in order already. */
+	for (i = 0; i < num_shards && outs[i]; i++) {
+		if (ret == EXIT_SUCCESS) {
+			rewind(outs[i]);
+			while ((len = fread(buf, 1, sizeof(buf), outs[i])) > 0)
+				fwrite(buf, 1, len, stdout);
+		}
+		fclose(outs[i]);
+	}
+
+	g_free(pids);
+	g_free(outs);
+	g_array_free(points, TRUE);
+	g_strfreev(job.stack);
+	g_mapped_file_unref(file);
+
+	return ret;
+}
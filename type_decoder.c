@@ -21,10 +21,26 @@
 #include "libsigrokdecode-internal.h" /* First, so we avoid a _POSIX_C_SOURCE warning. */
 #include "libsigrokdecode.h"
 #include <inttypes.h>
+#include <string.h>
 
-typedef struct {
-        PyObject_HEAD
-} srd_Decoder;
+/* Upper limit for the number of interned annotation texts per instance. */
+#define ANN_TEXT_CACHE_MAX	4096
+
+/* Number of compiled condition lists which are kept per instance. */
+#define CONDITION_CACHE_SIZE	8
+
+/* Number of OUTPUT_PYTHON items which get queued for decode_many(). */
+#define PYTHON_QUEUE_SIZE	256
+
+/*
+ * Annotation data as allocated by convert_annotation(). Keeps track of
+ * whether the texts are interned (owned by the instance's cache) or need
+ * to get released after delivery.
+ */
+struct annotation_data {
+	struct srd_proto_data_annotation pda;
+	gboolean interned;
+};
 
 /* This is only used for nicer srd_dbg() output.
  */
@@ -40,14 +56,100 @@ static const char *output_type_name(unsigned int idx)
 	return names[MIN(idx, G_N_ELEMENTS(names) - 1)];
 }
 
+static void ann_text_capsule_free(PyObject *py_capsule)
+{
+	g_strfreev(PyCapsule_GetPointer(py_capsule, NULL));
+}
+
+/**
+ * Get the C string vector for a list of annotation texts.
+ *
+ * Texts are interned per decoder instance: the converted string vector
+ * is kept in a cache (a Python dict keyed by the tuple of strings), and
+ * identical lists of texts yield the very same string vector. The cache
+ * holds up to ANN_TEXT_CACHE_MAX entries, texts which don't fit are
+ * converted for a single use.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param py_strlist The Python list of strings. Must not be NULL.
+ * @param out_strv Will be set to the string vector. Must not be NULL.
+ * @param interned Will be set to TRUE if the string vector is owned by the
+ *                 cache, or FALSE if the caller must g_strfreev() it.
+ *                 Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ */
+static int intern_ann_text(struct srd_decoder_inst *di, PyObject *py_strlist,
+		char ***out_strv, gboolean *interned)
+{
+	PyObject *py_key, *py_capsule;
+	char **strv;
+
+	*interned = FALSE;
+
+	if (!di->ann_text_cache && !(di->ann_text_cache = PyDict_New()))
+		PyErr_Clear();
+
+	py_key = NULL;
+	if (di->ann_text_cache && !(py_key = PyList_AsTuple(py_strlist)))
+		PyErr_Clear();
+
+	/* PyDict_GetItem() returns a borrowed reference. */
+	if (py_key && (py_capsule = PyDict_GetItem(di->ann_text_cache, py_key))) {
+		*out_strv = PyCapsule_GetPointer(py_capsule, NULL);
+		*interned = TRUE;
+		Py_DecRef(py_key);
+		return SRD_OK;
+	}
+
+	if (py_strseq_to_char(py_strlist, &strv) != SRD_OK) {
+		Py_XDECREF(py_key);
+		return SRD_ERR_PYTHON;
+	}
+	*out_strv = strv;
+
+	if (!py_key)
+		return SRD_OK;
+
+	if (PyDict_Size(di->ann_text_cache) < ANN_TEXT_CACHE_MAX) {
+		/* Only let the cache own strv once it was added. */
+		py_capsule = PyCapsule_New(strv, NULL, NULL);
+		if (py_capsule && PyDict_SetItem(di->ann_text_cache,
+				py_key, py_capsule) == 0) {
+			PyCapsule_SetDestructor(py_capsule, ann_text_capsule_free);
+			*interned = TRUE;
+		}
+		Py_XDECREF(py_capsule);
+		PyErr_Clear();
+	}
+	Py_DecRef(py_key);
+
+	return SRD_OK;
+}
+
+/* Release annotation data after it was delivered to the frontend. */
+static void release_annotation(struct srd_proto_data_annotation *pda)
+{
+	struct annotation_data *ad;
+
+	if (!pda)
+		return;
+
+	ad = (struct annotation_data *)pda;
+	if (!ad->interned)
+		g_strfreev(pda->ann_text);
+	g_free(ad);
+}
+
 static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 		struct srd_proto_data *pdata)
 {
 	PyObject *py_tmp;
 	struct srd_pd_output *pdo;
-	struct srd_proto_data_annotation *pda;
+	struct annotation_data *ad;
 	int ann_class;
 	char **ann_text;
+	gboolean interned;
 	PyGILState_STATE gstate;
 
 	gstate = PyGILState_Ensure();
@@ -91,16 +193,17 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 			"second element was not a list.", di->decoder->name);
 		goto err;
 	}
-	if (py_strseq_to_char(py_tmp, &ann_text) != SRD_OK) {
+	if (intern_ann_text(di, py_tmp, &ann_text, &interned) != SRD_OK) {
 		srd_err("Protocol decoder %s submitted annotation list, but "
 			"second element was malformed.", di->decoder->name);
 		goto err;
 	}
 
-	pda = g_malloc(sizeof(struct srd_proto_data_annotation));
-	pda->ann_class = ann_class;
-	pda->ann_text = ann_text;
-	pdata->data = pda;
+	ad = g_malloc(sizeof(struct annotation_data));
+	ad->pda.ann_class = ann_class;
+	ad->pda.ann_text = ann_text;
+	ad->interned = interned;
+	pdata->data = &ad->pda;
 
 	PyGILState_Release(gstate);
 
@@ -229,11 +332,219 @@ err:
 	return SRD_ERR_PYTHON;
 }
 
+static void deliver_output(struct srd_pd_callback *cb,
+		struct srd_proto_data *pdata, unsigned int count)
+{
+	unsigned int i;
+
+	if (cb->bulk_cb) {
+		cb->bulk_cb(pdata, count, cb->cb_data);
+	} else {
+		for (i = 0; i < count; i++)
+			cb->cb(&pdata[i], cb->cb_data);
+	}
+}
+
+static gboolean in_shard(const struct srd_session *sess,
+		const struct srd_proto_data *pdata)
+{
+	return pdata->start_sample >= sess->shard_start &&
+		pdata->start_sample < sess->shard_end;
+}
+
+/*
+ * Hand output items to a frontend callback (regular or bulk). Sharded
+ * sessions only pass on the items which start within the shard.
+ */
+static void run_output_callback(struct srd_pd_callback *cb,
+		struct srd_proto_data *pdata, unsigned int count)
+{
+	struct srd_decoder_inst *di;
+	struct srd_session *sess;
+	unsigned int i, end;
+	gint64 t_start;
+
+	di = pdata->pdo->di;
+	sess = di->sess;
+	t_start = sess->stats_enabled ? g_get_monotonic_time() : 0;
+
+	if (!sess->sharded) {
+		deliver_output(cb, pdata, count);
+	} else {
+		i = 0;
+		while (i < count) {
+			while (i < count && !in_shard(sess, &pdata[i]))
+				i++;
+			for (end = i; end < count && in_shard(sess, &pdata[end]); end++)
+				;
+			if (end > i)
+				deliver_output(cb, &pdata[i], end - i);
+			i = end;
+		}
+	}
+
+	if (di->sess->stats_enabled)
+		di->stats.callback_time += g_get_monotonic_time() - t_start;
+}
+
+/**
+ * Look up the methods which take OUTPUT_PYTHON data from lower PDs.
+ *
+ * The bound methods are kept for the lifetime of the instance. Decoders
+ * which implement decode_many() get a queue, and receive their input
+ * as lists of (startsample, endsample, data) tuples.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @return SRD_OK upon success, SRD_ERR_PYTHON (with an exception set)
+ *         if the instance has no decode() method.
+ */
+static int setup_python_input(struct srd_decoder_inst *di)
+{
+	PyObject *py_inst;
+
+	py_inst = di->py_inst;
+
+	if (!(di->py_decode = PyObject_GetAttrString(py_inst, "decode")))
+		return SRD_ERR_PYTHON;
+
+	if (!PyObject_HasAttrString(py_inst, "decode_many"))
+		return SRD_OK;
+
+	di->py_decode_many = PyObject_GetAttrString(py_inst, "decode_many");
+	di->py_input_queue = PyList_New(0);
+	if (!di->py_decode_many || !di->py_input_queue) {
+		/* Fall back to decode() calls. */
+		Py_XDECREF((PyObject *)di->py_decode_many);
+		Py_XDECREF((PyObject *)di->py_input_queue);
+		di->py_decode_many = NULL;
+		di->py_input_queue = NULL;
+		PyErr_Clear();
+	}
+
+	return SRD_OK;
+}
+
+/* Pass queued OUTPUT_PYTHON data to an instance's decode_many(). */
+static void flush_python_input(struct srd_decoder_inst *di)
+{
+	PyObject *py_items, *py_res;
+
+	py_items = di->py_input_queue;
+	if (!py_items || !PyList_Size(py_items))
+		return;
+
+	/* The decoder may keep the list, start a new one. */
+	if (!(di->py_input_queue = PyList_New(0)))
+		PyErr_Clear();
+
+	srd_spew("Sending %zd items to instance %s",
+		 PyList_Size(py_items), di->inst_id);
+	if (!(py_res = PyObject_CallFunctionObjArgs(di->py_decode_many,
+			py_items, NULL))) {
+		srd_exception_catch("Calling %s decode_many() failed",
+					di->inst_id);
+	}
+	Py_XDECREF(py_res);
+	Py_DecRef(py_items);
+}
+
+/**
+ * Pass all queued OUTPUT_PYTHON data up the stack, from the bottom
+ * to the top, including what the upper PDs put() while doing so.
+ *
+ * Must be called with the GIL held.
+ *
+ * @param di The decoder instance at the bottom of the stack.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_flush_python_queues(struct srd_decoder_inst *di)
+{
+	GSList *l;
+	struct srd_decoder_inst *next_di;
+
+	for (l = di->next_di; l; l = l->next) {
+		next_di = l->data;
+		flush_python_input(next_di);
+		srd_inst_flush_python_queues(next_di);
+	}
+}
+
+/* Run an instance's decode() method for an item of OUTPUT_PYTHON data. */
+static PyObject *call_decode(struct srd_decoder_inst *di,
+		PyObject *py_ss, PyObject *py_es, PyObject *py_data)
+{
+	return PyObject_CallFunctionObjArgs(di->py_decode,
+		py_ss, py_es, py_data, NULL);
+}
+
+/* Pass OUTPUT_PYTHON data up the stack (and to the frontend, if wanted). */
+static void put_python(struct srd_decoder_inst *di,
+		struct srd_proto_data *pdata, PyObject *py_data)
+{
+	GSList *l;
+	PyObject *py_ss, *py_es, *py_item, *py_res;
+	struct srd_decoder_inst *next_di;
+	struct srd_pd_callback *cb;
+
+	py_ss = py_es = py_item = NULL;
+	if (di->next_di) {
+		/* The same sample numbers go to all of the upper PDs. */
+		py_ss = PyLong_FromUnsignedLongLong(pdata->start_sample);
+		py_es = PyLong_FromUnsignedLongLong(pdata->end_sample);
+		if (!py_ss || !py_es)
+			srd_exception_catch("Protocol decoder instance %s",
+						di->inst_id);
+	}
+
+	for (l = di->next_di; l && py_ss && py_es; l = l->next) {
+		next_di = l->data;
+		srd_spew("Sending %" PRIu64 "-%" PRIu64 " to instance %s",
+			 pdata->start_sample, pdata->end_sample,
+			 next_di->inst_id);
+		if (!next_di->py_decode && setup_python_input(next_di) != SRD_OK) {
+			srd_exception_catch("Instance %s has no decode()",
+						next_di->inst_id);
+			continue;
+		}
+		if (next_di->py_input_queue) {
+			if (!py_item)
+				py_item = PyTuple_Pack(3, py_ss, py_es, py_data);
+			if (!py_item || PyList_Append(next_di->py_input_queue,
+					py_item) < 0) {
+				srd_exception_catch("Protocol decoder instance %s",
+							next_di->inst_id);
+				continue;
+			}
+			if (PyList_Size(next_di->py_input_queue) >=
+					PYTHON_QUEUE_SIZE)
+				flush_python_input(next_di);
+			continue;
+		}
+		if (!(py_res = call_decode(next_di, py_ss, py_es, py_data))) {
+			srd_exception_catch("Calling %s decode() failed",
+						next_di->inst_id);
+		}
+		Py_XDECREF(py_res);
+	}
+	Py_XDECREF(py_item);
+	Py_XDECREF(py_es);
+	Py_XDECREF(py_ss);
+
+	if ((cb = srd_pd_output_callback_find(di->sess, SRD_OUTPUT_PYTHON))) {
+		/* Frontends aren't really supposed to get Python
+		 * callbacks, but it's useful for testing. */
+		pdata->data = py_data;
+		run_output_callback(cb, pdata, 1);
+	}
+}
+
 static PyObject *Decoder_put(PyObject *self, PyObject *args)
 {
 	GSList *l;
-	PyObject *py_data, *py_res;
-	struct srd_decoder_inst *di, *next_di;
+	PyObject *py_data;
+	struct srd_decoder_inst *di;
 	struct srd_pd_output *pdo;
 	struct srd_proto_data pdata;
 	uint64_t start_sample, end_sample;
@@ -243,7 +554,7 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 
 	gstate = PyGILState_Ensure();
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		/* Shouldn't happen. */
 		srd_dbg("put(): self instance not found.");
 		goto err;
@@ -270,6 +581,9 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 		 di->inst_id, start_sample, end_sample,
 		 output_type_name(pdo->output_type), output_id);
 
+	if (pdo->output_type <= SRD_OUTPUT_META)
+		di->stats.puts[pdo->output_type]++;
+
 	pdata.start_sample = start_sample;
 	pdata.end_sample = end_sample;
 	pdata.pdo = pdo;
@@ -285,29 +599,13 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 				break;
 			}
 			Py_BEGIN_ALLOW_THREADS
-			cb->cb(&pdata, cb->cb_data);
+			run_output_callback(cb, &pdata, 1);
 			Py_END_ALLOW_THREADS
+			release_annotation(pdata.data);
 		}
 		break;
 	case SRD_OUTPUT_PYTHON:
-		for (l = di->next_di; l; l = l->next) {
-			next_di = l->data;
-			srd_spew("Sending %" PRIu64 "-%" PRIu64 " to instance %s",
-				 start_sample, end_sample, next_di->inst_id);
-			if (!(py_res = PyObject_CallMethod(
-				next_di->py_inst, "decode", "KKO", start_sample,
-				end_sample, py_data))) {
-				srd_exception_catch("Calling %s decode() failed",
-							next_di->inst_id);
-			}
-			Py_XDECREF(py_res);
-		}
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
-			/* Frontends aren't really supposed to get Python
-			 * callbacks, but it's useful for testing. */
-			pdata.data = py_data;
-			cb->cb(&pdata, cb->cb_data);
-		}
+		put_python(di, &pdata, py_data);
 		break;
 	case SRD_OUTPUT_BINARY:
 		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
@@ -317,7 +615,7 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 				break;
 			}
 			Py_BEGIN_ALLOW_THREADS
-			cb->cb(&pdata, cb->cb_data);
+			run_output_callback(cb, &pdata, 1);
 			Py_END_ALLOW_THREADS
 		}
 		break;
@@ -329,7 +627,7 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 				break;
 			}
 			Py_BEGIN_ALLOW_THREADS
-			cb->cb(&pdata, cb->cb_data);
+			run_output_callback(cb, &pdata, 1);
 			Py_END_ALLOW_THREADS
 		}
 		break;
@@ -349,6 +647,185 @@ err:
 	return NULL;
 }
 
+/* Deliver a batch of converted output items to their frontend callback. */
+static void flush_output_batch(GArray *batch, struct srd_pd_callback *cb)
+{
+	struct srd_proto_data *pdata;
+	guint i;
+
+	if (!batch->len)
+		return;
+
+	pdata = (struct srd_proto_data *)batch->data;
+
+	Py_BEGIN_ALLOW_THREADS
+	run_output_callback(cb, pdata, batch->len);
+	Py_END_ALLOW_THREADS
+
+	if (cb->output_type == SRD_OUTPUT_ANN) {
+		for (i = 0; i < batch->len; i++)
+			release_annotation(pdata[i].data);
+	}
+
+	g_array_set_size(batch, 0);
+}
+
+/**
+ * Submit a sequence of output items at once.
+ *
+ * Accepts a sequence of (startsample, endsample, output_id, data) tuples,
+ * which are handled like individual put() calls, in order. Consecutive
+ * items for the same frontend callback are converted first, and then get
+ * delivered in a single call (bulk callbacks receive them as one array),
+ * with the GIL released only once per batch.
+ *
+ * @param self The decoder instance's Python object. Must not be NULL.
+ * @param args The Python arguments (the sequence of tuples).
+ *
+ * @return Py_None upon success, NULL (with an exception set) otherwise.
+ */
+static PyObject *Decoder_put_many(PyObject *self, PyObject *args)
+{
+	GSList *l;
+	GArray *batch;
+	PyObject *py_records, *py_record, *py_data;
+	struct srd_decoder_inst *di;
+	struct srd_pd_output *pdo;
+	struct srd_proto_data pdata;
+	struct srd_pd_callback *cb, *batch_cb;
+	uint64_t start_sample, end_sample;
+	Py_ssize_t num_records, i;
+	int output_id, ret;
+	PyGILState_STATE gstate;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		/* Shouldn't happen. */
+		srd_dbg("put_many(): self instance not found.");
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto err;
+	}
+
+	if (!PyArg_ParseTuple(args, "O", &py_records)) {
+		/* Let Python raise this exception. */
+		goto err;
+	}
+
+	if (!PySequence_Check(py_records) ||
+	    (num_records = PySequence_Size(py_records)) < 0) {
+		PyErr_SetString(PyExc_TypeError, "put_many() expects a "
+			"sequence of (startsample, endsample, output_id, data)");
+		goto err;
+	}
+
+	batch = g_array_sized_new(FALSE, FALSE,
+		sizeof(struct srd_proto_data), num_records);
+	batch_cb = NULL;
+	ret = SRD_OK;
+
+	for (i = 0; i < num_records; i++) {
+		if (!(py_record = PySequence_GetItem(py_records, i))) {
+			ret = SRD_ERR_PYTHON;
+			break;
+		}
+		if (!PyTuple_Check(py_record) ||
+		    !PyArg_ParseTuple(py_record, "KKiO", &start_sample,
+				&end_sample, &output_id, &py_data)) {
+			if (!PyErr_Occurred())
+				PyErr_SetString(PyExc_TypeError, "put_many() "
+					"items must be tuples");
+			Py_DecRef(py_record);
+			ret = SRD_ERR_PYTHON;
+			break;
+		}
+
+		if (!(l = g_slist_nth(di->pd_output, output_id))) {
+			srd_err("Protocol decoder %s submitted invalid output ID %d.",
+				di->decoder->name, output_id);
+			PyErr_Format(PyExc_ValueError, "invalid output ID %d",
+				output_id);
+			Py_DecRef(py_record);
+			ret = SRD_ERR_ARG;
+			break;
+		}
+		pdo = l->data;
+
+		srd_spew("Instance %s put %" PRIu64 "-%" PRIu64 " %s on oid %d.",
+			 di->inst_id, start_sample, end_sample,
+			 output_type_name(pdo->output_type), output_id);
+
+		if (pdo->output_type <= SRD_OUTPUT_META)
+			di->stats.puts[pdo->output_type]++;
+
+		pdata.start_sample = start_sample;
+		pdata.end_sample = end_sample;
+		pdata.pdo = pdo;
+		pdata.data = NULL;
+
+		cb = NULL;
+		if (pdo->output_type != SRD_OUTPUT_PYTHON)
+			cb = srd_pd_output_callback_find(di->sess, pdo->output_type);
+
+		/* Keep the order of items which go to different receivers. */
+		if (batch->len && cb != batch_cb)
+			flush_output_batch(batch, batch_cb);
+
+		switch (pdo->output_type) {
+		case SRD_OUTPUT_ANN:
+			if (cb && convert_annotation(di, py_data, &pdata) == SRD_OK) {
+				g_array_append_val(batch, pdata);
+				batch_cb = cb;
+			}
+			break;
+		case SRD_OUTPUT_PYTHON:
+			put_python(di, &pdata, py_data);
+			break;
+		case SRD_OUTPUT_BINARY:
+			if (cb && convert_binary(di, py_data, &pdata) == SRD_OK) {
+				g_array_append_val(batch, pdata);
+				batch_cb = cb;
+			}
+			break;
+		case SRD_OUTPUT_META:
+			if (cb && convert_meta(&pdata, py_data) == SRD_OK) {
+				g_array_append_val(batch, pdata);
+				batch_cb = cb;
+			}
+			break;
+		default:
+			srd_err("Protocol decoder %s submitted invalid output type %d.",
+				di->decoder->name, pdo->output_type);
+			break;
+		}
+
+		Py_DecRef(py_record);
+
+		/* Converting meta output can raise an exception. */
+		if (PyErr_Occurred()) {
+			ret = SRD_ERR_PYTHON;
+			break;
+		}
+	}
+
+	/* Deliver what was converted before a failure, too. */
+	if (batch->len)
+		flush_output_batch(batch, batch_cb);
+	g_array_free(batch, TRUE);
+
+	if (ret != SRD_OK)
+		goto err;
+
+	PyGILState_Release(gstate);
+
+	Py_RETURN_NONE;
+
+err:
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
 static PyObject *Decoder_register(PyObject *self, PyObject *args,
 		PyObject *kwargs)
 {
@@ -368,7 +845,7 @@ static PyObject *Decoder_register(PyObject *self, PyObject *args,
 	meta_type_gv = NULL;
 	meta_name = meta_descr = NULL;
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -478,7 +955,7 @@ static PyObject *get_current_pinvalues(const struct srd_decoder_inst *di)
 			/* Value of unused channel is 0xff, instead of 0 or 1. */
 			PyTuple_SetItem(py_pinvalues, i, PyLong_FromLong(0xff));
 		} else {
-			sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+			sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum);
 			byte_offset = di->dec_channelmap[i] / 8;
 			bit_offset = di->dec_channelmap[i] % 8;
 			sample = *(sample_pos + byte_offset) & (1 << bit_offset) ? 1 : 0;
@@ -492,47 +969,54 @@ static PyObject *get_current_pinvalues(const struct srd_decoder_inst *di)
 }
 
 /**
- * Create a list of terms in the specified condition.
- *
- * If there are no terms in the condition, 'term_list' will be NULL.
+ * Create the terms of the specified condition.
  *
+ * @param di The decoder instance. Must not be NULL.
  * @param py_dict A Python dict containing terms. Must not be NULL.
- * @param term_list Pointer to a GSList which will be set to the newly
- *                  created list of terms. Must not be NULL.
+ * @param terms The array to store the terms into, which must have room
+ *              for all items of 'py_dict'. Must not be NULL.
  *
  * @return SRD_OK upon success, a negative error code otherwise.
  */
-static int create_term_list(PyObject *py_dict, GSList **term_list)
+static int create_terms(const struct srd_decoder_inst *di, PyObject *py_dict,
+		struct srd_term *terms)
 {
 	Py_ssize_t pos = 0;
 	PyObject *py_key, *py_value;
 	struct srd_term *term;
 	uint64_t num_samples_to_skip;
 	char *term_str;
+	int ch;
 	PyGILState_STATE gstate;
 
-	if (!py_dict || !term_list)
+	if (!py_dict || !terms)
 		return SRD_ERR_ARG;
 
-	/* "Create" an empty GSList of terms. */
-	*term_list = NULL;
-
 	gstate = PyGILState_Ensure();
 
 	/* Iterate over all items in the current dict. */
+	term = terms;
 	while (PyDict_Next(py_dict, &pos, &py_key, &py_value)) {
 		/* Check whether the current key is a string or a number. */
 		if (PyLong_Check(py_key)) {
 			/* The key is a number. */
-			/* TODO: Check if the number is a valid channel. */
+			ch = PyLong_AsLong(py_key);
+			if (ch < 0 || ch >= di->dec_num_channels) {
+				srd_err("Invalid channel %d in condition.", ch);
+				goto err;
+			}
 			/* Get the value string. */
 			if ((py_pydictitem_as_str(py_dict, py_key, &term_str)) != SRD_OK) {
 				srd_err("Failed to get the value.");
 				goto err;
 			}
-			term = g_malloc0(sizeof(struct srd_term));
 			term->type = get_term_type(term_str);
-			term->channel = PyLong_AsLong(py_key);
+			term->channel = ch;
+			/* Unused optional channels always read as low. */
+			if (di->dec_channelmap[ch] != -1) {
+				term->byte_offset = di->dec_channelmap[ch] / 8;
+				term->bit_mask = 1 << (di->dec_channelmap[ch] % 8);
+			}
 			g_free(term_str);
 		} else if (PyUnicode_Check(py_key)) {
 			/* The key is a string. */
@@ -541,7 +1025,6 @@ static int create_term_list(PyObject *py_dict, GSList **term_list)
 				srd_err("Failed to get number of samples to skip.");
 				goto err;
 			}
-			term = g_malloc0(sizeof(struct srd_term));
 			term->type = SRD_TERM_SKIP;
 			term->num_samples_to_skip = num_samples_to_skip;
 			term->num_samples_already_skipped = 0;
@@ -549,9 +1032,7 @@ static int create_term_list(PyObject *py_dict, GSList **term_list)
 			srd_err("Term key is neither a string nor a number.");
 			goto err;
 		}
-
-		/* Add the term to the list of terms. */
-		*term_list = g_slist_append(*term_list, term);
+		term++;
 	}
 
 	PyGILState_Release(gstate);
@@ -564,23 +1045,196 @@ err:
 	return SRD_ERR;
 }
 
+/**
+ * Compile a list of conditions.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param py_conditionlist A Python list of condition dicts. Must not be NULL.
+ *
+ * @return The newly allocated condition list, or NULL upon errors.
+ */
+static struct srd_condition_list *compile_conditions(
+		const struct srd_decoder_inst *di, PyObject *py_conditionlist)
+{
+	struct srd_condition_list *conds;
+	PyObject *py_dict;
+	unsigned int i, num_terms;
+
+	conds = g_malloc0(sizeof(*conds));
+	conds->num_conditions = PyList_Size(py_conditionlist);
+	conds->cond_start = g_malloc((conds->num_conditions + 1) *
+		sizeof(*conds->cond_start));
+
+	/* Determine where the terms of each condition go. */
+	num_terms = 0;
+	for (i = 0; i < conds->num_conditions; i++) {
+		py_dict = PyList_GetItem(py_conditionlist, i);
+		if (!PyDict_Check(py_dict)) {
+			srd_err("Condition is not a dict.");
+			g_free(conds->cond_start);
+			g_free(conds);
+			return NULL;
+		}
+		conds->cond_start[i] = num_terms;
+		num_terms += PyDict_Size(py_dict);
+	}
+	conds->cond_start[i] = num_terms;
+	conds->terms = g_malloc0(MAX(num_terms, 1) * sizeof(*conds->terms));
+
+	for (i = 0; i < conds->num_conditions; i++) {
+		py_dict = PyList_GetItem(py_conditionlist, i);
+		if (create_terms(di, py_dict,
+				&conds->terms[conds->cond_start[i]]) != SRD_OK) {
+			srd_condition_list_free(conds);
+			return NULL;
+		}
+	}
+
+	return conds;
+}
+
+/* Copy a wait() argument, such that later changes by the PD don't affect it. */
+static PyObject *copy_conditions(PyObject *py_conds)
+{
+	PyObject *py_copy, *py_dict;
+	Py_ssize_t i, num_conditions;
+
+	if (PyDict_Check(py_conds))
+		return PyDict_Copy(py_conds);
+
+	num_conditions = PyList_Size(py_conds);
+	if (!(py_copy = PyList_New(num_conditions)))
+		return NULL;
+	for (i = 0; i < num_conditions; i++) {
+		if (!(py_dict = PyDict_Copy(PyList_GetItem(py_conds, i)))) {
+			Py_DecRef(py_copy);
+			return NULL;
+		}
+		PyList_SetItem(py_copy, i, py_dict);
+	}
+
+	return py_copy;
+}
+
+/*
+ * Check whether two condition dicts have equal items in the same order.
+ * The order matters, the terms of a condition are evaluated in the order
+ * of their keys, until one doesn't match (which affects SKIP terms).
+ */
+static gboolean condition_dicts_equal(PyObject *py_a, PyObject *py_b)
+{
+	Py_ssize_t pos_a, pos_b;
+	PyObject *py_key_a, *py_value_a, *py_key_b, *py_value_b;
+
+	if (!PyDict_Check(py_a) || !PyDict_Check(py_b) ||
+	    PyDict_Size(py_a) != PyDict_Size(py_b))
+		return FALSE;
+
+	pos_a = pos_b = 0;
+	while (PyDict_Next(py_a, &pos_a, &py_key_a, &py_value_a)) {
+		if (!PyDict_Next(py_b, &pos_b, &py_key_b, &py_value_b))
+			return FALSE;
+		if (PyObject_RichCompareBool(py_key_a, py_key_b, Py_EQ) != 1 ||
+		    PyObject_RichCompareBool(py_value_a, py_value_b, Py_EQ) != 1) {
+			PyErr_Clear();
+			return FALSE;
+		}
+	}
+
+	return TRUE;
+}
+
+/* Check whether two wait() arguments (a dict or a list of dicts) are equal. */
+static gboolean conditions_equal(PyObject *py_a, PyObject *py_b)
+{
+	Py_ssize_t i, num_conditions;
+
+	if (PyDict_Check(py_a) || PyDict_Check(py_b))
+		return condition_dicts_equal(py_a, py_b);
+
+	num_conditions = PyList_Size(py_a);
+	if (PyList_Size(py_b) != num_conditions)
+		return FALSE;
+	for (i = 0; i < num_conditions; i++) {
+		if (!condition_dicts_equal(PyList_GetItem(py_a, i),
+				PyList_GetItem(py_b, i)))
+			return FALSE;
+	}
+
+	return TRUE;
+}
+
+/**
+ * Find a previously compiled condition list for a wait() argument.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param py_conds The argument of wait(). Must not be NULL.
+ *
+ * @return The condition list (with reset SKIP terms), or NULL if there
+ *         is none for (an equal copy of) 'py_conds'.
+ */
+static struct srd_condition_list *find_cached_conditions(
+		struct srd_decoder_inst *di, PyObject *py_conds)
+{
+	struct srd_condition_list *conds;
+	unsigned int i, t;
+
+	if (!di->condition_cache)
+		return NULL;
+
+	for (i = 0; i < di->condition_cache->len; i++) {
+		conds = g_ptr_array_index(di->condition_cache, i);
+		if (!conditions_equal(conds->py_conds, py_conds))
+			continue;
+		for (t = 0; t < conds->cond_start[conds->num_conditions]; t++)
+			conds->terms[t].num_samples_already_skipped = 0;
+		return conds;
+	}
+
+	return NULL;
+}
+
+/* Add a condition list to the cache, replacing the oldest one if needed. */
+static void cache_conditions(struct srd_decoder_inst *di,
+		struct srd_condition_list *conds)
+{
+	if (!di->condition_cache) {
+		di->condition_cache = g_ptr_array_new_with_free_func(
+			(GDestroyNotify)srd_condition_list_free);
+	}
+
+	if (di->condition_cache->len < CONDITION_CACHE_SIZE) {
+		g_ptr_array_add(di->condition_cache, conds);
+		return;
+	}
+
+	srd_condition_list_free(g_ptr_array_index(di->condition_cache,
+		di->condition_cache_next));
+	di->condition_cache->pdata[di->condition_cache_next] = conds;
+	di->condition_cache_next = (di->condition_cache_next + 1) %
+		CONDITION_CACHE_SIZE;
+}
+
 /**
  * Replace the current condition list with the new one.
  *
+ * Conditions get compiled into a struct srd_condition_list, which is kept
+ * in a small per-instance cache. Later wait() calls with equal conditions
+ * reuse the compiled list, even when the PD builds new dicts every time.
+ *
  * @param self TODO. Must not be NULL.
  * @param args TODO. Must not be NULL.
  *
  * @retval SRD_OK The new condition list was set successfully.
  * @retval SRD_ERR There was an error setting the new condition list.
- *                 The contents of di->condition_list are undefined.
+ *                 The current condition list is unchanged.
  * @retval 9999 TODO.
  */
 static int set_new_condition_list(PyObject *self, PyObject *args)
 {
 	struct srd_decoder_inst *di;
-	GSList *term_list;
-	PyObject *py_conditionlist, *py_conds, *py_dict;
-	int i, num_conditions, ret;
+	struct srd_condition_list *conds;
+	PyObject *py_conditionlist, *py_conds;
 	PyGILState_STATE gstate;
 
 	if (!self || !args)
@@ -589,7 +1243,7 @@ static int set_new_condition_list(PyObject *self, PyObject *args)
 	gstate = PyGILState_Ensure();
 
 	/* Get the decoder instance. */
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -620,10 +1274,9 @@ static int set_new_condition_list(PyObject *self, PyObject *args)
 		goto ret_9999;
 	} else if (PyList_Check(py_conds)) {
 		/* 'py_conds' is a list. */
-		py_conditionlist = py_conds;
-		num_conditions = PyList_Size(py_conditionlist);
-		if (num_conditions == 0)
+		if (PyList_Size(py_conds) == 0)
 			goto ret_9999; /* The PD invoked self.wait([]). */
+		py_conditionlist = py_conds;
 		Py_IncRef(py_conditionlist);
 	} else if (PyDict_Check(py_conds)) {
 		/* 'py_conds' is a dict. */
@@ -633,40 +1286,34 @@ static int set_new_condition_list(PyObject *self, PyObject *args)
 		py_conditionlist = PyList_New(1);
 		Py_IncRef(py_conds);
 		PyList_SetItem(py_conditionlist, 0, py_conds);
-		num_conditions = 1;
 	} else {
 		srd_err("Condition list is neither a list nor a dict.");
 		goto err;
 	}
 
-	/* Free the old condition list. */
-	condition_list_free(di);
-
-	ret = SRD_OK;
-
-	/* Iterate over the conditions, set di->condition_list accordingly. */
-	for (i = 0; i < num_conditions; i++) {
-		/* Get a condition (dict) from the condition list. */
-		py_dict = PyList_GetItem(py_conditionlist, i);
-		if (!PyDict_Check(py_dict)) {
-			srd_err("Condition is not a dict.");
-			ret = SRD_ERR;
-			break;
-		}
-
-		/* Create the list of terms in this condition. */
-		if ((ret = create_term_list(py_dict, &term_list)) < 0)
-			break;
-
-		/* Add the new condition to the PD instance's condition list. */
-		di->condition_list = g_slist_append(di->condition_list, term_list);
+	/* Reuse the compiled form of equal conditions. */
+	if ((conds = find_cached_conditions(di, py_conds))) {
+		Py_DecRef(py_conditionlist);
+		di->condition_list = conds;
+		PyGILState_Release(gstate);
+		return SRD_OK;
 	}
 
+	conds = compile_conditions(di, py_conditionlist);
 	Py_DecRef(py_conditionlist);
+	if (!conds)
+		goto err;
+
+	if (!(conds->py_conds = copy_conditions(py_conds))) {
+		srd_condition_list_free(conds);
+		goto err;
+	}
+	cache_conditions(di, conds);
+	di->condition_list = conds;
 
 	PyGILState_Release(gstate);
 
-	return ret;
+	return SRD_OK;
 
 err:
 	PyGILState_Release(gstate);
@@ -680,7 +1327,7 @@ ret_9999:
 }
 
 /**
- * Create a SKIP condition list for condition-less .wait() calls.
+ * Set a SKIP condition list for condition-less .wait() calls.
  *
  * @param di Decoder instance.
  * @param count Number of samples to skip.
@@ -690,77 +1337,94 @@ ret_9999:
  *                 The contents of di->condition_list are undefined.
  *
  * This routine is a reduced and specialized version of the @ref
- * set_new_condition_list() and @ref create_term_list() routines which
+ * set_new_condition_list() and @ref compile_conditions() routines which
  * gets invoked when .wait() was called without specifications for
- * conditions. This minor duplication of the SKIP term list creation
+ * conditions. This minor duplication of the SKIP term creation
  * simplifies the logic and avoids the creation of expensive Python
  * objects with "constant" values which the caller did not pass in the
  * first place. It results in maximum sharing of match handling code
- * paths.
+ * paths. The condition list is allocated once per instance.
  */
 static int set_skip_condition(struct srd_decoder_inst *di, uint64_t count)
 {
+	struct srd_condition_list *conds;
 	struct srd_term *term;
-	GSList *term_list;
 
-	condition_list_free(di);
-	term = g_malloc0(sizeof(*term));
-	term->type = SRD_TERM_SKIP;
+	if (!(conds = di->skip_condition)) {
+		conds = g_malloc0(sizeof(*conds));
+		conds->num_conditions = 1;
+		conds->cond_start = g_malloc(2 * sizeof(*conds->cond_start));
+		conds->cond_start[0] = 0;
+		conds->cond_start[1] = 1;
+		conds->terms = g_malloc0(sizeof(*conds->terms));
+		conds->terms[0].type = SRD_TERM_SKIP;
+		di->skip_condition = conds;
+	}
+
+	term = &conds->terms[0];
 	term->num_samples_to_skip = count;
 	term->num_samples_already_skipped = 0;
-	term_list = g_slist_append(NULL, term);
-	di->condition_list = g_slist_append(di->condition_list, term_list);
+	di->condition_list = conds;
 
 	return SRD_OK;
 }
 
-static PyObject *Decoder_wait(PyObject *self, PyObject *args)
+/**
+ * Arrange for the next wait to return the next available sample.
+ *
+ * Make sure to skip one sample when "anywhere within the stream", yet
+ * make sure to not skip sample number 0.
+ *
+ * @param di Decoder instance.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ */
+static int set_next_sample_condition(struct srd_decoder_inst *di)
 {
-	int ret;
 	uint64_t skip_count;
-	unsigned int i;
-	gboolean found_match;
-	struct srd_decoder_inst *di;
-	PyObject *py_pinvalues, *py_matched;
-	PyGILState_STATE gstate;
 
-	if (!self || !args)
-		return NULL;
+	if (di->abs_cur_samplenum != di->abs_first_samplenum)
+		skip_count = 1;
+	else if (!di->condition_list)
+		skip_count = 0;
+	else
+		skip_count = 1;
 
-	gstate = PyGILState_Ensure();
+	return set_skip_condition(di, skip_count);
+}
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
-		PyErr_SetString(PyExc_Exception, "decoder instance not found");
-		PyGILState_Release(gstate);
-		Py_RETURN_NONE;
-	}
+/*
+ * Run the PD's flush() method, if it implements one. It gets called when
+ * all samples of a chunk were handled, such that output which the PD
+ * accumulates doesn't depend on more input (or the end of the input).
+ */
+static void call_flush(struct srd_decoder_inst *di)
+{
+	PyObject *py_res;
 
-	ret = set_new_condition_list(self, args);
-	if (ret < 0) {
-		srd_dbg("%s: %s: Aborting wait().", di->inst_id, __func__);
-		goto err;
-	}
-	if (ret == 9999) {
-		/*
-		 * Empty condition list, automatic match. Arrange for the
-		 * execution of regular match handling code paths such that
-		 * the next available sample is returned to the caller.
-		 * Make sure to skip one sample when "anywhere within the
-		 * stream", yet make sure to not skip sample number 0.
-		 */
-		if (di->abs_cur_samplenum)
-			skip_count = 1;
-		else if (!di->condition_list)
-			skip_count = 0;
-		else
-			skip_count = 1;
-		ret = set_skip_condition(di, skip_count);
-		if (ret < 0) {
-			srd_dbg("%s: %s: Cannot setup condition-less wait().",
-				di->inst_id, __func__);
-			goto err;
-		}
-	}
+	if (!PyObject_HasAttrString(di->py_inst, "flush"))
+		return;
+
+	if (!(py_res = PyObject_CallMethod(di->py_inst, "flush", NULL)))
+		srd_exception_catch("Calling %s flush() failed", di->inst_id);
+	Py_XDECREF(py_res);
+}
+
+/**
+ * Block until the instance's current conditions match.
+ *
+ * Must be called with the GIL held, which is released while waiting.
+ *
+ * @param di Decoder instance.
+ *
+ * @retval SRD_OK A match was found, di->abs_cur_samplenum is the matching
+ *                sample. The caller must unlock di->data_mutex.
+ * @retval SRD_ERR Termination of wait() and decode() was requested, or
+ *                 the end of the input was reached (EOFError is set).
+ */
+static int wait_for_match(struct srd_decoder_inst *di)
+{
+	gboolean found_match, eof;
 
 	while (1) {
 
@@ -779,33 +1443,38 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 		 * while the termination request still gets signalled.
 		 */
 		found_match = FALSE;
-		ret = process_samples_until_condition_match(di, &found_match);
+		eof = di->communicate_eof && !di->want_wait_terminate;
+		if (!eof)
+			process_samples_until_condition_match(di, &found_match);
 
 		Py_END_ALLOW_THREADS
 
-		/* If there's a match, set self.samplenum etc. and return. */
-		if (found_match) {
-			/* Set self.samplenum to the (absolute) sample number that matched. */
-			PyObject_SetAttrString(di->py_inst, "samplenum",
-				PyLong_FromLong(di->abs_cur_samplenum));
-
-			if (di->match_array && di->match_array->len > 0) {
-				py_matched = PyTuple_New(di->match_array->len);
-				for (i = 0; i < di->match_array->len; i++)
-					PyTuple_SetItem(py_matched, i, PyBool_FromLong(di->match_array->data[i]));
-				PyObject_SetAttrString(di->py_inst, "matched", py_matched);
-				match_array_free(di);
-			} else {
-				PyObject_SetAttrString(di->py_inst, "matched", Py_None);
-			}
-	
-			py_pinvalues = get_current_pinvalues(di);
+		if (found_match)
+			return SRD_OK;
 
+		/*
+		 * All samples were handled, and no more will follow. Have
+		 * wait() raise EOFError, such that decode() can submit its
+		 * pending output. The main thread gets signalled when
+		 * decode() returned, see di_thread().
+		 */
+		if (eof) {
 			g_mutex_unlock(&di->data_mutex);
+			PyErr_SetNone(PyExc_EOFError);
+			return SRD_ERR;
+		}
 
-			PyGILState_Release(gstate);
-
-			return py_pinvalues;
+		/*
+		 * Have the PD submit the output it holds back, and the upper
+		 * PDs handle their queued input before the chunk is reported
+		 * as done. Don't hold the mutex while running their Python
+		 * code.
+		 */
+		if (!di->want_wait_terminate) {
+			g_mutex_unlock(&di->data_mutex);
+			call_flush(di);
+			srd_inst_flush_python_queues(di);
+			g_mutex_lock(&di->data_mutex);
 		}
 
 		/* No match, reset state for the next chunk. */
@@ -815,6 +1484,7 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 		di->abs_end_samplenum = 0;
 		di->inbuf = NULL;
 		di->inbuflen = 0;
+		di->inbuf_samplenums = NULL;
 
 		/* Signal the main thread that we handled all samples. */
 		g_cond_signal(&di->handled_all_samples_cond);
@@ -827,16 +1497,368 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 			srd_dbg("%s: %s: Will return from wait().",
 				di->inst_id, __func__);
 			g_mutex_unlock(&di->data_mutex);
+			return SRD_ERR;
+		}
+
+		g_mutex_unlock(&di->data_mutex);
+	}
+}
+
+static PyObject *Decoder_wait(PyObject *self, PyObject *args)
+{
+	int ret;
+	unsigned int i;
+	struct srd_decoder_inst *di;
+	PyObject *py_pinvalues, *py_matched;
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		PyGILState_Release(gstate);
+		Py_RETURN_NONE;
+	}
+
+	ret = set_new_condition_list(self, args);
+	if (ret < 0) {
+		srd_dbg("%s: %s: Aborting wait().", di->inst_id, __func__);
+		goto err;
+	}
+	if (ret == 9999) {
+		/*
+		 * Empty condition list, automatic match. Arrange for the
+		 * execution of regular match handling code paths such that
+		 * the next available sample is returned to the caller.
+		 */
+		ret = set_next_sample_condition(di);
+		if (ret < 0) {
+			srd_dbg("%s: %s: Cannot setup condition-less wait().",
+				di->inst_id, __func__);
 			goto err;
 		}
+	}
+
+	if (wait_for_match(di) != SRD_OK)
+		goto err;
+	di->stats.waits++;
+
+	/* Set self.samplenum to the (absolute) sample number that matched. */
+	PyObject_SetAttrString(di->py_inst, "samplenum",
+		PyLong_FromLong(di->abs_cur_samplenum));
+
+	if (di->match_array && di->match_array->len > 0) {
+		py_matched = PyTuple_New(di->match_array->len);
+		for (i = 0; i < di->match_array->len; i++)
+			PyTuple_SetItem(py_matched, i, PyBool_FromLong(di->match_array->data[i]));
+		PyObject_SetAttrString(di->py_inst, "matched", py_matched);
+		match_array_free(di);
+	} else {
+		PyObject_SetAttrString(di->py_inst, "matched", Py_None);
+	}
+
+	py_pinvalues = get_current_pinvalues(di);
+
+	g_mutex_unlock(&di->data_mutex);
+
+	PyGILState_Release(gstate);
+
+	return py_pinvalues;
+
+err:
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
+/**
+ * Return the upcoming samples as runs of unchanged pin values.
+ *
+ * Starting at the sample which a condition-less wait() would return,
+ * this covers up to 'max_samples' samples, yet never extends beyond the
+ * currently available chunk of input data. The result is a list of
+ * (samplenum, pinvalues, run_length) tuples, self.samplenum is set to
+ * the last sample which was covered. Edge conditions of subsequent
+ * wait() calls are relative to that sample's pin values.
+ *
+ * @param self The decoder object. Must not be NULL.
+ * @param args The maximum number of samples to cover. Must not be NULL.
+ *
+ * @return The list of runs, or NULL upon errors and termination requests.
+ */
+static PyObject *Decoder_wait_runs(PyObject *self, PyObject *args)
+{
+	unsigned long long max_samples;
+	uint64_t remaining, samplenum, count;
+	struct srd_decoder_inst *di;
+	PyObject *py_runs, *py_run, *py_pinvalues, *py_samplenum;
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto err;
+	}
+
+	if (!PyArg_ParseTuple(args, "K", &max_samples))
+		goto err;
+	if (!max_samples) {
+		PyErr_SetString(PyExc_ValueError, "wait_runs() needs at least "
+			"one sample");
+		goto err;
+	}
+
+	if (di->want_wait_terminate) {
+		srd_dbg("%s: %s: Skip (want_term).", di->inst_id, __func__);
+		goto err;
+	}
+
+	if (set_next_sample_condition(di) < 0) {
+		srd_dbg("%s: %s: Cannot setup wait_runs().",
+			di->inst_id, __func__);
+		goto err;
+	}
+
+	if (wait_for_match(di) != SRD_OK)
+		goto err;
+	di->stats.waits++;
+	match_array_free(di);
+
+	py_runs = PyList_New(0);
+	remaining = max_samples;
+	while (py_runs) {
+		samplenum = di->abs_cur_samplenum;
+		count = srd_inst_run_length(di, remaining);
+		py_pinvalues = get_current_pinvalues(di);
+		py_run = Py_BuildValue("(KNK)", (unsigned long long)samplenum,
+			py_pinvalues, (unsigned long long)count);
+		if (!py_run || PyList_Append(py_runs, py_run) < 0)
+			Py_CLEAR(py_runs);
+		Py_XDECREF(py_run);
+
+		remaining -= count;
+		samplenum += count;
+		if (!remaining || samplenum >= di->abs_end_samplenum) {
+			srd_inst_seek(di, samplenum - 1);
+			break;
+		}
+		srd_inst_seek(di, samplenum);
+	}
+
+	py_samplenum = PyLong_FromUnsignedLongLong(di->abs_cur_samplenum);
+	PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
+	Py_XDECREF(py_samplenum);
+	PyObject_SetAttrString(di->py_inst, "matched", Py_None);
+
+	g_mutex_unlock(&di->data_mutex);
+
+	PyGILState_Release(gstate);
+
+	return py_runs;
+
+err:
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
+/**
+ * Create a copy of a condition list with an additional SKIP condition.
+ *
+ * @param base The condition list to copy. Must not be NULL.
+ *
+ * @return The new condition list. The SKIP condition is the last one.
+ */
+static struct srd_condition_list *append_skip_condition(
+		const struct srd_condition_list *base)
+{
+	struct srd_condition_list *conds;
+	unsigned int num_terms;
+
+	num_terms = base->cond_start[base->num_conditions];
+
+	conds = g_malloc0(sizeof(*conds));
+	conds->num_conditions = base->num_conditions + 1;
+	conds->cond_start = g_malloc((conds->num_conditions + 1) *
+		sizeof(*conds->cond_start));
+	memcpy(conds->cond_start, base->cond_start,
+		(base->num_conditions + 1) * sizeof(*conds->cond_start));
+	conds->cond_start[conds->num_conditions] = num_terms + 1;
+	conds->terms = g_malloc0((num_terms + 1) * sizeof(*conds->terms));
+	memcpy(conds->terms, base->terms, num_terms * sizeof(*conds->terms));
+	conds->terms[num_terms].type = SRD_TERM_SKIP;
+
+	return conds;
+}
+
+/**
+ * Get the pin values at several sample numbers in one call.
+ *
+ * The first argument is a sequence of absolute sample numbers (in
+ * ascending order, not before self.samplenum, ValueError is raised
+ * before any samples are consumed otherwise). The optional second
+ * argument holds abort conditions in the same format as for wait().
+ *
+ * Returns a list with the pin values (as returned by wait()) at each of
+ * the sample numbers, and sets self.samplenum to the last of them. When
+ * an abort condition matches before all of the sample numbers have been
+ * reached (or at one of them), the list ends with the last sample number
+ * before the abort, self.samplenum is set to the matching sample and
+ * self.matched tells which abort conditions matched. Otherwise
+ * self.matched is None.
+ *
+ * @param self The decoder object. Must not be NULL.
+ * @param args The sample numbers and abort conditions. Must not be NULL.
+ *
+ * @return The list of pin values, or NULL upon errors and termination
+ *         requests.
+ */
+static PyObject *Decoder_wait_points(PyObject *self, PyObject *args)
+{
+	int ret;
+	unsigned int i, num_abort;
+	unsigned long long point;
+	uint64_t *points;
+	Py_ssize_t idx, num_points;
+	gboolean aborted;
+	struct srd_decoder_inst *di;
+	struct srd_condition_list *abort_list;
+	struct srd_term *skip_term;
+	PyObject *py_points, *py_abort, *py_args, *py_item, *py_pinvalues;
+	PyObject *py_result, *py_matched, *py_samplenum;
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto err;
+	}
+
+	py_abort = Py_None;
+	if (!PyArg_ParseTuple(args, "O|O", &py_points, &py_abort))
+		goto err;
+	if ((num_points = PySequence_Size(py_points)) < 0)
+		goto err;
+
+	/*
+	 * Check all sample numbers before any samples get consumed, such
+	 * that invalid ones don't leave the instance at some position
+	 * which self.samplenum doesn't reflect.
+	 */
+	points = g_malloc(MAX(num_points, 1) * sizeof(*points));
+	for (idx = 0; idx < num_points; idx++) {
+		if (!(py_item = PySequence_GetItem(py_points, idx)))
+			goto err_points;
+		point = PyLong_AsUnsignedLongLong(py_item);
+		Py_DecRef(py_item);
+		if (PyErr_Occurred())
+			goto err_points;
+		if (point < di->abs_cur_samplenum) {
+			PyErr_Format(PyExc_ValueError, "sample number %llu "
+				"is before the current sample", point);
+			goto err_points;
+		}
+		if (idx && point < points[idx - 1]) {
+			PyErr_Format(PyExc_ValueError, "sample number %llu "
+				"is before the previous one", point);
+			goto err_points;
+		}
+		points[idx] = point;
+	}
+
+	/* Compile the abort conditions, just like wait() does. */
+	if (!(py_args = PyTuple_Pack(1, py_abort)))
+		goto err_points;
+	ret = set_new_condition_list(self, py_args);
+	Py_DecRef(py_args);
+	if (ret < 0) {
+		srd_dbg("%s: %s: Aborting wait_points().", di->inst_id, __func__);
+		goto err_points;
+	}
+
+	abort_list = NULL;
+	num_abort = 0;
+	skip_term = NULL;
+	if (ret != 9999) {
+		abort_list = append_skip_condition(di->condition_list);
+		num_abort = abort_list->num_conditions - 1;
+		skip_term = &abort_list->terms[abort_list->cond_start[num_abort]];
+		srd_condition_list_free(di->points_condition);
+		di->points_condition = abort_list;
+	}
+
+	if (!(py_result = PyList_New(0)))
+		goto err_points;
+
+	aborted = FALSE;
+	for (idx = 0; idx < num_points && !aborted; idx++) {
+		if (abort_list) {
+			skip_term->num_samples_to_skip = points[idx] - di->abs_cur_samplenum;
+			skip_term->num_samples_already_skipped = 0;
+			di->condition_list = abort_list;
+		} else {
+			set_skip_condition(di, points[idx] - di->abs_cur_samplenum);
+		}
+
+		if (wait_for_match(di) != SRD_OK)
+			goto err_result;
+
+		/* Abort conditions take precedence over the sample point. */
+		if (abort_list && di->match_array) {
+			for (i = 0; i < num_abort; i++) {
+				if (di->match_array->data[i])
+					aborted = TRUE;
+			}
+		}
+
+		ret = 0;
+		if (aborted) {
+			py_matched = PyTuple_New(num_abort);
+			for (i = 0; i < num_abort; i++)
+				PyTuple_SetItem(py_matched, i, PyBool_FromLong(di->match_array->data[i]));
+			PyObject_SetAttrString(di->py_inst, "matched", py_matched);
+			Py_XDECREF(py_matched);
+		} else {
+			py_pinvalues = get_current_pinvalues(di);
+			ret = PyList_Append(py_result, py_pinvalues);
+			Py_XDECREF(py_pinvalues);
+		}
+		match_array_free(di);
 
 		g_mutex_unlock(&di->data_mutex);
+
+		if (ret < 0)
+			goto err_result;
 	}
+	g_free(points);
+
+	di->stats.waits++;
+
+	py_samplenum = PyLong_FromUnsignedLongLong(di->abs_cur_samplenum);
+	PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
+	Py_XDECREF(py_samplenum);
+	if (!aborted)
+		PyObject_SetAttrString(di->py_inst, "matched", Py_None);
 
 	PyGILState_Release(gstate);
 
-	Py_RETURN_NONE;
+	return py_result;
 
+err_result:
+	Py_DecRef(py_result);
+err_points:
+	g_free(points);
 err:
 	PyGILState_Release(gstate);
 
@@ -865,7 +1887,7 @@ static PyObject *Decoder_has_channel(PyObject *self, PyObject *args)
 
 	gstate = PyGILState_Ensure();
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -904,10 +1926,16 @@ err:
 static PyMethodDef Decoder_methods[] = {
 	{"put", Decoder_put, METH_VARARGS,
 	 "Accepts a dictionary with the following keys: startsample, endsample, data"},
+	{"put_many", Decoder_put_many, METH_VARARGS,
+	 "Accepts a sequence of (startsample, endsample, output_id, data) tuples"},
 	{"register", (PyCFunction)Decoder_register, METH_VARARGS|METH_KEYWORDS,
 			"Register a new output stream"},
 	{"wait", Decoder_wait, METH_VARARGS,
 			"Wait for one or more conditions to occur"},
+	{"wait_runs", Decoder_wait_runs, METH_VARARGS,
+			"Get the next samples as (samplenum, pins, length) runs"},
+	{"wait_points", Decoder_wait_points, METH_VARARGS,
+			"Get the pin values at several sample numbers"},
 	{"has_channel", Decoder_has_channel, METH_VARARGS,
 			"Report whether a channel was supplied"},
 	{NULL, NULL, 0, NULL}